@@ -0,0 +1,197 @@
+"""
+adaptive_sampler.py : adaptive phase diagram of the collect/drive thresholds. Instead of the full grid of run_phase.sh,
+            a coarse grid is run first, then every round refines only where it matters:
+            - between two neighbouring cells which disagree (one mostly pens the herd, the other mostly does not),
+              the cells of the next finer spacing are added and both cells get more repetitions;
+            - cells with a high variance of the final tick get more repetitions.
+            The runs are the jobs of sweep_runner in the same folders as run_phase.sh, so the runs already done are
+            reused. The map on the finest grid, every cell taken from the nearest sampled cell, is written as
+            map_data_Nh_<N_shepherd>_Ns_<N_sheep>_adaptive.json in the format of generate_map_data.py, read by
+            parse_matrix_json_file.py.
+
+    python adaptive_sampler.py --base_output /mnt/DATA/yating/results_phase_diagram --steps 30 10 5 --workers 16
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from result_cache import Result_Cache
+from results_catalog import get_last_ticks
+from sweep_runner import phase_job, run_sweep
+
+COLL_RANGE = (30, 120)  # degree, range of run_phase.sh
+DRIVE_RANGE = (0, 90)
+
+
+def get_grid(angle_range, step):
+    return list(range(angle_range[0], angle_range[1] + 1, step))
+
+
+def get_success_fraction(ticks, iterations):
+    """Fraction of the runs of a cell which penned the herd before the end of the simulation time"""
+    ticks = ticks[~np.isnan(ticks)]
+    return float(np.mean(ticks < iterations - 1)) if ticks.size else np.nan
+
+
+def get_variation(ticks):
+    """Coefficient of variation of the final ticks of a cell"""
+    ticks = ticks[~np.isnan(ticks)]
+    if ticks.size < 2 or np.mean(ticks) == 0:
+        return 0.0
+    return float(np.std(ticks) / np.mean(ticks))
+
+
+def find_disagreements(cell_ticks, step, iterations):
+    """Pairs of sampled cells at distance step along one axis, one mostly penning the herd and the other not"""
+    pairs = []
+    for (coll_angle, drive_angle), ticks in cell_ticks.items():
+        for neighbor in ((coll_angle + step, drive_angle), (coll_angle, drive_angle + step)):
+            if neighbor in cell_ticks:
+                fractions = (get_success_fraction(ticks, iterations),
+                             get_success_fraction(cell_ticks[neighbor], iterations))
+                if not np.isnan(fractions).any() and (fractions[0] >= 0.5) != (fractions[1] >= 0.5):
+                    pairs.append(((coll_angle, drive_angle), neighbor))
+    return pairs
+
+
+def refine(cells, cell_ticks, step, finer_step, iterations, repetitions, max_repetitions, variation_threshold):
+    """
+    Cells and repetitions of the next round
+
+    :param cells: repetitions of every sampled cell, updated in place
+    :param step: spacing of the cells of this round
+    :param finer_step: spacing of the cells added between the disagreeing cells, no cells are added if None
+    :param repetitions: repetitions of an added cell
+    :return: True if anything was added
+    """
+    is_refined = False
+
+    def add_repetitions(cell):
+        nonlocal is_refined
+        n_repetitions = min(2 * cells[cell], max_repetitions)
+        if n_repetitions > cells[cell]:
+            cells[cell] = n_repetitions
+            is_refined = True
+
+    for cell_a, cell_b in find_disagreements(cell_ticks, step, iterations):
+        add_repetitions(cell_a)
+        add_repetitions(cell_b)
+        if finer_step is not None:
+            axis = 0 if cell_a[0] != cell_b[0] else 1
+            for angle in range(cell_a[axis] + finer_step, cell_b[axis], finer_step):
+                cell = (angle, cell_a[1]) if axis == 0 else (cell_a[0], angle)
+                if cell not in cells:
+                    cells[cell] = repetitions
+                    is_refined = True
+    for cell, ticks in cell_ticks.items():
+        if get_variation(ticks) > variation_threshold:
+            add_repetitions(cell)
+    return is_refined
+
+
+def get_cell_jobs(base_output, n_shepherd, n_sheep, iterations, cells):
+    return [phase_job(base_output, n_shepherd, n_sheep, iterations, coll_angle, drive_angle, repetition)
+            for (coll_angle, drive_angle), repetitions in sorted(cells.items())
+            for repetition in range(1, repetitions + 1)]
+
+
+def read_cell_ticks(base_output, n_shepherd, n_sheep, iterations, cells, workers=None):
+    """Last ticks of the runs of every cell, nan for the runs without data"""
+    jobs = get_cell_jobs(base_output, n_shepherd, n_sheep, iterations, cells)
+    last_ticks = get_last_ticks([output_folder for _, _, output_folder in jobs], workers)
+    cell_ticks = {}
+    start = 0
+    for cell, repetitions in sorted(cells.items()):
+        cell_ticks[cell] = last_ticks[start:start + repetitions]
+        start += repetitions
+    return cell_ticks
+
+
+def get_map(cell_ticks, coll_angles, drive_angles):
+    """Mean last tick of every cell of the grid, taken from the nearest sampled cell with data"""
+    cell_ticks = {cell: ticks[~np.isnan(ticks)] for cell, ticks in cell_ticks.items()}
+    cell_ticks = {cell: ticks for cell, ticks in cell_ticks.items() if ticks.size}
+    sampled_cells = np.array(list(cell_ticks), dtype=np.float64)
+    means = np.array([float(np.mean(ticks)) for ticks in cell_ticks.values()])
+    map = []
+    for coll_angle in coll_angles:
+        distances = np.hypot(sampled_cells[:, 0] - coll_angle, sampled_cells[:, 1] - np.array(drive_angles)[:, None])
+        map.append(means[np.argmin(distances, axis=1)].tolist())
+    return map
+
+
+def write_map_json(json_file_name, map, coll_angles, drive_angles, n_sheep):
+    """Map in the format of generate_map_data.generate_map_json_data: rows of coll, then the angles"""
+    with open(json_file_name, "w") as f:
+        for map_data in map:
+            json.dump(map_data, f)
+            f.write("\n")
+        json.dump("Raw:", f)
+        json.dump(drive_angles, f)
+        f.write("\n")
+        json.dump("Line:", f)
+        json.dump(coll_angles, f)
+        f.write("\n")
+        json.dump("N_sheep=" + str(n_sheep), f)
+        f.write("\n")
+
+
+def run_adaptive_phase(base_output, n_shepherd, n_sheep, iterations, steps, repetitions, max_repetitions,
+                       variation_threshold, workers, extra_arguments=(), seed=None, cache=None):
+    """
+    Running the rounds of the adaptive phase diagram until nothing is refined anymore
+
+    :param steps: spacing of the cells in degree, of the coarse grid first and then of every refinement
+    :param repetitions: repetitions of a newly sampled cell
+    :param max_repetitions: most repetitions of a cell
+    :param variation_threshold: coefficient of variation of the final ticks above which a cell gets more repetitions
+    :param extra_arguments: arguments added to every job, e.g. ["--stall_window", 5000]
+    :return: last ticks of every sampled cell
+    """
+    cells = {cell: repetitions for cell in
+             ((coll_angle, drive_angle) for coll_angle in get_grid(COLL_RANGE, steps[0])
+              for drive_angle in get_grid(DRIVE_RANGE, steps[0]))}
+    step_index = 0
+    while True:
+        jobs = [(script, arguments + list(extra_arguments), output_folder) for script, arguments, output_folder in
+                get_cell_jobs(base_output, n_shepherd, n_sheep, iterations, cells)]
+        print(f"Round with step {steps[step_index]}: {len(cells)} cells, {len(jobs)} runs", flush=True)
+        run_sweep(jobs, workers, seed=seed, cache=cache)
+        cell_ticks = read_cell_ticks(base_output, n_shepherd, n_sheep, iterations, cells, workers)
+        finer_step = steps[step_index + 1] if step_index + 1 < len(steps) else None
+        if not refine(cells, cell_ticks, steps[step_index], finer_step, iterations, repetitions, max_repetitions,
+                      variation_threshold):
+            return cell_ticks
+        step_index = min(step_index + 1, len(steps) - 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base_output", default="results")
+    parser.add_argument("--n_shepherd", type=int, default=1)
+    parser.add_argument("--n_sheep", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--steps", type=int, nargs="+", default=[30, 10])  # degree, coarse grid first
+    parser.add_argument("--repetitions", type=int, default=3)  # of a newly sampled cell
+    parser.add_argument("--max_repetitions", type=int, default=12)
+    parser.add_argument("--variation_threshold", type=float, default=0.5)  # std / mean of the final ticks of a cell
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=None)  # seed of the sweep, keys the runs for the cache
+    parser.add_argument("--cache_folder", default="run_cache")  # result cache of the seeded runs
+    parser.add_argument("--stall_window", type=int, default=0)  # stopping runs without progress, see stall_detector
+    args = parser.parse_args()
+
+    cache = Result_Cache(args.cache_folder) if args.seed is not None else None
+    extra_arguments = ["--stall_window", args.stall_window] if args.stall_window else []
+    cell_ticks = run_adaptive_phase(args.base_output, args.n_shepherd, args.n_sheep, args.iterations, args.steps,
+                                    args.repetitions, args.max_repetitions, args.variation_threshold, args.workers,
+                                    extra_arguments, args.seed, cache)
+    coll_angles = get_grid(COLL_RANGE, args.steps[-1])
+    drive_angles = get_grid(DRIVE_RANGE, args.steps[-1])
+    json_file_name = os.path.join(args.base_output, "map_data_" + "Nh_" + str(args.n_shepherd) + "_Ns_" +
+                                  str(args.n_sheep) + "_adaptive.json")
+    write_map_json(json_file_name, get_map(cell_ticks, coll_angles, drive_angles), coll_angles, drive_angles,
+                   args.n_sheep)
+    print(f"{len(cell_ticks)} cells, {sum(ticks.size for ticks in cell_ticks.values())} runs -> {json_file_name}")
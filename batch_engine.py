@@ -0,0 +1,352 @@
+"""
+batch_engine.py : batched engine running R independent replicates of the shepherding simulation at once. The sheep and
+            the shepherds of all the replicates are kept in (R, N_sheep) and (R, N_shepherd) arrays, every replicate
+            has its own collect/drive thresholds, alpha and L3, and a replicate stops advancing (is masked out) as soon
+            as all its sheep are staying in the target place.
+"""
+import numpy as np
+
+import support
+from herd_engine import (reflect_from_walls, reflect_from_fence, limit_field_of_view, calculate_neighbor_forces,
+                         calculate_shepherd_forces)
+from interaction_network import build_block_network
+from sheep_agent import Sheep_Agent
+from shepherd_agent import Shepherd_Agent
+from shepherd_vision import Vision_Field
+
+
+def replicate_parameter(value, n_replicates):
+    """Parameter of every replicate as an array of shape (R,), from a scalar or a sequence of R values"""
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), (n_replicates,)).copy()
+
+
+def select_sheep(array, sheep_index):
+    """Value of array (..., N_sheep) at the sheep chosen by every shepherd, sheep_index of shape (..., N_shepherd)"""
+    if array.ndim == sheep_index.ndim:
+        return np.take_along_axis(array, sheep_index, axis=-1)
+    return np.take_along_axis(array, sheep_index[..., None], axis=-1)[..., 0]
+
+
+def reflect_shepherds_from_walls(x, y, orientation, boundaries_x, boundaries_y, radius):
+    """Vectorized Shepherd_Agent.reflect_from_walls ("bounce_back" boundary condition)"""
+    # Boundary conditions according to center of agent (simple)
+    x_center = x + radius
+    y_center = y + radius
+    orientation = support.reflect_angle_array(orientation)  # [0, 2pi]
+
+    # Reflection from left wall
+    is_reflected = x_center < boundaries_x[0]
+    x = np.where(is_reflected, boundaries_x[0] - radius, x)
+    orientation = np.where(is_reflected & (np.pi / 2 <= orientation) & (orientation < np.pi),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (np.pi <= orientation) & (orientation <= 3 * np.pi / 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from right wall
+    is_reflected = x_center > boundaries_x[1]
+    x = np.where(is_reflected, boundaries_x[1] - radius - 1, x)
+    orientation = np.where(is_reflected & (3 * np.pi / 2 <= orientation) & (orientation < 2 * np.pi),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (0 <= orientation) & (orientation <= np.pi / 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from upper wall
+    is_reflected = y_center < boundaries_y[0]
+    y = np.where(is_reflected, boundaries_y[0] - radius, y)
+    orientation = np.where(is_reflected & (np.pi <= orientation) & (orientation < np.pi * 3 / 2),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (np.pi * 3 / 2 <= orientation) & (orientation < np.pi * 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from lower wall
+    is_reflected = y_center > boundaries_y[1] + radius
+    y = np.where(is_reflected, boundaries_y[1] - radius / 2, y)
+    orientation = np.where(is_reflected & (np.pi / 2 <= orientation) & (orientation <= np.pi),
+                           orientation + np.pi / 2,
+                           np.where(is_reflected & (0 <= orientation) & (orientation < np.pi / 2),
+                                    orientation - np.pi / 2, orientation))
+
+    return x, y, support.reflect_angle_array(orientation)
+
+
+def reflect_shepherds_from_fence(x, y, orientation, target_x, target_y, target_size, window_pad, fence_width=10):
+    """Vectorized Shepherd_Agent.reflect_from_fence: the shepherds are kept outside of the target place"""
+    orientation = support.reflect_angle_array(orientation)  # [0, 2pi]
+
+    # Reflection from left fence
+    is_reflected = (x > target_x - target_size / 2 - fence_width) & (y >= target_y - window_pad)
+    x = np.where(is_reflected, target_x - target_size / 2 - fence_width - 1, x)
+    orientation = np.where(is_reflected & (3 * np.pi / 2 <= orientation) & (orientation < 2 * np.pi),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (0 <= orientation) & (orientation <= np.pi / 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from upper fence
+    is_reflected = (y > target_y - target_size / 2 - fence_width) & (x >= target_x - window_pad)
+    y = np.where(is_reflected, target_y - target_size / 2 - fence_width - 1, y)
+    orientation = np.where(is_reflected & (np.pi / 2 <= orientation) & (orientation <= np.pi),
+                           orientation + np.pi / 2,
+                           np.where(is_reflected & (0 <= orientation) & (orientation < np.pi / 2),
+                                    orientation - np.pi / 2, orientation))
+
+    return x, y, support.reflect_angle_array(orientation)
+
+
+def find_shepherd_neighbors(x, y, orientation, fov):
+    """
+    Other shepherds in the field of view of every shepherd (Shepherd_Agent.Is_fov_neighbor)
+
+    :param x, y, orientation: arrays of shape (R, N_shepherd)
+    :return d_x, d_y, distance, is_fov_neighbor: arrays of shape (R, N_shepherd, N_shepherd), from the other shepherds
+        (last axis) to the focal shepherd
+    """
+    d_x = x[..., :, None] - x[..., None, :]
+    d_y = y[..., :, None] - y[..., None, :]
+    distance = np.sqrt(d_x ** 2 + d_y ** 2)
+    relative_angle = np.arctan2(-d_y, -d_x)
+    delta_angle = np.abs(orientation[..., :, None] - relative_angle) % (2 * np.pi)
+    is_other = ~np.eye(x.shape[-1], dtype=bool)
+    return d_x, d_y, distance, is_other & (delta_angle <= fov / 2)
+
+
+def herd_sheep(state, drive_agent_id, collect_agent_id, vision_field, angle_threshold_collection,
+               angle_threshold_drive):
+    """
+    Vectorized Shepherd_Agent.herd_sheep_agents: drive/collect decisions of all the shepherds from their vision field
+
+    :param state, drive_agent_id, collect_agent_id: arrays of shape (R, N_shepherd)
+    :param angle_threshold_collection, angle_threshold_drive: thresholds of every replicate, shape (R,)
+    :return state, drive_agent_id, collect_agent_id
+    """
+    is_driving = state == 1.0
+    projection_pos = vision_field.projection_pos
+
+    # drive mode: drive the closest agent ---> maximum agent projection
+    drive_agent_id = np.where(is_driving, np.argmax(vision_field.projection_half_wid, axis=-1), drive_agent_id)
+    # the furthest agent from the target direction, only agents in the moving state
+    max_agent_index = np.argmax(np.absolute(vision_field.target_agent_angle), axis=-1)
+    max_angle_target_to_agent = select_sheep(vision_field.target_agent_angle, max_agent_index)
+    is_furthest_moving = select_sheep(vision_field.sheep_is_moving, max_agent_index)
+    # switch to collect mode if the drive agent is staying or the furthest agent is far from the group enough
+    delta_angle = np.absolute(max_angle_target_to_agent) - angle_threshold_collection[:, None]
+    is_switching_to_collect = is_driving & (~select_sheep(vision_field.sheep_is_moving, drive_agent_id) |
+                                            ((delta_angle >= 0.001) & is_furthest_moving))
+
+    # collect mode: follow the furthest agent while it stays on the same side of the center of mass projection
+    center_of_mass_projection = np.mean(projection_pos, axis=-1)
+    current_angle_difference_agent_mass = select_sheep(projection_pos, collect_agent_id) - center_of_mass_projection
+    next_angle_difference_agent_mass = select_sheep(projection_pos, max_agent_index) - center_of_mass_projection
+    collect_agent_id = np.where(~is_driving & (current_angle_difference_agent_mass *
+                                               next_angle_difference_agent_mass >= 0),
+                                max_agent_index, collect_agent_id)
+    # switch to drive mode if the collected agent is close enough to the group or staying
+    angle_difference_agent_mass = np.abs(select_sheep(projection_pos, collect_agent_id) - center_of_mass_projection)
+    is_switching_to_drive = ~is_driving & ((angle_difference_agent_mass <= angle_threshold_drive[:, None]) |
+                                           ~select_sheep(vision_field.sheep_is_moving, collect_agent_id))
+
+    # lock the ID of the furthest agent for the collect mode
+    collect_agent_id = np.where(is_switching_to_collect, max_agent_index, collect_agent_id)
+    state = np.where(is_switching_to_collect, 0.0, np.where(is_switching_to_drive, 1.0, state))
+    return state, drive_agent_id, collect_agent_id
+
+
+class Batch_Engine:
+    """
+    R replicates of the loop function without visualization. The model parameters are taken from a template sheep and
+    a template shepherd agent, so the engine follows Sheep_Agent.update and Shepherd_Agent.update with whole-array
+    operations. Within a tick all the sheep and then all the shepherds are updated synchronously.
+    """
+
+    def __init__(self, n_replicates, N_sheep=10, N_shepherd=1, width=500, height=500,
+                 target_place_x=1000, target_place_y=1000, target_size=200, window_pad=30, agent_radius=10,
+                 L3=20, uncomfortable_distance=200, is_explicit=False, is_antagonistic=False, alpha=np.pi / 6,
+                 angle_threshold_collection=np.pi / 2, angle_threshold_drive=np.pi / 6, network_type="voronoi",
+                 seed=None):
+        """
+        Initializing the replicates with the random initial positions of Loop_Function
+
+        :param n_replicates: number of replicates R
+        :param L3, alpha, angle_threshold_collection, angle_threshold_drive: scalars or sequences of R values, one per
+            replicate
+        :param seed: seed of the random stream of the batch (an int or a sequence of ints), the global np.random if None
+        The other parameters are the ones of Loop_Function, shared by all the replicates.
+        """
+        self.n_replicates = n_replicates
+        self.rng = np.random if seed is None else np.random.default_rng(seed)
+        self.n_sheep = N_sheep
+        self.n_shepherd = N_shepherd
+        self.L3 = replicate_parameter(L3, n_replicates)
+        self.alpha = replicate_parameter(alpha, n_replicates)
+        self.angle_threshold_collection = replicate_parameter(angle_threshold_collection, n_replicates)
+        self.angle_threshold_drive = replicate_parameter(angle_threshold_drive, n_replicates)
+
+        # template agents holding the model parameters
+        self.sheep = Sheep_Agent(id="sheep: 0", radius=agent_radius, position=(0, 0), orientation=0,
+                                 env_size=(width, height), color=support.GREEN, window_pad=window_pad,
+                                 target_x=target_place_x, target_y=target_place_y, target_size=target_size,
+                                 is_antagonistic=is_antagonistic, alpha=0, network_type=network_type,
+                                 with_visualization=False)
+        self.shepherd = Shepherd_Agent(id="shepherd: 0", radius=agent_radius, position=(0, 0), orientation=0,
+                                       env_size=(width, height), color=support.RED, window_pad=window_pad,
+                                       target_x=target_place_x, target_y=target_place_y, target_size=target_size,
+                                       L3=0, uncomfortable_distance=uncomfortable_distance, is_explicit=is_explicit,
+                                       angle_threshold_collection=0, angle_threshold_drive=0,
+                                       with_visualization=False)
+
+        # state of the sheep, the same initial distribution as Loop_Function.add_sheep_agents
+        shape = (n_replicates, N_sheep)
+        self.sheep_x = self.rng.uniform(200, 500, shape) + agent_radius
+        self.sheep_y = self.rng.uniform(200, 500, shape) + agent_radius
+        self.sheep_orientation = self.rng.uniform(-np.pi, np.pi, shape)
+        self.sheep_vt = np.full(shape, float(self.sheep.vt))
+        self.is_staying = np.zeros(shape, dtype=bool)
+
+        # state of the shepherds, the same initial distribution as Loop_Function.add_shepherd_agent
+        shape = (n_replicates, N_shepherd)
+        self.shepherd_x = self.rng.uniform(0, 200, shape) + agent_radius
+        self.shepherd_y = self.rng.uniform(0, 200, shape) + agent_radius
+        self.shepherd_orientation = self.rng.uniform(-np.pi, np.pi, shape)
+        self.shepherd_vt = np.full(shape, float(self.shepherd.vt))
+        self.shepherd_state = np.full(shape, self.shepherd.state)  # 1.0: drive mode, 0.0: collect mode
+        self.drive_agent_id = np.zeros(shape, dtype=np.int64)
+        self.collect_agent_id = np.zeros(shape, dtype=np.int64)
+        self.approach_agent_id = np.zeros(shape, dtype=np.int64)
+
+        # progress of every replicate
+        self.tick = np.zeros(n_replicates, dtype=np.int64)
+        self.is_done = np.zeros(n_replicates, dtype=bool)
+
+    def update_sheep(self, active):
+        """One timestep of the sheep of the active replicates, the shepherds at their position before the tick"""
+        sheep = self.sheep
+        x, y, orientation = self.sheep_x[active], self.sheep_y[active], self.sheep_orientation[active]
+
+        # update sheep state according to square target place;
+        is_staying = (x >= (sheep.target_x - sheep.target_size)) & (y >= (sheep.target_y - sheep.target_size))
+        x, y, orientation = reflect_from_walls(x, y, orientation, sheep.boundaries_x, sheep.boundaries_y)
+        x, y, orientation = reflect_from_fence(x, y, orientation, is_staying, sheep.target_x, sheep.target_y,
+                                               sheep.target_size, sheep.window_pad)
+
+        # one block of the network per replicate, the sheep of different replicates never interact
+        network = build_block_network(np.stack((x, y), axis=-1), sheep.network_type, sheep.att_distance)
+        network = limit_field_of_view(network, x.ravel(), y.ravel(), orientation.ravel(), is_staying.ravel(),
+                                      sheep.fov)
+        f_avoid_x, f_avoid_y, num_rep, f_att_x, f_att_y, _ = calculate_neighbor_forces(network, x.ravel(), y.ravel(),
+                                                                                        sheep.rep_distance)
+        f_shepherd_x, f_shepherd_y = calculate_shepherd_forces(x, y, orientation, self.shepherd_x[active],
+                                                               self.shepherd_y[active], sheep.safe_distance,
+                                                               sheep.is_antagonistic, self.alpha[active, None])
+        # repulsion between sheep overrides all the other forces
+        is_repulsed = (num_rep != 0).reshape(x.shape)
+        f_x = np.where(is_repulsed, f_avoid_x.reshape(x.shape) * sheep.K_repulsion,
+                       f_att_x.reshape(x.shape) * sheep.K_attraction + f_shepherd_x * sheep.K_shepherd)
+        f_y = np.where(is_repulsed, f_avoid_y.reshape(x.shape) * sheep.K_repulsion,
+                       f_att_y.reshape(x.shape) * sheep.K_attraction + f_shepherd_y * sheep.K_shepherd)
+
+        # velocity and heading update, the same as the last part of Sheep_Agent.update
+        vt = self.sheep_vt[active]
+        v_dot = sheep.gamma * (sheep.v0 - vt) + f_x * np.cos(orientation) + f_y * np.sin(orientation)
+        w_dot = -f_x * np.sin(orientation) + f_y * np.cos(orientation)
+        Dr = self.rng.normal(0, 1, x.shape) * np.sqrt(2 * sheep.K_Dr) / (sheep.tick_time ** 0.5)
+        vt = np.clip(v_dot * sheep.acceleration * sheep.tick_time + vt, -sheep.v_max, sheep.v_max)
+        orientation = support.transform_angle_array(orientation + (w_dot * sheep.beta + Dr) * sheep.tick_time)
+        orientation = support.transform_angle_array(np.where(vt < 0, orientation + np.pi, orientation))
+        vt = np.abs(vt)
+
+        self.sheep_x[active] = x + vt * np.cos(orientation) * sheep.tick_time
+        self.sheep_y[active] = y + vt * np.sin(orientation) * sheep.tick_time
+        self.sheep_orientation[active] = orientation
+        self.sheep_vt[active] = vt
+        self.is_staying[active] = is_staying
+
+    def update_shepherds(self, active):
+        """One timestep of the shepherds of the active replicates, looking at the sheep after their update"""
+        shepherd = self.shepherd
+        x, y, orientation = reflect_shepherds_from_walls(self.shepherd_x[active], self.shepherd_y[active],
+                                                         self.shepherd_orientation[active], shepherd.boundaries_x,
+                                                         shepherd.boundaries_y, shepherd.radius)
+        x, y, orientation = reflect_shepherds_from_fence(x, y, orientation, shepherd.target_x, shepherd.target_y,
+                                                         shepherd.target_size, shepherd.window_pad)
+        sheep_x, sheep_y = self.sheep_x[active], self.sheep_y[active]
+        vision_field = Vision_Field(x, y, orientation, shepherd.target_x, shepherd.target_y, sheep_x, sheep_y,
+                                    np.full(sheep_x.shape, float(self.sheep.radius)), ~self.is_staying[active])
+
+        # avoid the other shepherds in the field of view closer than L3 first
+        d_x, d_y, distance, is_fov_neighbor = find_shepherd_neighbors(x, y, orientation, shepherd.fov)
+        is_close = is_fov_neighbor & (distance <= self.L3[active, None, None])
+        num_rep = np.sum(is_close, axis=-1)
+        r_x = np.sum(np.where(is_close, d_x / (distance + 0.00001), 0.0), axis=-1)
+        r_y = np.sum(np.where(is_close, d_y / (distance + 0.00001), 0.0), axis=-1)
+        f_x_other_shepherd = np.divide(r_x, num_rep, out=np.zeros(x.shape), where=num_rep != 0)
+        f_y_other_shepherd = np.divide(r_y, num_rep, out=np.zeros(x.shape), where=num_rep != 0)
+
+        state, drive_agent_id, collect_agent_id = herd_sheep(self.shepherd_state[active], self.drive_agent_id[active],
+                                                             self.collect_agent_id[active], vision_field,
+                                                             self.angle_threshold_collection[active],
+                                                             self.angle_threshold_drive[active])
+
+        if shepherd.is_explicit:
+            # switch mode with a probability growing with the number of uncomfortable shepherds in the field of view
+            neighbor_num = np.sum(is_fov_neighbor & (shepherd.uncomfortable_distance > distance) &
+                                  (distance >= self.L3[active, None, None]), axis=-1)
+            mu = 0.5
+            sigma = 0.1
+            pdf_value = self.rng.normal(mu, sigma, x.shape)
+            is_switching = (neighbor_num != 0) & (np.abs(pdf_value - mu) < sigma * neighbor_num)
+            state = np.where(is_switching, np.abs(state - 1), state)
+        approach_agent_id = np.where(state == 1.0, drive_agent_id, collect_agent_id)
+
+        # the shepherd is attracted by the drive point behind the approached agent, seen from the target
+        agent_x = select_sheep(sheep_x, approach_agent_id)
+        agent_y = select_sheep(sheep_y, approach_agent_id)
+        angle_agent_target = np.arctan2(agent_y - shepherd.target_y, agent_x - shepherd.target_x)
+        f_drive_agent_x = agent_x + shepherd.l1 * np.cos(angle_agent_target) - x
+        f_drive_agent_y = agent_y + shepherd.l1 * np.sin(angle_agent_target) - y
+
+        F_x = np.where(num_rep != 0, f_x_other_shepherd * shepherd.K_other_shepherd,
+                       f_drive_agent_x * shepherd.K_drive_sheep)
+        F_y = np.where(num_rep != 0, f_y_other_shepherd * shepherd.K_other_shepherd,
+                       f_drive_agent_y * shepherd.K_drive_sheep)
+
+        # velocity and heading update, the same as the last part of Shepherd_Agent.update
+        vt = self.shepherd_vt[active]
+        v_dot = shepherd.gamma * (shepherd.v0 - vt) + F_x * np.cos(orientation) + F_y * np.sin(orientation)
+        w_dot = -F_x * np.sin(orientation) + F_y * np.cos(orientation)
+        vt = np.clip(v_dot * shepherd.alpha * shepherd.tick_time + vt, -shepherd.v_max, shepherd.v_max)
+        noise = np.sqrt(2 * shepherd.Dr) / (shepherd.tick_time ** 0.5) * self.rng.normal(0, 1, x.shape)
+        orientation = support.transform_angle_array(orientation + (w_dot * shepherd.beta + noise) * shepherd.tick_time)
+        orientation = support.transform_angle_array(np.where(vt < 0, orientation + np.pi, orientation))
+        vt = np.abs(vt)
+
+        self.shepherd_x[active] = x + vt * np.cos(orientation) * shepherd.tick_time
+        self.shepherd_y[active] = y + vt * np.sin(orientation) * shepherd.tick_time
+        self.shepherd_orientation[active] = orientation
+        self.shepherd_vt[active] = vt
+        self.shepherd_state[active] = state
+        self.drive_agent_id[active] = drive_agent_id
+        self.collect_agent_id[active] = collect_agent_id
+        self.approach_agent_id[active] = approach_agent_id
+
+    def get_active_replicates(self, Time):
+        """Indices of the replicates that are not done and did not reach Time ticks yet"""
+        return np.flatnonzero(~self.is_done & (self.tick < Time))
+
+    def step(self, active):
+        """One timestep of the active replicates"""
+        self.update_sheep(active)
+        self.update_shepherds(active)
+        self.tick[active] += 1
+        # a replicate is done when none of its sheep is moving, as in Loop_Function.start
+        self.is_done[active] = np.all(self.is_staying[active], axis=-1)
+
+    def run(self, Time):
+        """
+        Advancing the replicates until all of them are done or reached Time ticks
+
+        :return: final tick of every replicate, the "Final tick:" printed by Loop_Function.start
+        """
+        active = self.get_active_replicates(Time)
+        while active.size > 0:
+            self.step(active)
+            active = self.get_active_replicates(Time)
+        return self.tick.copy()
@@ -0,0 +1,51 @@
+"""
+benchmark_network.py : tick throughput of the sheep update with one Voronoi per sheep (before) and with one shared
+            Voronoi network per tick (after), for different herd sizes.
+
+    python benchmark_network.py --sizes 50 100 200 500 1000 --ticks 5
+"""
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+from loop_function import Loop_Function
+
+
+def run_ticks(loop_function, n_ticks, is_shared_network):
+    """Advancing the sheep and shepherd agents for n_ticks and returning the mean time per tick in seconds"""
+    start = timer()
+    for _ in range(n_ticks):
+        if is_shared_network:
+            loop_function.update_interaction_network()
+            network = loop_function.interaction_network
+        else:
+            network = None
+        loop_function.sheep_agents.update(loop_function.sheep_registry, loop_function.shepherd_registry, network)
+        loop_function.update_shepherd_agents()
+        loop_function.tick += 1
+    return (timer() - start) / n_ticks
+
+
+def benchmark(sizes, n_ticks, n_ticks_before, seed):
+    print(f"{'N_sheep':>8} {'before [tick/s]':>16} {'after [tick/s]':>16} {'speed-up':>9}")
+    for n_sheep in sizes:
+        tick_times = []
+        for is_shared_network, ticks in [(False, n_ticks_before), (True, n_ticks)]:
+            np.random.seed(seed)
+            loop_function = Loop_Function(N_sheep=n_sheep, N_shepherd=1, Time=ticks, width=1000, height=1000,
+                                          target_place_x=800, target_place_y=800, framerate=0,
+                                          with_visualization=False)
+            tick_times.append(run_ticks(loop_function, ticks, is_shared_network))
+        before, after = tick_times
+        print(f"{n_sheep:>8} {1 / before:>16.2f} {1 / after:>16.2f} {before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 500, 1000])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--ticks_before", type=int, default=3)  # the per-sheep Voronoi is slow for large herds
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.ticks, args.ticks_before, args.seed)
@@ -0,0 +1,134 @@
+"""
+benchmark_scaling.py : scaling of whole headless, seeded Loop_Function runs with the herd size, the number of shepherds,
+            the network type, antagonistic sheep and explicit coordination. Every case runs in a fresh process and
+            records the ticks per second, the peak resident memory and the mean time of every phase of the tick
+            (tick_profiler.py) into a json file. Compared with a baseline file, the cases slower than the baseline by
+            more than the tolerance are reported and the script exits with 1.
+
+    python benchmark_scaling.py --output benchmark_scaling.json
+    python benchmark_scaling.py --sizes 100 500 --n_shepherds 1 5 --output new.json --baseline benchmark_scaling.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from loop_function import Loop_Function
+from tick_profiler import Tick_Profiler
+
+CASE_KEYS = ("engine", "N_sheep", "N_shepherd", "network_type", "is_antagonistic", "is_explicit")
+
+
+def run_case(case, n_ticks, n_warmup_ticks, seed):
+    """
+    Ticks per second, peak memory and phase times of one case, in the process running it
+
+    :param case: value of every key of CASE_KEYS
+    :param n_warmup_ticks: first ticks left out of the timing (numba compilation, caches)
+    """
+    # the final tick and the report of the run are not part of the benchmark output
+    with tempfile.TemporaryDirectory() as output_folder, contextlib.redirect_stdout(io.StringIO()):
+        loop_function = Loop_Function(N_sheep=case["N_sheep"], N_shepherd=case["N_shepherd"],
+                                      Time=n_warmup_ticks + n_ticks, width=1000, height=1000,
+                                      target_place_x=800, target_place_y=800, framerate=0, with_visualization=False,
+                                      L3=100, uncomfortable_distance=500, is_explicit=case["is_explicit"],
+                                      is_antagonistic=case["is_antagonistic"], network_type=case["network_type"],
+                                      engine=case["engine"], seed=seed, output_folder=output_folder)
+        loop_function.profiler = Tick_Profiler(report_interval=None)
+        loop_function.start()
+    phase_times = {phase: np.array(times[n_warmup_ticks:])
+                   for phase, times in loop_function.profiler.phase_times.items()}
+    tick_times = phase_times.pop("tick")
+    return {**case,
+            "ticks": int(tick_times.size),
+            "ticks_per_second": float(tick_times.size / np.sum(tick_times)) if tick_times.size else None,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "phases": {phase: float(np.mean(times)) * 1000 for phase, times in phase_times.items()}}
+
+
+def get_cases(args):
+    cases = itertools.product(args.engines, args.sizes, args.n_shepherds, args.network_types, args.antagonistic,
+                              args.explicit)
+    return [dict(zip(CASE_KEYS, case)) for case in cases]
+
+
+def get_case_key(case):
+    return tuple(case[key] for key in CASE_KEYS)
+
+
+def compare(results, baseline_results, tolerance):
+    """
+    Printing the ticks per second of the cases against the baseline
+
+    :return: cases slower than the baseline by more than tolerance (a fraction)
+    """
+    baseline = {get_case_key(result): result for result in baseline_results}
+    slower_cases = []
+    print(f"{'case':<48} {'baseline [tick/s]':>18} {'now [tick/s]':>13} {'ratio':>7}")
+    for result in results:
+        baseline_result = baseline.get(get_case_key(result))
+        if baseline_result is None or not baseline_result["ticks_per_second"] or not result["ticks_per_second"]:
+            continue
+        ratio = result["ticks_per_second"] / baseline_result["ticks_per_second"]
+        is_slower = ratio < 1 - tolerance
+        if is_slower:
+            slower_cases.append(result)
+        print(f"{' '.join(map(str, get_case_key(result))):<48} {baseline_result['ticks_per_second']:>18.2f} "
+              f"{result['ticks_per_second']:>13.2f} {ratio:>6.2f}x" + (" SLOWER" if is_slower else ""))
+    return slower_cases
+
+
+def benchmark(cases, n_ticks, n_warmup_ticks, seed):
+    print(f"{'case':<48} {'ticks':>6} {'tick/s':>9} {'peak RSS [MB]':>14}  slowest phase")
+    results = []
+    # a fresh process per case, so that the peak memory is the one of the case
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for case in cases:
+            result = executor.submit(run_case, case, n_ticks, n_warmup_ticks, seed).result()
+            slowest_phase = max(result["phases"].items(), key=lambda item: item[1], default=("", 0.0))
+            ticks_per_second = result["ticks_per_second"] or 0.0
+            print(f"{' '.join(map(str, get_case_key(case))):<48} {result['ticks']:>6} {ticks_per_second:>9.2f} "
+                  f"{result['peak_rss_mb']:>14.1f}  {slowest_phase[0]} {slowest_phase[1]:.3f} ms", flush=True)
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 500, 1000])
+    parser.add_argument("--n_shepherds", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--network_types", nargs="+", default=["voronoi", "metric"])
+    parser.add_argument("--antagonistic", type=int, nargs="+", default=[0, 1])  # 0: off, 1: on
+    parser.add_argument("--explicit", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--engines", nargs="+", default=["sprite"])
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--warmup_ticks", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_scaling.json")
+    parser.add_argument("--baseline", default=None)  # output of an earlier run to compare with
+    parser.add_argument("--tolerance", type=float, default=0.1)  # slowdown accepted against the baseline
+    args = parser.parse_args()
+    args.antagonistic = [bool(value) for value in args.antagonistic]
+    args.explicit = [bool(value) for value in args.explicit]
+
+    results = benchmark(get_cases(args), args.ticks, args.warmup_ticks, args.seed)
+    with open(args.output, "w") as f:
+        json.dump({"machine": {"platform": platform.platform(), "python": platform.python_version(),
+                               "numpy": np.__version__, "cpu_count": os.cpu_count()},
+                   "ticks": args.ticks, "warmup_ticks": args.warmup_ticks, "seed": args.seed,
+                   "results": results}, f, indent=1)
+    print(f"{len(results)} cases -> {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            slower_cases = compare(results, json.load(f)["results"], args.tolerance)
+        sys.exit(1 if slower_cases else 0)
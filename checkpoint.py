@@ -0,0 +1,54 @@
+"""
+checkpoint.py : checkpoint file of a running simulation. Loop_Function writes the complete state of a headless run
+            (tick, agents, herd engine, counters, random states and the sizes of the saved data files) every
+            checkpoint_interval ticks to <output folder>/checkpoint.pkl, and resume_from_checkpoint continues the run
+            from it bit for bit. The file is a pickle, replaced at once so that a killed run always leaves a complete
+            checkpoint, and removed when the run finishes. Runs with other shepherd parameters can also be forked from
+            a checkpoint (main_ensemble.py).
+"""
+import os
+import pickle
+import shutil
+
+CHECKPOINT_FILE = "checkpoint.pkl"
+CHECKPOINT_VERSION = 2  # increased when the saved state changes
+
+
+def write_checkpoint(file_path, state):
+    with open(file_path + ".tmp", "wb") as f:
+        pickle.dump({"version": CHECKPOINT_VERSION, **state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file_path + ".tmp", file_path)
+
+
+def read_checkpoint(file_path):
+    """State saved in a checkpoint file, None if there is no checkpoint"""
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, "rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint {file_path} was written by another version of the simulation")
+    return state
+
+
+def remove_checkpoint(file_path):
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+
+
+def truncate_files(folder_path, file_sizes):
+    """Cutting the saved data files back to their sizes at the checkpoint, dropping the ticks written after it"""
+    for file_name, size in file_sizes.items():
+        file_path = os.path.join(folder_path, file_name)
+        if os.path.isfile(file_path) and os.path.getsize(file_path) > size:
+            os.truncate(file_path, size)
+
+
+def copy_files(source_folder, target_folder, file_sizes):
+    """Copying the saved data files of a checkpointed run up to their sizes at the checkpoint, for a forked run"""
+    for file_name, size in file_sizes.items():
+        target_path = os.path.join(target_folder, file_name)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(os.path.join(source_folder, file_name), "rb") as source, open(target_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+            target.truncate(size)
@@ -2,33 +2,11 @@ import numpy as np
 import os
 import matplotlib.pyplot as plt
 import json
+import sys
 
-
-
-
-def read_json_file(file_path):
-    print(f"Reading: {file_path}")
-    all_data = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Read line by line
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        # Each line should be a JSON array
-                        tick_data = json.loads(line)
-                        all_data.extend(tick_data)
-                        #print(f"Line {line_num}: Added {len(tick_data)} records from tick {tick_data[0]['tick']}")
-                    except json.JSONDecodeError:
-                        print(f"✗ Could not parse line {line_num}: {line[:50]}...")
-        print(f"✓ Data covers ticks: {min(d['tick'] for d in all_data)} to {max(d['tick'] for d in all_data)}")
-        f.close()
-    except Exception as e:
-        print(f"✗ Error: {type(e).__name__}: {e}")
-
-    return all_data
-
+# the trajectory reader is shared with the main environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trajectory_reader import read_last_tick
 
 
 def save_data(data, file_name, data_path):
@@ -58,9 +36,9 @@ def transfer_data_to_json(Data_folder_path):
                         file_path = f"{data_folder_path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/sheep_data.json"
                         print(file_path)
                         if os.path.exists(file_path):
-                            sheep_data = read_json_file(file_path)
-                            if sheep_data:
-                                ticks.append(sheep_data[-1]["tick"])
+                            last_tick = read_last_tick(os.path.dirname(file_path))
+                            if last_tick is not None:
+                                ticks.append(last_tick)
                     final_ticks.append(ticks)
                 if Is_explicit:
                     json_file_name = "Nh" + str(N_shepherd) + "_Explicit_L3_" + str(L3)
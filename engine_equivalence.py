@@ -0,0 +1,229 @@
+"""
+engine_equivalence.py : equivalence of a candidate engine of the herd (vectorized or numba, herd_engine.py) with the
+            legacy path of Sheep_Agent and Shepherd_Agent.
+            - Force check: the field of view and the forces of one step are calculated sheep by sheep by both paths on
+              the same herd and the same shepherds. The forces, calculated on the same network, must agree within the
+              tolerance, the sheep whose field of view differs are reported.
+            - Statistical check: the sprites update one after the other and the engines the whole herd at once, so the
+              runs of the two paths diverge from the first tick and can only agree in distribution. Both paths run
+              over many seeds, disjoint between the two paths so that the samples are independent, and the
+              distributions of the final tick, the coordination percentage, the polarization and the cohesion of the
+              moving sheep are compared with the two-sample Kolmogorov-Smirnov and Mann-Whitney U tests (significance
+              level corrected for the number of tests).
+            The script exits with 1 when a check fails.
+
+    python engine_equivalence.py 1 50 5000 --engine vectorized --n_seeds 50 --output equivalence.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import ks_2samp, mannwhitneyu
+
+from herd_engine import Herd_Engine, limit_field_of_view
+from interaction_network import get_neighbors
+from loop_function import Loop_Function
+from results_catalog import read_summary
+from trajectory_reader import iterate_blocks
+
+METRICS = ("final_tick", "coordination_percentage", "polarization", "cohesion")
+TESTS = {"ks": ks_2samp, "mannwhitneyu": mannwhitneyu}
+
+
+def get_parameters(args):
+    return dict(N_sheep=args.n_sheep, N_shepherd=args.n_shepherd, Time=args.iterations, width=1000, height=1000,
+                target_place_x=800, target_place_y=800, framerate=0, with_visualization=False, L3=100,
+                uncomfortable_distance=500, is_antagonistic=args.is_antagonistic, network_type=args.network_type)
+
+
+def calculate_herd_order(run_folder):
+    """
+    Polarization (norm of the mean heading) and cohesion (mean distance to the centroid) of the moving sheep,
+    averaged over the saved ticks with moving sheep
+    """
+    polarization = []
+    cohesion = []
+    for _, block in iterate_blocks(run_folder, "sheep", ["x", "y", "heading_direction", "state"]):
+        is_moving = block["state"] == 1
+        n_moving = np.sum(is_moving, axis=1)
+        has_moving = n_moving > 0
+        n_moving = np.maximum(n_moving, 1)
+        heading = block["heading_direction"].astype(np.float64)
+        polarization.append(np.hypot(np.sum(np.where(is_moving, np.cos(heading), 0.0), axis=1),
+                                     np.sum(np.where(is_moving, np.sin(heading), 0.0), axis=1))[has_moving] /
+                            n_moving[has_moving])
+        x = block["x"].astype(np.float64)
+        y = block["y"].astype(np.float64)
+        center_x = np.sum(np.where(is_moving, x, 0.0), axis=1, keepdims=True) / n_moving[:, None]
+        center_y = np.sum(np.where(is_moving, y, 0.0), axis=1, keepdims=True) / n_moving[:, None]
+        distance = np.where(is_moving, np.hypot(x - center_x, y - center_y), 0.0)
+        cohesion.append(np.sum(distance, axis=1)[has_moving] / n_moving[has_moving])
+    polarization = np.concatenate(polarization) if polarization else np.empty(0)
+    cohesion = np.concatenate(cohesion) if cohesion else np.empty(0)
+    return (float(np.mean(polarization)) if polarization.size else np.nan,
+            float(np.mean(cohesion)) if cohesion.size else np.nan)
+
+
+def run_seed(parameters, engine, seed):
+    """Metrics of one headless run of engine, in the process running it"""
+    with tempfile.TemporaryDirectory() as output_folder:
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop_function = Loop_Function(**parameters, is_saving_data=True, data_format="columnar", engine=engine,
+                                          seed=seed, output_folder=output_folder)
+            loop_function.start()
+        summary = read_summary(output_folder)
+        polarization, cohesion = calculate_herd_order(output_folder)
+    return {"seed": seed, "final_tick": summary["final_tick"],
+            "coordination_percentage": summary["coordination_percentage"],
+            "polarization": polarization, "cohesion": cohesion}
+
+
+def compare_samples(legacy_runs, candidate_runs, alpha):
+    """
+    Two-sample tests of every metric, each at the level alpha divided by the number of tests
+
+    :return: p-value of every test of every metric, True if no test rejects the equivalence
+    """
+    level = alpha / (len(METRICS) * len(TESTS))
+    results = {}
+    is_equivalent = True
+    print(f"{'metric':<24} {'legacy mean':>12} {'candidate mean':>15}" + "".join(f"{name:>14}" for name in TESTS))
+    for metric in METRICS:
+        legacy = np.array([run[metric] for run in legacy_runs], dtype=np.float64)
+        candidate = np.array([run[metric] for run in candidate_runs], dtype=np.float64)
+        legacy = legacy[~np.isnan(legacy)]
+        candidate = candidate[~np.isnan(candidate)]
+        p_values = {}
+        for name, test in TESTS.items():
+            if np.array_equal(np.unique(legacy), np.unique(candidate)) and np.unique(legacy).size == 1:
+                p_values[name] = 1.0  # both samples are the same constant, e.g. no run penned the herd
+            else:
+                p_values[name] = float(test(legacy, candidate).pvalue)
+        is_rejected = any(p_value < level for p_value in p_values.values())
+        is_equivalent = is_equivalent and not is_rejected
+        results[metric] = {"legacy_mean": float(np.mean(legacy)), "candidate_mean": float(np.mean(candidate)),
+                           **p_values}
+        print(f"{metric:<24} {np.mean(legacy):>12.4f} {np.mean(candidate):>15.4f}" +
+              "".join(f"{p_value:>14.4g}" for p_value in p_values.values()) + (" DIFFERENT" if is_rejected else ""))
+    print(f"significance level per test: {level:.4g}")
+    return results, is_equivalent
+
+
+def calculate_sprite_forces(loop_function, network):
+    """Forces of the per-sprite methods of Sheep_Agent.update, the sheep being updated before any of them moves"""
+    sheep_registry = loop_function.sheep_registry
+    f_x = np.zeros(loop_function.n_sheep)
+    f_y = np.zeros(loop_function.n_sheep)
+    neighbors = []
+    for sheep_agent in sheep_registry:
+        sheep_agent.Get_interaction_network(sheep_registry, network)
+        sheep_agent.Limit_field_of_view(sheep_registry)
+        neighbors.append(sorted(sheep_agent.interact_network))
+        if sheep_agent.is_antagonistic:
+            sheep_agent.update_shepherd_forces_antagonistic(loop_function.shepherd_registry)
+        else:
+            sheep_agent.update_shepherd_forces(loop_function.shepherd_registry)
+        sheep_agent.Get_repulsion_force(sheep_registry)
+        sheep_agent.Get_attraction_force(sheep_registry)
+        if sheep_agent.num_rep != 0:
+            f_x[sheep_agent.index] = sheep_agent.f_avoid_x * sheep_agent.K_repulsion
+            f_y[sheep_agent.index] = sheep_agent.f_avoid_y * sheep_agent.K_repulsion
+        else:
+            f_x[sheep_agent.index] = (sheep_agent.f_att_x * sheep_agent.K_attraction +
+                                      sheep_agent.f_shepherd_force_x * sheep_agent.K_shepherd)
+            f_y[sheep_agent.index] = (sheep_agent.f_att_y * sheep_agent.K_attraction +
+                                      sheep_agent.f_shepherd_force_y * sheep_agent.K_shepherd)
+    return f_x, f_y, neighbors
+
+
+def check_forces(parameters, engine, seed, tolerance):
+    """
+    Field of view and forces of one step of the sprites and of engine on identical inputs, in the process running it.
+    Sheep_Agent.Limit_field_of_view removes neighbors from the list it is iterating and so skips the neighbor after
+    every removed one, the networks of the two paths are only compared. The forces are compared on the network of
+    the sprites.
+
+    :return: number of sheep with a different field of view network, number of sheep with a different force,
+        largest difference of the forces
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop_function = Loop_Function(**parameters, seed=seed)
+    # the part of Sheep_Agent.update before the forces, for the whole herd
+    for sheep_agent in loop_function.sheep_registry:
+        sheep_agent.update_sheep_state(loop_function.sheep_registry)
+        sheep_agent.reflect_from_walls()
+        sheep_agent.reflect_from_fence()
+    loop_function.update_interaction_network()
+    network = loop_function.interaction_network
+    f_x, f_y, neighbors = calculate_sprite_forces(loop_function, network)
+
+    herd_engine = Herd_Engine(loop_function.sheep_agents, use_numba=engine == "numba")
+    herd_engine.update_sheep_state()
+    engine_network = limit_field_of_view(network, herd_engine.x, herd_engine.y, herd_engine.orientation,
+                                         herd_engine.is_staying, herd_engine.fov)
+    n_network_differences = sum(sorted(get_neighbors(engine_network, index)) != sheep_neighbors
+                                for index, sheep_neighbors in enumerate(neighbors))
+
+    indptr = np.zeros(loop_function.n_sheep + 1, dtype=network[0].dtype)
+    np.cumsum([len(sheep_neighbors) for sheep_neighbors in neighbors], out=indptr[1:])
+    herd_engine.network = (indptr, np.array([index for sheep_neighbors in neighbors for index in sheep_neighbors],
+                                            dtype=network[1].dtype))
+    shepherd_x = np.array([shepherd_agent.x for shepherd_agent in loop_function.shepherd_registry])
+    shepherd_y = np.array([shepherd_agent.y for shepherd_agent in loop_function.shepherd_registry])
+    engine_f_x, engine_f_y = herd_engine.calculate_forces(shepherd_x, shepherd_y)
+    difference = np.maximum(np.abs(f_x - engine_f_x), np.abs(f_y - engine_f_y))
+    return {"seed": seed, "network_differences": n_network_differences,
+            "force_differences": int(np.sum(difference > tolerance)), "max_difference": float(np.max(difference))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("n_shepherd", type=int)
+    parser.add_argument("n_sheep", type=int)
+    parser.add_argument("iterations", type=int)
+    parser.add_argument("--engine", default="vectorized")  # candidate engine: vectorized or numba
+    parser.add_argument("--n_seeds", type=int, default=30)  # runs of each path
+    parser.add_argument("--seed", type=int, default=0)  # first seed, the candidate runs take the next n_seeds
+    parser.add_argument("--network_type", default="voronoi")
+    parser.add_argument("--is_antagonistic", action="store_true")
+    parser.add_argument("--alpha", type=float, default=0.05)  # family-wise significance level of the tests
+    parser.add_argument("--tolerance", type=float, default=1e-9)  # of the forces of the force check
+    parser.add_argument("--force_seeds", type=int, default=10)  # herds of the force check
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default=None)  # json file of the results
+    args = parser.parse_args()
+    parameters = get_parameters(args)
+
+    legacy_seeds = list(range(args.seed, args.seed + args.n_seeds))
+    candidate_seeds = list(range(args.seed + args.n_seeds, args.seed + 2 * args.n_seeds))
+    force_seeds = list(range(args.seed, args.seed + args.force_seeds))
+    # numba is not fork safe once its threads run, so everything using the engine runs in the workers
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        print(f"Force check of {args.engine} against the sprites on {args.force_seeds} herds")
+        force_checks = list(executor.map(check_forces, *zip(*[(parameters, args.engine, seed, args.tolerance)
+                                                               for seed in force_seeds])))
+        for check in force_checks:
+            print(f"seed {check['seed']}: {check['network_differences']} sheep with a different field of view, "
+                  f"{check['force_differences']} sheep with a different force, "
+                  f"largest difference {check['max_difference']:.3g}", flush=True)
+        print(f"Runs of {args.n_seeds} seeds per path, {args.iterations} ticks", flush=True)
+        legacy_runs = list(executor.map(run_seed, *zip(*[(parameters, "sprite", seed) for seed in legacy_seeds])))
+        candidate_runs = list(executor.map(run_seed, *zip(*[(parameters, args.engine, seed)
+                                                             for seed in candidate_seeds])))
+    is_force_equal = all(check["force_differences"] == 0 for check in force_checks)
+    tests, is_equivalent = compare_samples(legacy_runs, candidate_runs, args.alpha)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"engine": args.engine, "parameters": parameters, "alpha": args.alpha,
+                       "force_checks": force_checks, "tests": tests,
+                       "legacy_runs": legacy_runs, "candidate_runs": candidate_runs}, f, indent=1)
+    print(f"forces: {'equal' if is_force_equal else 'DIFFERENT'}, "
+          f"distributions: {'equivalent' if is_equivalent else 'DIFFERENT'}")
+    sys.exit(0 if is_force_equal and is_equivalent else 1)
@@ -1,3 +1,4 @@
+import argparse
 import numpy as np
 import os
 import matplotlib.pyplot as plt
@@ -7,29 +8,7 @@ import json
 import seaborn as sns
 import pandas as pd
 
-
-def read_json_file(file_path):
-    print(f"Reading: {file_path}")
-    all_data = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Read line by line
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        # Each line should be a JSON array
-                        tick_data = json.loads(line)
-                        all_data.extend(tick_data)
-                        #print(f"Line {line_num}: Added {len(tick_data)} records from tick {tick_data[0]['tick']}")
-                    except json.JSONDecodeError:
-                        print(f"✗ Could not parse line {line_num}: {line[:50]}...")
-        print(f"✓ Data covers ticks: {min(d['tick'] for d in all_data)} to {max(d['tick'] for d in all_data)}")
-        f.close()
-    except Exception as e:
-        print(f"✗ Error: {type(e).__name__}: {e}")
-
-    return all_data
+from results_catalog import get_last_tick, get_last_ticks
 
 
 def generate_map_data_in_order(N_sheep, N_shepherd, rep, data_folder_path):
@@ -58,9 +37,7 @@ def generate_map_data_in_order(N_sheep, N_shepherd, rep, data_folder_path):
         subfolder = data_folder_path + "coll_"+str(coll_threshold)+"/"
         for drive_threshold in drive_thresholds:
             file_path = subfolder + "drive_"+ str(drive_threshold) + "/" + "rep_1/"
-            sheep_file_path = file_path + "sheep_data.json"
-            sheep_data = read_json_file(sheep_file_path)
-            Final_tick = sheep_data[-1]["tick"]
+            Final_tick = get_last_tick(file_path)
             map_data.append(Final_tick)
         map.append(map_data)
 
@@ -99,9 +76,7 @@ def generate_map_data(N_sheep, N_shepherd, rep, data_folder_path):
         for drive_subfolder in drive_subfolders:
             file_path = subfolder + "/" + drive_subfolder + "/" + "rep_1/"
             drive_thresholds.append(float(drive_subfolder[6:]))
-            sheep_file_path = file_path + "sheep_data.json"
-            sheep_data = read_json_file(sheep_file_path)
-            Final_tick = sheep_data[-1]["tick"]
+            Final_tick = get_last_tick(file_path)
             map_data.append(Final_tick)
         map.append(map_data)
         with open(json_file_name, 'a') as f:
@@ -126,22 +101,16 @@ def generate_map_data(N_sheep, N_shepherd, rep, data_folder_path):
 
 # drive_subfolders, coll_subfolders = generate_map_data(N_sheep, N_shepherd, rep, data_folder_path)
 
-def generate_map_json_data(N_shepherd, N_sheep, rep, coll_angles, drive_angles, coll_folders, drive_folders, data_folder_path):
+def generate_map_json_data(N_shepherd, N_sheep, rep, coll_angles, drive_angles, coll_folders, drive_folders, data_folder_path,
+                           workers=None):
     json_file_name = "map_data_" + "Nh_"+str(N_shepherd)+"_Ns_" + str(N_sheep) +"_rep_"+str(rep)+ ".json"
+    run_folders = [data_folder_path + coll_folder +"/"+ drive_folder + "/" + "rep_"+str(index)+"/"
+                   for coll_folder in coll_folders for drive_folder in drive_folders for index in range(1, rep+1)]
+    # the runs are read by a pool of processes, then merged back into the map: shape (coll, drive, rep)
+    final_ticks = get_last_ticks(run_folders, workers).reshape(len(coll_folders), len(drive_folders), rep)
     map = []
-    for coll_folder in coll_folders:
-        map_data = []
-        for drive_folder in drive_folders:
-            final_ticks = []
-            for index in range(1, rep+1):
-                file_path = data_folder_path + coll_folder +"/"+ drive_folder + "/" + "rep_"+str(index)+"/"
-                print(file_path)
-                sheep_file_path = file_path + "sheep_data.json"
-                sheep_data = read_json_file(sheep_file_path)
-                final_tick = sheep_data[-1]["tick"]
-                final_ticks.append(final_tick)
-
-            map_data.append(np.mean(final_ticks))
+    for coll_final_ticks in final_ticks:
+        map_data = [float(np.mean(ticks[~np.isnan(ticks)])) for ticks in coll_final_ticks]
         map.append(map_data)
 
         with open(json_file_name, 'a') as f:
@@ -165,22 +134,27 @@ def generate_map_json_data(N_shepherd, N_sheep, rep, coll_angles, drive_angles,
     return
 
 
-N_shepherd = 1
-N_sheep = 100 #80 120 160
-rep = 5
-coll_angles=[angle for angle in range(30,121,10)]
-drive_angles=[angle for angle in range(0,91,10)]
-coll_folders = ["coll_"+str(coll_angle) for coll_angle in coll_angles]
-drive_folders = ["drive_"+str(drive_angle) for drive_angle in drive_angles]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())  # processes reading the runs
+    args = parser.parse_args()
+
+    N_shepherd = 1
+    N_sheep = 100 #80 120 160
+    rep = 5
+    coll_angles=[angle for angle in range(30,121,10)]
+    drive_angles=[angle for angle in range(0,91,10)]
+    coll_folders = ["coll_"+str(coll_angle) for coll_angle in coll_angles]
+    drive_folders = ["drive_"+str(drive_angle) for drive_angle in drive_angles]
 
 
-data_folder_path = "/mnt/DATA/yating/results_phase_diagram/"+"N_shepherd_"+str(N_shepherd)+"/N_sheep_"+str(N_sheep)+"/"
-print(data_folder_path)
+    data_folder_path = "/mnt/DATA/yating/results_phase_diagram/"+"N_shepherd_"+str(N_shepherd)+"/N_sheep_"+str(N_sheep)+"/"
+    print(data_folder_path)
 
-# data_folder_path = "/mnt/DATA/yating/results_phase_diagram/"+"N_shepherd_"+str(N_shepherd)+"/N_sheep_"+str(N_sheep)+"/"
-# print(data_folder_path)
-generate_map_json_data(N_shepherd, N_sheep, rep, coll_angles, drive_angles, coll_folders, drive_folders, data_folder_path)
-#
+    # data_folder_path = "/mnt/DATA/yating/results_phase_diagram/"+"N_shepherd_"+str(N_shepherd)+"/N_sheep_"+str(N_sheep)+"/"
+    # print(data_folder_path)
+    generate_map_json_data(N_shepherd, N_sheep, rep, coll_angles, drive_angles, coll_folders, drive_folders,
+                           data_folder_path, args.workers)
 
 
 
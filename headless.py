@@ -0,0 +1,60 @@
+"""
+headless.py : pygame-free stand-ins for pygame.sprite.Sprite and pygame.sprite.Group. The agents and the loop
+            function only use these, so a simulation without visualization never imports pygame. With visualization
+            the same groups draw the pygame surfaces of their sprites.
+"""
+
+
+class Sprite:
+    """Base class of the agents, the part of pygame.sprite.Sprite used by the simulation"""
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+class Group:
+    """Ordered container of sprites, the part of pygame.sprite.Group used by the simulation"""
+
+    def __init__(self, *sprites):
+        self._sprites = []
+        self.add(*sprites)
+
+    def add(self, *sprites):
+        for sprite in sprites:
+            if sprite not in self._sprites:
+                self._sprites.append(sprite)
+
+    def remove(self, *sprites):
+        for sprite in sprites:
+            if sprite in self._sprites:
+                self._sprites.remove(sprite)
+
+    def sprites(self):
+        """copy of the list of sprites, in the order they were added"""
+        return list(self._sprites)
+
+    def update(self, *args, **kwargs):
+        """calling update of every sprite with the same arguments"""
+        for sprite in self._sprites:
+            sprite.update(*args, **kwargs)
+
+    def draw(self, surface):
+        """blitting the image of every sprite on a pygame surface"""
+        for sprite in self._sprites:
+            surface.blit(sprite.image, sprite.rect)
+
+    def __iter__(self):
+        return iter(self.sprites())
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def __contains__(self, sprite):
+        return sprite in self._sprites
+
+
+def collide_circle(sprite1, sprite2):
+    """Collision of two agents as circles around their centers (x, y)"""
+    distance_squared = (sprite1.x - sprite2.x) ** 2 + (sprite1.y - sprite2.y) ** 2
+    return distance_squared <= (sprite1.radius + sprite2.radius) ** 2
+
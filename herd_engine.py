@@ -0,0 +1,317 @@
+"""
+herd_engine.py : vectorized (structure-of-arrays) engine of the sheep herd. The state of all the sheep is kept in
+            contiguous numpy arrays and every step of Sheep_Agent.update is computed for the whole herd at once. The
+            sheep sprites are only synced from the arrays when they are needed (rendering, saving data).
+"""
+import numpy as np
+
+import support
+from interaction_network import build_interaction_network
+
+
+def reflect_from_walls(x, y, orientation, boundaries_x, boundaries_y):
+    """Vectorized Sheep_Agent.reflect_from_walls ("bounce_back" boundary condition)"""
+    orientation = support.reflect_angle_array(orientation)  # [0, 2pi]
+
+    # Reflection from left wall
+    is_reflected = x < boundaries_x[0]
+    x = np.where(is_reflected, boundaries_x[0] + 1, x)
+    orientation = np.where(is_reflected & (np.pi / 2 <= orientation) & (orientation < np.pi),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (np.pi <= orientation) & (orientation <= 3 * np.pi / 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from right wall
+    is_reflected = x > boundaries_x[1]
+    x = np.where(is_reflected, boundaries_x[1] - 1, x)
+    orientation = np.where(is_reflected & (3 * np.pi / 2 <= orientation) & (orientation < 2 * np.pi),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (0 <= orientation) & (orientation <= np.pi / 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from upper wall
+    is_reflected = y < boundaries_y[0]
+    y = np.where(is_reflected, boundaries_y[0] + 1, y)
+    orientation = np.where(is_reflected & (np.pi < orientation) & (orientation <= np.pi * 3 / 2),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (np.pi * 3 / 2 < orientation) & (orientation <= np.pi * 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from lower wall
+    is_reflected = y > boundaries_y[1]
+    y = np.where(is_reflected, boundaries_y[1] - 1, y)
+    orientation = np.where(is_reflected & (np.pi / 2 <= orientation) & (orientation <= np.pi),
+                           orientation + np.pi / 2,
+                           np.where(is_reflected & (0 <= orientation) & (orientation < np.pi / 2),
+                                    orientation - np.pi / 2, orientation))
+
+    return x, y, support.reflect_angle_array(orientation)
+
+
+def reflect_from_fence(x, y, orientation, is_staying, target_x, target_y, target_size, window_pad, fence_width=10):
+    """Vectorized Sheep_Agent.reflect_from_fence: staying sheep are kept inside the target place"""
+    orientation = support.reflect_angle_array(orientation)  # [0, 2pi]
+
+    # Reflection from left wall
+    is_reflected = is_staying & (x < target_x - target_size + fence_width) & (y >= target_y - window_pad)
+    x = np.where(is_reflected, target_x - target_size + fence_width + 1, x)
+    orientation = np.where(is_reflected & (np.pi / 2 <= orientation) & (orientation < np.pi),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (np.pi <= orientation) & (orientation <= 3 * np.pi / 2),
+                                    orientation + np.pi / 2, orientation))
+
+    # Reflection from upper wall
+    is_reflected = is_staying & (y < target_y - target_size + fence_width) & (x >= target_x - window_pad)
+    y = np.where(is_reflected, target_y - target_size + fence_width + 1, y)
+    orientation = np.where(is_reflected & (np.pi < orientation) & (orientation <= np.pi * 3 / 2),
+                           orientation - np.pi / 2,
+                           np.where(is_reflected & (np.pi * 3 / 2 < orientation) & (orientation <= np.pi * 2),
+                                    orientation + np.pi / 2, orientation))
+
+    return x, y, support.reflect_angle_array(orientation)
+
+
+def limit_field_of_view(network, x, y, orientation, is_staying, fov):
+    """
+    Removing the neighbors in a different state or outside of the field of view from a CSR network.
+
+    :return indptr, indices: CSR adjacency of the remaining network
+    """
+    indptr, indices = network
+    n_agents = indptr.shape[0] - 1
+    sources = np.repeat(np.arange(n_agents), np.diff(indptr))
+    relative_angle = np.arctan2(y[indices] - y[sources], x[indices] - x[sources])
+    delta_angle = np.abs(orientation[sources] - relative_angle) % (2 * np.pi)
+    is_kept = (is_staying[sources] == is_staying[indices]) & (delta_angle <= fov / 2)
+    kept_indptr = np.zeros_like(indptr)
+    np.cumsum(np.bincount(sources[is_kept], minlength=n_agents), out=kept_indptr[1:])
+    return kept_indptr, indices[is_kept]
+
+
+def calculate_neighbor_forces(network, x, y, rep_distance):
+    """
+    Repulsion (closer than rep_distance) and attraction (further away) from the neighbors in the network.
+
+    :return f_avoid_x, f_avoid_y, num_rep, f_att_x, f_att_y, num_att: mean unit vectors and number of neighbors
+    """
+    indptr, indices = network
+    n_agents = indptr.shape[0] - 1
+    sources = np.repeat(np.arange(n_agents), np.diff(indptr))
+    d_x = x[sources] - x[indices]
+    d_y = y[sources] - y[indices]
+    distance = np.sqrt(d_x ** 2 + d_y ** 2)
+    is_repulsive = distance <= rep_distance
+
+    num_rep = np.bincount(sources[is_repulsive], minlength=n_agents)
+    num_att = np.bincount(sources[~is_repulsive], minlength=n_agents)
+    r_x = np.bincount(sources, weights=np.where(is_repulsive, d_x / (distance + 0.000001), 0.0), minlength=n_agents)
+    r_y = np.bincount(sources, weights=np.where(is_repulsive, d_y / (distance + 0.000001), 0.0), minlength=n_agents)
+    a_x = np.bincount(sources, weights=np.where(is_repulsive, 0.0, -d_x / (distance + 0.000001)), minlength=n_agents)
+    a_y = np.bincount(sources, weights=np.where(is_repulsive, 0.0, -d_y / (distance + 0.000001)), minlength=n_agents)
+
+    f_avoid_x = np.divide(r_x, num_rep, out=np.zeros(n_agents), where=num_rep != 0)
+    f_avoid_y = np.divide(r_y, num_rep, out=np.zeros(n_agents), where=num_rep != 0)
+    f_att_x = np.divide(a_x, num_att, out=np.zeros(n_agents), where=num_att != 0)
+    f_att_y = np.divide(a_y, num_att, out=np.zeros(n_agents), where=num_att != 0)
+    return f_avoid_x, f_avoid_y, num_rep, f_att_x, f_att_y, num_att
+
+
+def calculate_shepherd_forces(x, y, orientation, shepherd_x, shepherd_y, safe_distance, is_antagonistic, alpha):
+    """
+    Avoidance of the shepherds closer than safe_distance (Sheep_Agent.update_shepherd_forces and its antagonistic
+    variant). The last axis of x, y is the sheep axis and the last axis of shepherd_x, shepherd_y the shepherd axis.
+
+    :return f_shepherd_force_x, f_shepherd_force_y
+    """
+    d_x = x[..., :, None] - shepherd_x[..., None, :]
+    d_y = y[..., :, None] - shepherd_y[..., None, :]
+    distance = np.sqrt(d_x ** 2 + d_y ** 2)
+    is_close = distance <= safe_distance
+    num_shepherd = np.sum(is_close, axis=-1)
+    r_x = np.sum(np.where(is_close, d_x / (distance + 0.000001), 0.0), axis=-1)
+    r_y = np.sum(np.where(is_close, d_y / (distance + 0.000001), 0.0), axis=-1)
+    f_avoid_x = np.divide(r_x, num_shepherd, out=np.zeros(r_x.shape), where=num_shepherd != 0)
+    f_avoid_y = np.divide(r_y, num_shepherd, out=np.zeros(r_y.shape), where=num_shepherd != 0)
+    if not is_antagonistic:
+        return f_avoid_x, f_avoid_y
+
+    # antagonistic sheep escape at an angle alpha from the avoidance direction, turned towards their heading
+    f_r = np.sqrt(r_x ** 2 + r_y ** 2)
+    f_avoid_angle = support.reflect_angle_array(np.arctan2(f_avoid_y, f_avoid_x))  # [0, 2pi]
+    f_avoid_angle = np.where(f_avoid_angle > orientation, f_avoid_angle - alpha, f_avoid_angle + alpha)
+    is_avoiding = num_shepherd != 0
+    return np.where(is_avoiding, f_r * np.cos(f_avoid_angle), 0.0), np.where(is_avoiding, f_r * np.sin(f_avoid_angle), 0.0)
+
+
+class Herd_Engine:
+    """
+    Vectorized engine of the herd. The parameters are taken from the sheep agents, so the engine reproduces the model
+    of Sheep_Agent.update with whole-array operations.
+    """
+
+    def __init__(self, sheep_agents, use_numba=False):
+        """
+        Initializing the arrays of the herd from the sheep agents of the loop function
+
+        :param sheep_agents: group of Sheep_Agent, in the order of their ids
+        :param use_numba: compute the forces with the compiled kernel of sheep_functions instead of numpy
+        """
+        agents = sheep_agents.sprites()
+        template = agents[0]
+        self.n_sheep = len(agents)
+
+        # state of the herd
+        self.x = np.array([agent.x for agent in agents], dtype=np.float64)
+        self.y = np.array([agent.y for agent in agents], dtype=np.float64)
+        self.orientation = np.array([agent.orientation for agent in agents], dtype=np.float64)
+        self.vt = np.array([agent.vt for agent in agents], dtype=np.float64)
+        self.is_staying = np.array([agent.state == "staying" for agent in agents])
+        # noise of every sheep from its own stream in a seeded run (shared with the sprites), drawn for the whole herd
+        # from np.random otherwise
+        self.noise = template.noise
+        self.network = None  # interaction network after the field of view, as CSR (indptr, indices)
+
+        # environment
+        self.boundaries_x = template.boundaries_x
+        self.boundaries_y = template.boundaries_y
+        self.window_pad = template.window_pad
+        self.target_x = template.target_x
+        self.target_y = template.target_y
+        self.target_size = template.target_size
+
+        # model parameters
+        self.network_type = template.network_type
+        self.rep_distance = template.rep_distance
+        self.att_distance = template.att_distance
+        self.safe_distance = template.safe_distance
+        self.K_repulsion = template.K_repulsion
+        self.K_attraction = template.K_attraction
+        self.K_shepherd = template.K_shepherd
+        self.K_Dr = template.K_Dr
+        self.tick_time = template.tick_time
+        self.v0 = template.v0
+        self.v_max = template.v_max
+        self.gamma = template.gamma
+        self.acceleration = template.acceleration
+        self.beta = template.beta
+        self.fov = template.fov
+        self.alpha = template.alpha
+        self.is_antagonistic = template.is_antagonistic
+
+        self.use_numba = use_numba
+        if self.use_numba:
+            # numba is only imported (and the kernel compiled) when it is used
+            from sheep_functions import calculate_sheep_forces
+            self.calculate_sheep_forces = calculate_sheep_forces
+            # the kernel is compiled once per signature: integer parameters would compile an int64 variant
+            self.kernel_parameters = (float(self.rep_distance), float(self.safe_distance), float(self.K_repulsion),
+                                      float(self.K_attraction), float(self.K_shepherd), bool(self.is_antagonistic),
+                                      float(self.alpha))
+            # compiled (or loaded from the numba cache) with the engine rather than in the first tick of the run
+            no_sheep = np.zeros(0)
+            self.calculate_sheep_forces(no_sheep, no_sheep, no_sheep, np.zeros(1, dtype=np.int64),
+                                        np.zeros(0, dtype=np.int64), no_sheep, no_sheep, *self.kernel_parameters)
+
+    def update_sheep_state(self):
+        # update sheep state according to square target place;
+        self.is_staying = (self.x >= (self.target_x - self.target_size)) & (self.y >= (self.target_y - self.target_size))
+
+    def calculate_forces(self, shepherd_x, shepherd_y):
+        """Total force on every sheep from its neighbors and the shepherds"""
+        if self.use_numba:
+            # int32 voronoi and int64 metric indices: a single dtype, so a single compiled variant
+            indptr, indices = (array.astype(np.int64, copy=False) for array in self.network)
+            forces = self.calculate_sheep_forces(self.x, self.y, self.orientation, indptr, indices,
+                                                 np.asarray(shepherd_x, dtype=np.float64),
+                                                 np.asarray(shepherd_y, dtype=np.float64), *self.kernel_parameters)
+            return forces[:, 8], forces[:, 9]
+        f_avoid_x, f_avoid_y, num_rep, f_att_x, f_att_y, _ = calculate_neighbor_forces(self.network, self.x, self.y,
+                                                                                        self.rep_distance)
+        f_shepherd_x, f_shepherd_y = calculate_shepherd_forces(self.x, self.y, self.orientation, shepherd_x, shepherd_y,
+                                                               self.safe_distance, self.is_antagonistic, self.alpha)
+        # repulsion between sheep overrides all the other forces
+        f_x = np.where(num_rep != 0, f_avoid_x * self.K_repulsion,
+                       f_att_x * self.K_attraction + f_shepherd_x * self.K_shepherd)
+        f_y = np.where(num_rep != 0, f_avoid_y * self.K_repulsion,
+                       f_att_y * self.K_attraction + f_shepherd_y * self.K_shepherd)
+        return f_x, f_y
+
+    def integrate(self, f_x, f_y):
+        """Velocity and heading update of all the sheep, the same as the last part of Sheep_Agent.update"""
+        v_dot = self.gamma * (self.v0 - self.vt) + f_x * np.cos(self.orientation) + f_y * np.sin(self.orientation)
+        w_dot = -f_x * np.sin(self.orientation) + f_y * np.cos(self.orientation)
+
+        if self.noise is None:
+            noise = np.random.normal(0, 1, self.n_sheep)
+        else:
+            noise = self.noise.draw_all()
+        Dr = noise * np.sqrt(2 * self.K_Dr) / (self.tick_time ** 0.5)
+
+        self.vt = np.clip(v_dot * self.acceleration * self.tick_time + self.vt, -self.v_max, self.v_max)
+
+        self.orientation = support.transform_angle_array(self.orientation + (w_dot * self.beta + Dr) * self.tick_time)
+        is_backward = self.vt < 0
+        self.orientation = support.transform_angle_array(np.where(is_backward, self.orientation + np.pi,
+                                                                  self.orientation))
+        self.vt = np.abs(self.vt)
+
+        self.x = self.x + self.vt * np.cos(self.orientation) * self.tick_time
+        self.y = self.y + self.vt * np.sin(self.orientation) * self.tick_time
+
+    def update(self, shepherd_x, shepherd_y, profiler=None):
+        """
+        One timestep of the whole herd
+
+        :param shepherd_x, shepherd_y: arrays of the shepherd positions
+        :param profiler: Tick_Profiler timing the network, field of view, forces and integration of the herd
+        """
+        if profiler is not None:
+            start_time = profiler.clock()
+        self.update_sheep_state()
+
+        self.x, self.y, self.orientation = reflect_from_walls(self.x, self.y, self.orientation,
+                                                              self.boundaries_x, self.boundaries_y)
+        self.x, self.y, self.orientation = reflect_from_fence(self.x, self.y, self.orientation, self.is_staying,
+                                                              self.target_x, self.target_y, self.target_size,
+                                                              self.window_pad)
+        if profiler is not None:
+            start_time = profiler.stop("integration", start_time)
+
+        network = build_interaction_network(np.column_stack((self.x, self.y)), self.network_type, self.att_distance)
+        if profiler is not None:
+            start_time = profiler.stop("network", start_time)
+        self.network = limit_field_of_view(network, self.x, self.y, self.orientation, self.is_staying, self.fov)
+        if profiler is not None:
+            start_time = profiler.stop("fov", start_time)
+
+        f_x, f_y = self.calculate_forces(np.asarray(shepherd_x, dtype=np.float64),
+                                         np.asarray(shepherd_y, dtype=np.float64))
+        if profiler is not None:
+            start_time = profiler.stop("forces", start_time)
+        self.integrate(f_x, f_y)
+        if profiler is not None:
+            profiler.stop("integration", start_time)
+
+    def sync_sprites(self, sheep_agents, is_drawing=False):
+        """
+        Copying the state of the herd to the sheep sprites
+
+        :param sheep_agents: group of Sheep_Agent, in the order of their ids
+        :param is_drawing: also update the network and the surface of the sprites for rendering
+        """
+        for index, agent in enumerate(sheep_agents):
+            agent.x = float(self.x[index])
+            agent.y = float(self.y[index])
+            agent.orientation = float(self.orientation[index])
+            agent.vt = float(self.vt[index])
+            if self.is_staying[index]:
+                agent.state = "staying"
+                agent.color = support.LIGHT_BLUE
+            else:
+                agent.state = "moving"
+                agent.color = support.GREEN
+            if is_drawing:
+                if self.network is not None:
+                    indptr, indices = self.network
+                    agent.interact_network = indices[indptr[index]:indptr[index + 1]].tolist()
+                agent.draw_update()
@@ -0,0 +1,78 @@
+"""
+interaction_network.py : builds the interaction network of the whole herd once per tick. The network is stored as a
+            compact adjacency structure (CSR: indptr/indices): the neighbors of agent i are
+            indices[indptr[i]:indptr[i + 1]].
+"""
+import numpy as np
+from scipy.spatial import Voronoi
+
+from spatial_grid import find_close_pairs
+
+
+def build_voronoi_network(points):
+    """
+    Voronoi neighbors of all the agents from a single triangulation.
+
+    :param points: positions of the agents as an array of shape (N, 2)
+    :return indptr, indices: CSR adjacency of the network
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n_agents = points.shape[0]
+    # indices of points between each voronoi ridge lines
+    ridge_points = Voronoi(points).ridge_points
+    # every ridge links both of its points; a stable sort keeps the neighbors of each agent in ridge order,
+    # which is the same order as searching the ridges agent by agent
+    sources = ridge_points.ravel()
+    targets = ridge_points[:, ::-1].ravel()
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(n_agents + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_agents), out=indptr[1:])
+    return indptr, targets[order]
+
+
+def build_metric_network(points, distance):
+    """
+    Metric neighbors of all the agents: every other agent closer than distance, found with a spatial grid of cells
+    of size distance for large herds.
+
+    :param points: positions of the agents as an array of shape (N, 2)
+    :param distance: interaction range in pixels
+    :return indptr, indices: CSR adjacency of the network, neighbors in increasing index order
+    """
+    return find_close_pairs(points, distance)
+
+
+def build_interaction_network(points, network_type, distance):
+    """Shared network of the herd according to network_type ("voronoi" or "metric")"""
+    if network_type == "voronoi":
+        return build_voronoi_network(points)
+    if network_type == "metric":
+        return build_metric_network(points, distance)
+    raise ValueError(f"Unknown network type: {network_type}")
+
+
+def build_block_network(points, network_type, distance):
+    """
+    Networks of R independent herds as one block-diagonal network: agent i of herd r has the flat index r * N + i.
+
+    :param points: positions of the agents as an array of shape (R, N, 2)
+    :return indptr, indices: CSR adjacency of the R * N agents, without links between different herds
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n_herds, n_agents = points.shape[:2]
+    indptr = np.zeros(n_herds * n_agents + 1, dtype=np.int64)
+    indices = []
+    n_links = 0
+    for herd_index in range(n_herds):
+        herd_indptr, herd_indices = build_interaction_network(points[herd_index], network_type, distance)
+        start = herd_index * n_agents
+        indptr[start + 1:start + n_agents + 1] = herd_indptr[1:] + n_links
+        indices.append(herd_indices + start)
+        n_links += herd_indices.shape[0]
+    return indptr, np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+
+
+def get_neighbors(network, agent_index):
+    """Neighbors of a single agent as a python list"""
+    indptr, indices = network
+    return indices[indptr[agent_index]:indptr[agent_index + 1]].tolist()
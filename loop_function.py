@@ -1,4 +1,3 @@
-import pygame
 import numpy as np
 import sys
 from datetime import datetime
@@ -7,8 +6,31 @@ from math import atan2
 from sheep_agent import Sheep_Agent
 from shepherd_agent import Shepherd_Agent
 import support
+from interaction_network import build_interaction_network
+from herd_engine import Herd_Engine
+from noise_provider import Noise_Provider
+from shepherd_vision import Vision_Field
+from spatial_grid import find_close_pairs, find_close_points
+from stall_detector import Stall_Detector, calculate_herd_distance
+from tick_profiler import Tick_Profiler
+from results_catalog import write_summary
+from checkpoint import CHECKPOINT_FILE, copy_files, read_checkpoint, remove_checkpoint, truncate_files, write_checkpoint
+from trajectory_writer import (SHEEP_COLUMNS, SHEEP_FIELDS, SHEPHERD_COLUMNS, SHEPHERD_FIELDS, Columnar_Writer,
+                               Trajectory_Writer)
 import os, json
-import matplotlib.pyplot as plt
+import headless
+
+pygame = None  # imported by import_pygame only for visualized runs
+# parameters a run forked from the checkpoint of another run can change, see fork_from_checkpoint
+FORK_PARAMETERS = ("Time", "L3", "uncomfortable_distance", "is_explicit", "alpha", "angle_threshold_collection",
+                   "angle_threshold_drive")
+
+
+def import_pygame():
+    """importing pygame into this module, headless runs never call it so they never load pygame"""
+    global pygame
+    import pygame
+
 
 class Loop_Function:
     def __init__(self, N_sheep=10, N_shepherd = 1, Time=1000, width=500, height=500,
@@ -19,7 +41,16 @@ class Loop_Function:
                  is_antagonistic = False,
                  alpha = np.pi/6,
                  angle_threshold_collection=np.pi/2,
-                 angle_threshold_drive=np.pi/6):
+                 angle_threshold_drive=np.pi/6,
+                 network_type="voronoi",
+                 engine="sprite",
+                 data_format=None,
+                 seed=None,
+                 checkpoint_interval=None,
+                 output_folder=None,
+                 stall_window=None,
+                 profile_interval=None,
+                 trace_ticks=None):
         """
         Initializing the main simulation instance
         :param N: number of agents
@@ -29,9 +60,33 @@ class Loop_Function:
         :param framerate: framerate of simulation
         :param window_pad: padding of the environment in simulation window in pixels
         :param with_visualization: turns visualization on or off. For large batch autmatic simulation should be off so
-            that we can use a higher/maximal framerate.
+            that we can use a higher/maximal framerate. Without visualization the simulation is headless: pygame is
+            not imported, agents have no surfaces or masks and the loop runs uncapped, ignoring framerate.
         :param agent_radius: radius of the agents
-        :param physical_obstacle_avoidance: obstacle avoidance based on pygame sprite collision groups
+        :param physical_obstacle_avoidance: obstacle avoidance based on circle collisions between the agents
+        :param network_type: interaction network of the sheep, "voronoi" or "metric". It is built once per tick for
+            the whole herd and shared by all sheep agents.
+        :param engine: "sprite" updates every sheep agent on its own, "vectorized" updates the whole herd with the
+            array based Herd_Engine, "numba" uses the Herd_Engine with the compiled force kernel of sheep_functions.
+            The sheep sprites are then only synced from the arrays when needed.
+        :param data_format: format of the saved data, "json" (sheep_data.json, shepherd_data.json) or "columnar"
+            (sheep_data/, shepherd_data/ folders read with trajectory_reader). Taken from the DATA_FORMAT environment
+            variable if None, "json" by default.
+        :param seed: seed of the run. The initial conditions and every agent draw from their own streams spawned from
+            it (np.random.SeedSequence), so the noise of an agent does not depend on the engine. The noise is drawn in
+            blocks from the streams (noise_provider.py) and the explicit coordination of every shepherd has a stream
+            of its own. Without a seed the run draws from the global np.random.
+        :param checkpoint_interval: ticks between the checkpoints of the complete state of the run, written to
+            checkpoint.pkl in the output folder and continued with resume_from_checkpoint; no checkpoints if None.
+            Only headless runs are checkpointed.
+        :param output_folder: folder of the saved data, the summary and the checkpoints, taken from the OUTPUT_DIR
+            environment variable if None
+        :param stall_window: ticks without progress of the herd after which the run is stopped and saved as stalled
+            (see stall_detector.py); runs are never stopped before the end of the simulation time if None
+        :param profile_interval: timing the phases of every tick (see tick_profiler.py), printing their rolling means
+            every profile_interval ticks and a report at the end of the run; no profiling if None
+        :param trace_ticks: (first, last) tick of a window saved span by span as trace.json in the output folder, for a
+            trace viewer (see tick_profiler.py); no trace if None
         """
         # Arena parameters
         self.change_agent_colors = False
@@ -62,28 +117,85 @@ class Loop_Function:
         self.alpha = alpha
         self.angle_threshold_collection = angle_threshold_collection
         self.angle_threshold_drive = angle_threshold_drive
+        self.network_type = network_type
+        self.interaction_network = None
+        self.shepherd_neighbors = None
+        self.vision_field = None
+        # trajectory files of is_saving_data, opened at the first saved tick
+        self.data_format = data_format or os.environ.get("DATA_FORMAT", "json")
+        if self.data_format not in ("json", "columnar"):
+            raise ValueError(f"Unknown data format: {self.data_format}")
+        self.sheep_writer = None
+        self.shepherd_writer = None
+        self.output_folder = output_folder
+        # checkpoints of the run, see checkpoint.py
+        if checkpoint_interval and with_visualization:
+            raise ValueError("Only headless runs can be checkpointed")
+        self.checkpoint_interval = checkpoint_interval
+        self.is_resumed = False
+        self.elapsed_time = 0.0  # wall time of the run before it was resumed
+        self.fork_tick = None  # tick of the checkpoint of another run this run was forked from
+        # shepherd modes during the run, for the summary
+        self.n_mixed_mode_ticks = 0  # ticks with shepherds in both modes
+        self.n_drive_mode_ticks = 0  # ticks of every shepherd in drive mode
+        self.is_mixed_mode = False
+        # runs stopped without progress of the herd
+        self.stall_window = stall_window
+        self.stall_detector = Stall_Detector(stall_window) if stall_window else None
+        self.is_stalled = False
+        # timing of the phases of the ticks
+        self.profiler = Tick_Profiler(profile_interval, trace_ticks=trace_ticks) if profile_interval or trace_ticks \
+            else None
         #self.last_pause_tick = 0
 
         # Agent parameters
         self.agent_radii = agent_radius
+        # random streams of the run: initial conditions, then one stream per sheep and per shepherd and one per
+        # shepherd for the explicit coordination
+        self.seed = seed
+        if seed is None:
+            self.rng = np.random
+            self.sheep_seeds = None
+            self.shepherd_seeds = None
+            self.coordination_seeds = None
+        else:
+            initial_seed, sheep_seed, shepherd_seed, coordination_seed = np.random.SeedSequence(seed).spawn(4)
+            self.rng = np.random.default_rng(initial_seed)
+            self.sheep_seeds = sheep_seed.spawn(N_sheep)
+            self.shepherd_seeds = shepherd_seed.spawn(N_shepherd)
+            self.coordination_seeds = coordination_seed.spawn(N_shepherd)
 
 
         # Initializing pygame
-        pygame.init()
+        if self.with_visualization:
+            import_pygame()
+            pygame.init()
 
-        # pygame related class attributes
-        self.agents = pygame.sprite.Group()
+        # sprite groups of the agents
+        self.agents = headless.Group()
 
-        self.sheep_agents = pygame.sprite.Group()
-        self.shepherd_agents = pygame.sprite.Group()
+        self.sheep_agents = headless.Group()
+        self.shepherd_agents = headless.Group()
+        # registries of the agents by integer index: sheep_registry[i] is the sheep of index i
+        self.sheep_registry = []
+        self.shepherd_registry = []
 
         self.add_sheep_agents()
         self.add_shepherd_agent()
 
+        self.engine = engine
+        if self.engine == "vectorized":
+            self.herd_engine = Herd_Engine(self.sheep_agents)
+        elif self.engine == "numba":
+            self.herd_engine = Herd_Engine(self.sheep_agents, use_numba=True)
+        elif self.engine == "sprite":
+            self.herd_engine = None
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
         if self.with_visualization:
             self.screen = pygame.display.set_mode([self.WIDTH + 2 * self.window_pad, self.HEIGHT + 2 * self.window_pad])
-
-        self.clock = pygame.time.Clock()
+            self.clock = pygame.time.Clock()
 
     def draw_background(self):
         # add background
@@ -134,15 +246,15 @@ class Loop_Function:
         for agent in self.sheep_agents:
             if agent.interact_network:
                 for neighbor_id in agent.interact_network:
-                    neighbor_x = self.sheep_agents.sprites()[neighbor_id].x
-                    neighbor_y = self.sheep_agents.sprites()[neighbor_id].y
+                    neighbor_x = self.sheep_registry[neighbor_id].x
+                    neighbor_y = self.sheep_registry[neighbor_id].y
                     pygame.draw.line(self.screen, "grey", (agent.x, agent.y),
                                      (neighbor_x, neighbor_y),
                                      3)
         for shepherd_agent in self.shepherd_agents:
             target_agent_id = shepherd_agent.approach_agent_id
-            target_agent_x = self.sheep_agents.sprites()[target_agent_id].x
-            target_agent_y = self.sheep_agents.sprites()[target_agent_id].y
+            target_agent_x = self.sheep_registry[int(target_agent_id)].x
+            target_agent_y = self.sheep_registry[int(target_agent_id)].y
             # pygame.draw.line(self.screen, "cornflowerblue", (shepherd_agent.x, shepherd_agent.y),
             #                  (target_agent_x, target_agent_y),
             #                  3)
@@ -250,11 +362,25 @@ class Loop_Function:
                 else:
                     agent2.velocity = agent2.v_max
 
+    def find_agent_collisions(self):
+        """Every agent colliding with other agents, as {agent: [agents]}; candidates come from a spatial grid"""
+        agents = self.agents.sprites()
+        collision_distance = 2 * max(agent.radius for agent in agents)
+        indptr, indices = find_close_pairs([(agent.x, agent.y) for agent in agents], collision_distance)
+        collisions = {}
+        for index, agent in enumerate(agents):
+            colliding_agents = [agents[other_index] for other_index in indices[indptr[index]:indptr[index + 1]]
+                                if headless.collide_circle(agent, agents[other_index])]
+            if colliding_agents:
+                collisions[agent] = colliding_agents
+        return collisions
+
     def add_sheep_agents(self):
+        noise = self.get_noise_provider(self.sheep_seeds)
         for i in range(self.n_sheep):
-            x = np.random.uniform(200, 500)#(100,400)
-            y = np.random.uniform(200, 500)#(100,400)
-            orient = np.random.uniform(-np.pi, np.pi) #(0, 2*np.pi)
+            x = self.rng.uniform(200, 500)#(100,400)
+            y = self.rng.uniform(200, 500)#(100,400)
+            orient = self.rng.uniform(-np.pi, np.pi) #(0, 2*np.pi)
             # print(x, y, orient)
             sheep_agent = Sheep_Agent(
                 id="sheep: " + str(i),
@@ -268,17 +394,24 @@ class Loop_Function:
                 target_y = self.Target_y,
                 target_size = self.Target_size,
                 is_antagonistic = self.is_antagonistic,
-                alpha = self.alpha
+                alpha = self.alpha,
+                network_type = self.network_type,
+                with_visualization = self.with_visualization,
+                rng = self.get_agent_rng(noise, i),
+                noise = noise
             )
+            self.register_agent(sheep_agent, self.sheep_registry)
             self.sheep_agents.add(sheep_agent)
 
             self.agents.add(sheep_agent)
 
     def add_shepherd_agent(self):
+        noise = self.get_noise_provider(self.shepherd_seeds)
+        coordination_noise = self.get_noise_provider(self.coordination_seeds)
         for i in range(self.n_shepherd):
-            x = np.random.uniform(0, 200) #(0, 150)
-            y = np.random.uniform(0, 200) #(300, 400)
-            orient = np.random.uniform(-np.pi, np.pi)
+            x = self.rng.uniform(0, 200) #(0, 150)
+            y = self.rng.uniform(0, 200) #(300, 400)
+            orient = self.rng.uniform(-np.pi, np.pi)
             shepherd_agent = Shepherd_Agent(
                 id="shepherd: " + str(i),
                 radius=self.agent_radii,
@@ -295,10 +428,29 @@ class Loop_Function:
                 is_explicit = self.is_explicit,
                 angle_threshold_collection = self.angle_threshold_collection,
                 angle_threshold_drive = self.angle_threshold_drive,
+                with_visualization = self.with_visualization,
+                rng = self.get_agent_rng(noise, i),
+                noise = noise,
+                coordination_noise = coordination_noise
             )
+            self.register_agent(shepherd_agent, self.shepherd_registry)
             self.shepherd_agents.add(shepherd_agent)
             self.agents.add(shepherd_agent)
 
+    def get_noise_provider(self, agent_seeds):
+        """Noise of the agents of agent_seeds drawn in blocks from their own streams in a seeded run, None otherwise"""
+        return None if agent_seeds is None else Noise_Provider([np.random.default_rng(agent_seed)
+                                                                 for agent_seed in agent_seeds])
+
+    def get_agent_rng(self, noise, index):
+        """Random generator of the agent of index in a seeded run, None (the global np.random) otherwise"""
+        return None if noise is None else noise.rngs[index]
+
+    def register_agent(self, agent, registry):
+        """Giving the agent the next integer index of its registry, so that registry[agent.index] is the agent"""
+        agent.index = len(registry)
+        registry.append(agent)
+
     def interact_with_event(self, events):
         """Carry out functionality according to user's interaction"""
 
@@ -459,63 +611,301 @@ class Loop_Function:
                 pygame.draw.circle(image, support.YELLOW, (cx, cy), r, width=3)
             self.screen.blit(image, (0, 0))
 
+    def update_sheep_agents(self):
+        """
+        Updating the sheep agents with the selected engine. The sprites update their field of view, forces and
+        position in one call, profiled together as sheep_agents.
+        """
+        if self.herd_engine is not None:
+            shepherd_x = [shepherd_agent.x for shepherd_agent in self.shepherd_agents]
+            shepherd_y = [shepherd_agent.y for shepherd_agent in self.shepherd_agents]
+            self.herd_engine.update(shepherd_x, shepherd_y, self.profiler)
+        else:
+            if self.profiler is not None:
+                start_time = self.profiler.clock()
+            self.update_interaction_network()
+            self.update_shepherd_neighbors()
+            if self.profiler is not None:
+                start_time = self.profiler.stop("network", start_time)
+            self.update_agents(self.sheep_agents, self.sheep_registry, self.shepherd_registry, self.interaction_network,
+                               self.shepherd_neighbors)
+            if self.profiler is not None:
+                self.profiler.stop("sheep_agents", start_time)
+
+    def get_sheep_arrays(self):
+        """Positions, radii and moving states of the sheep as arrays, read from the herd engine if it is used"""
+        if self.herd_engine is not None:
+            return (self.herd_engine.x, self.herd_engine.y, np.full(self.n_sheep, float(self.agent_radii)),
+                    ~self.herd_engine.is_staying)
+        sheep_agents = self.sheep_registry
+        return (np.array([sheep_agent.x for sheep_agent in sheep_agents]),
+                np.array([sheep_agent.y for sheep_agent in sheep_agents]),
+                np.array([sheep_agent.radius for sheep_agent in sheep_agents], dtype=np.float64),
+                np.array([sheep_agent.state == "moving" for sheep_agent in sheep_agents]))
+
+    def count_moving_sheep(self):
+        if self.herd_engine is not None:
+            return int(np.count_nonzero(~self.herd_engine.is_staying))
+        return sum(1 for sheep_agent in self.sheep_agents if sheep_agent.state == "moving")
+
+    def update_shepherd_agents(self):
+        """Updating the shepherd agents; the vision field of all shepherds is calculated once and shared"""
+        shepherd_agents = self.shepherd_registry
+        # every shepherd is reflected from the boundaries at the beginning of its own update, the vision field is
+        # calculated from these reflected poses
+        shepherd_x, shepherd_y, shepherd_orientation = zip(*[shepherd_agent.get_reflected_pose()
+                                                            for shepherd_agent in shepherd_agents])
+        sheep_x, sheep_y, sheep_radius, sheep_is_moving = self.get_sheep_arrays()
+        self.vision_field = Vision_Field(shepherd_x, shepherd_y, shepherd_orientation,
+                                         [shepherd_agent.target_x for shepherd_agent in shepherd_agents],
+                                         [shepherd_agent.target_y for shepherd_agent in shepherd_agents],
+                                         sheep_x, sheep_y, sheep_radius, sheep_is_moving)
+        self.update_agents(self.shepherd_agents, self.n_sheep, self.sheep_registry, self.shepherd_registry, self.tick,
+                           self.vision_field)
+
+    def update_agents(self, agents, *args):
+        """
+        Updating a group of agents. While the profiler is tracing, the agents are updated one by one with a span per
+        agent holding its state before and after the update.
+        """
+        if self.profiler is None or not self.profiler.is_tracing:
+            agents.update(*args)
+            return
+        start_time = self.profiler.clock()
+        for agent in agents:
+            state = agent.state
+            agent.update(*args)
+            start_time = self.profiler.trace(agent.id, start_time, args={"state_before": state, "state": agent.state})
+
+    def update_interaction_network(self):
+        """Building the interaction network of the whole herd once per tick (CSR indptr/indices)"""
+        points = [(sheep_agent.x, sheep_agent.y) for sheep_agent in self.sheep_registry]
+        att_distance = self.sheep_registry[0].att_distance
+        self.interaction_network = build_interaction_network(points, self.network_type, att_distance)
+
+    def update_shepherd_neighbors(self):
+        """Shepherds around every sheep (CSR indptr/indices), found once per tick for the whole herd"""
+        sheep_agents = self.sheep_registry
+        # before its shepherd forces a sheep is reflected from the walls/fence, moving at most v_max * tick_time + 1
+        # pixel per axis from its position at the beginning of the tick; the candidates are taken with this margin
+        margin = 2 * (sheep_agents[0].v_max * sheep_agents[0].tick_time + 1)
+        distance = sheep_agents[0].safe_distance + margin
+        self.shepherd_neighbors = find_close_points([(sheep_agent.x, sheep_agent.y) for sheep_agent in sheep_agents],
+                                                    [(shepherd_agent.x, shepherd_agent.y)
+                                                     for shepherd_agent in self.shepherd_registry], distance)
+
     def load_robot_state(self, robot_file):
         with open(robot_file) as f:
             robot_data = json.load(f)
         return robot_data
 
-    def save_shepherd_agents_data(self):
-        shepherd_agents_data = []
-        for shepherd_agent in self.shepherd_agents:
-            agent_data = {"tick": self.tick,
-                           "ID": shepherd_agent.id[10:],
-                           "x": float("{:.2f}".format(shepherd_agent.x)),
-                           "y": float("{:.2f}".format(shepherd_agent.y)),
-                           "heading_direction": float("{:.2f}".format(shepherd_agent.orientation)),
-                           "approach_sheep_id": int(shepherd_agent.approach_agent_id),
-                           "MODE": float("{:.2f}".format(shepherd_agent.state)),
-                           "Coll_threshold": float("{:.4f}".format(shepherd_agent.Angle_Threshold_Collection)),
-                           "Drive_threshold": float("{:.4f}".format(shepherd_agent.Angle_Threshold_Drive)),
-                           }
-            shepherd_agents_data.append(agent_data)
+    def get_run_parameters(self):
+        """Parameters of the run, saved in the header of the columnar data"""
+        return {"N_sheep": self.n_sheep, "N_shepherd": self.n_shepherd, "Time": self.Time,
+                "width": self.WIDTH, "height": self.HEIGHT, "target_place_x": self.Target_x,
+                "target_place_y": self.Target_y, "target_size": self.Target_size, "L3": self.L3,
+                "uncomfortable_distance": self.uncomfortable_distance, "is_explicit": self.is_explicit,
+                "is_antagonistic": self.is_antagonistic, "alpha": float(self.alpha),
+                "angle_threshold_collection": float(self.angle_threshold_collection),
+                "angle_threshold_drive": float(self.angle_threshold_drive),
+                "network_type": self.network_type, "engine": self.engine, "seed": self.seed,
+                "stall_window": self.stall_window}
+
+    def get_output_folder(self):
         # try to save at different folder path
-        out_dir = os.environ.get("OUTPUT_DIR", "results/default")
+        return self.output_folder or os.environ.get("OUTPUT_DIR", "results/default")
+
+    def open_trajectory_writer(self, agent_type, n_agents):
+        """Writer of the saved data of agent_type ("sheep" or "shepherd") in the selected data format"""
+        out_dir = self.get_output_folder()
         os.makedirs(out_dir, exist_ok=True)
-        # file_name = "shepherd_" + str(self.n_shepherd)+"_data.json"
-        file_name = "shepherd_data.json"
-        filepath = os.path.join(out_dir, file_name)
-        # be careful when it is paused or killed, the save should have been saved already, check the time line!
-        with open(filepath, "a") as outfile:
-            json.dump(shepherd_agents_data, outfile)
-            outfile.write("\n")
-        return
+        if self.data_format == "columnar":
+            columns = SHEEP_COLUMNS if agent_type == "sheep" else SHEPHERD_COLUMNS
+            # a resumed run continues the files cut back to its checkpoint
+            writer = Columnar_Writer(os.path.join(out_dir, agent_type + "_data"), n_agents, columns,
+                                     self.get_run_parameters(), is_appending=self.is_resumed)
+        else:
+            fields = SHEEP_FIELDS if agent_type == "sheep" else SHEPHERD_FIELDS
+            writer = Trajectory_Writer(os.path.join(out_dir, agent_type + "_data.json"), n_agents, fields)
+        writer.profiler = self.profiler
+        return writer
+
+    def save_shepherd_agents_data(self):
+        if self.shepherd_writer is None:
+            self.shepherd_writer = self.open_trajectory_writer("shepherd", self.n_shepherd)
+        shepherd_agents = self.shepherd_registry
+        self.shepherd_writer.add_tick(self.tick,
+                                      [shepherd_agent.x for shepherd_agent in shepherd_agents],
+                                      [shepherd_agent.y for shepherd_agent in shepherd_agents],
+                                      [shepherd_agent.orientation for shepherd_agent in shepherd_agents],
+                                      [int(shepherd_agent.approach_agent_id) for shepherd_agent in shepherd_agents],
+                                      [shepherd_agent.state for shepherd_agent in shepherd_agents],
+                                      [shepherd_agent.Angle_Threshold_Collection for shepherd_agent in shepherd_agents],
+                                      [shepherd_agent.Angle_Threshold_Drive for shepherd_agent in shepherd_agents])
 
     def save_sheep_agents_data(self):
-        sheep_agents_data = []
-        for sheep_agent in self.sheep_agents:
-            agent_data = {"tick": self.tick,
-                           "ID": sheep_agent.id[7:],
-                           "x": float("{:.2f}".format(sheep_agent.x)),
-                           "y": float("{:.2f}".format(sheep_agent.y)),
-                           "heading_direction": float("{:.2f}".format(sheep_agent.orientation)),
-                           "state:": sheep_agent.state,
-                           }
-            sheep_agents_data.append(agent_data)
-        # try to save at different folder path
-        out_dir = os.environ.get("OUTPUT_DIR", "results/default")
-        os.makedirs(out_dir, exist_ok=True)
-        # file_name = "sheep_"+ str(self.n_sheep)+"_data.json"
-        file_name = "sheep_data.json"
-        filepath = os.path.join(out_dir, file_name)
-        # be careful when it is paused or killed, the save should have been saved already, check the time line!
-        with open(filepath, "a") as outfile:
-        #with open("sheep_agent_data.json", "a") as outfile:
-            json.dump(sheep_agents_data, outfile)
-            outfile.write("\n")
+        if self.sheep_writer is None:
+            self.sheep_writer = self.open_trajectory_writer("sheep", self.n_sheep)
+        if self.herd_engine is not None:
+            # the arrays of the engine are saved directly, without syncing the sprites
+            self.sheep_writer.add_tick(self.tick, self.herd_engine.x, self.herd_engine.y, self.herd_engine.orientation,
+                                       ~self.herd_engine.is_staying)
+            return
+        sheep_agents = self.sheep_registry
+        self.sheep_writer.add_tick(self.tick,
+                                   [sheep_agent.x for sheep_agent in sheep_agents],
+                                   [sheep_agent.y for sheep_agent in sheep_agents],
+                                   [sheep_agent.orientation for sheep_agent in sheep_agents],
+                                   [sheep_agent.state == "moving" for sheep_agent in sheep_agents])
+
+    def record_shepherd_modes(self):
+        """Counting the shepherds in drive mode and the ticks with both modes at the current tick"""
+        shepherd_modes = [shepherd_agent.state for shepherd_agent in self.shepherd_registry]
+        n_drive = shepherd_modes.count(1.0)
+        self.n_drive_mode_ticks += n_drive
+        self.is_mixed_mode = 0 < n_drive < self.n_shepherd
+        self.n_mixed_mode_ticks += self.is_mixed_mode
+        if self.stall_detector is not None:
+            self.stall_detector.record_modes(shepherd_modes)
+
+    def get_run_summary(self, wall_time):
+        """Summary of the run, see results_catalog"""
+        last_tick = self.tick - 1
+        n_shepherd_ticks = self.tick * self.n_shepherd
+        drive_fraction = self.n_drive_mode_ticks / n_shepherd_ticks if n_shepherd_ticks else 0.0
+        # the coordination of the analysis scripts counts the ticks before the last saved tick
+        n_mixed_mode_ticks = self.n_mixed_mode_ticks - self.is_mixed_mode
+        is_herded = self.count_moving_sheep() == 0
+        return {"parameters": self.get_run_parameters(),
+                "final_tick": self.tick,
+                "last_tick": last_tick,  # tick of the last saved row, sheep_data[-1]["tick"]
+                "is_herded": is_herded,
+                "status": "herded" if is_herded else "stalled" if self.is_stalled else "time_limit",
+                "stall": self.stall_detector.get_summary() if self.is_stalled else None,
+                "wall_time": wall_time,
+                "coordination_percentage": n_mixed_mode_ticks / last_tick if last_tick > 0 else 0.0,
+                "drive_fraction": drive_fraction,
+                "collect_fraction": 1.0 - drive_fraction,
+                "fork_tick": self.fork_tick}
+
+    def close_trajectory_writers(self):
+        """Writing the buffered ticks of the saved data"""
+        for writer in (self.sheep_writer, self.shepherd_writer):
+            if writer is not None:
+                writer.close()
+        self.sheep_writer = None
+        self.shepherd_writer = None
+
+    def get_checkpoint_path(self):
+        return os.path.join(self.get_output_folder(), CHECKPOINT_FILE)
+
+    def save_checkpoint(self, wall_time):
+        """Writing the complete state of the run at the current tick to the checkpoint file"""
+        file_sizes = {}
+        for writer in (self.sheep_writer, self.shepherd_writer):
+            if writer is not None:
+                writer.sync()
+                file_sizes.update({os.path.relpath(path, self.get_output_folder()): size
+                                   for path, size in writer.get_file_sizes().items()})
+        # the global np.random of unseeded runs is saved on its own, agents keep None in place of it
+        state = {"parameters": self.get_run_parameters(),
+                 "tick": self.tick,
+                 "wall_time": wall_time,
+                 "shepherd_modes": (self.n_mixed_mode_ticks, self.n_drive_mode_ticks, self.is_mixed_mode),
+                 "sheep": [dict(agent.__dict__, rng=None if agent.rng is np.random else agent.rng)
+                           for agent in self.sheep_registry],
+                 "shepherds": [dict(agent.__dict__, rng=None if agent.rng is np.random else agent.rng)
+                               for agent in self.shepherd_registry],
+                 "herd_engine": None if self.herd_engine is None else self.herd_engine.__dict__,
+                 "stall_detector": None if self.stall_detector is None else self.stall_detector.__dict__,
+                 "rng": None if self.rng is np.random else self.rng,
+                 "global_random_state": np.random.get_state(),
+                 "file_sizes": file_sizes}
+        write_checkpoint(self.get_checkpoint_path(), state)
+
+    def restore_checkpoint(self, state):
+        """Restoring the state of the run saved in a checkpoint"""
+        self.tick = state["tick"]
+        self.elapsed_time = state["wall_time"]
+        self.n_mixed_mode_ticks, self.n_drive_mode_ticks, self.is_mixed_mode = state["shepherd_modes"]
+        for agents, agent_states in ((self.sheep_registry, state["sheep"]),
+                                     (self.shepherd_registry, state["shepherds"])):
+            for agent, agent_state in zip(agents, agent_states):
+                agent.__dict__.update(agent_state)
+                if agent.rng is None:
+                    agent.rng = np.random
+        if self.herd_engine is not None:
+            self.herd_engine.__dict__.update(state["herd_engine"])
+        if self.stall_detector is not None:
+            self.stall_detector.__dict__.update(state["stall_detector"])
+        self.rng = np.random if state["rng"] is None else state["rng"]
+        np.random.set_state(state["global_random_state"])
+
+    def resume_from_checkpoint(self):
+        """
+        Continuing the run from the checkpoint in the output folder: the state of the run is restored and the saved
+        data are cut back to the checkpoint tick. Called before start, on a loop function created with the same
+        parameters as the checkpointed run.
 
-        return
+        :return: True if the run was resumed, False if there is no checkpoint and the run starts from the beginning
+        """
+        state = read_checkpoint(self.get_checkpoint_path())
+        if state is None:
+            return False
+        if state["parameters"] != self.get_run_parameters():
+            raise ValueError(f"The checkpoint {self.get_checkpoint_path()} was written by a run with other parameters")
+        self.restore_checkpoint(state)
+        truncate_files(self.get_output_folder(), state["file_sizes"])
+        self.is_resumed = True
+        return True
+
+    def fork_from_checkpoint(self, checkpoint_path):
+        """
+        Continuing the checkpoint of another run with the parameters of this run, see main_ensemble.py. The run takes
+        over the state and the saved data of the other run up to its checkpoint, then only the FORK_PARAMETERS of the
+        two runs can differ. Called before start.
 
-    def start(self):
+        :param checkpoint_path: checkpoint file of the other run, e.g. written by start(stop_tick=...)
+        """
+        state = read_checkpoint(checkpoint_path)
+        if state is None:
+            raise FileNotFoundError(f"No checkpoint {checkpoint_path}")
+        parameters = self.get_run_parameters()
+        different_parameters = [key for key, value in state["parameters"].items()
+                                if key not in FORK_PARAMETERS and parameters.get(key) != value]
+        if different_parameters:
+            raise ValueError(f"The checkpoint {checkpoint_path} was written by a run with other {different_parameters}")
+        if state["tick"] >= self.Time:
+            raise ValueError(f"The checkpoint {checkpoint_path} is at tick {state['tick']}, after the end of the run")
+        self.restore_checkpoint(state)
+        self.apply_fork_parameters()
+        copy_files(os.path.dirname(checkpoint_path), self.get_output_folder(), state["file_sizes"])
+        self.is_resumed = True
+        self.fork_tick = self.tick
+
+    def apply_fork_parameters(self):
+        """Setting the FORK_PARAMETERS of this run on the agents restored from the checkpoint of another run"""
+        for sheep_agent in self.sheep_registry:
+            sheep_agent.alpha = self.alpha
+        if self.herd_engine is not None:
+            self.herd_engine.alpha = self.alpha
+        for shepherd_agent in self.shepherd_registry:
+            shepherd_agent.l3 = self.L3
+            shepherd_agent.uncomfortable_distance = self.uncomfortable_distance
+            shepherd_agent.is_explicit = self.is_explicit
+            shepherd_agent.Angle_Threshold_Collection = self.angle_threshold_collection
+            shepherd_agent.Angle_Threshold_Drive = self.angle_threshold_drive
+
+    def start(self, stop_tick=None):
+        """
+        Running the simulation until the herd arrives at the target or the end of the simulation time
+
+        :param stop_tick: tick at which the run is stopped before its end, leaving a checkpoint to fork other runs from
+            (fork_from_checkpoint) instead of finishing it. The run is finished if the herd arrives before.
+        """
+        if stop_tick is not None and self.with_visualization:
+            raise ValueError("Only headless runs can be checkpointed")
+        end_tick = self.Time if stop_tick is None else min(stop_tick, self.Time)
 
         start_time = datetime.now()
         self.last_pause_time = datetime.now()
@@ -524,29 +914,31 @@ class Loop_Function:
 
         # print("Starting main simulation loop!")
         # Main Simulation loop until dedicated simulation time
-        while self.tick < self.Time:
+        profiler = self.profiler
+        while self.tick < end_tick:
+            if profiler is not None:
+                phase_time = profiler.start_tick(self.tick)
 
-            events = pygame.event.get()
-            # Carry out interaction according to user activity
-            self.interact_with_event(events)
+            if self.with_visualization:
+                events = pygame.event.get()
+                # Carry out interaction according to user activity
+                self.interact_with_event(events)
+                if profiler is not None:
+                    phase_time = profiler.stop("events", phase_time)
 
             if not self.is_paused:
 
                 if self.physical_collision_avoidance:
                     # ------ AGENT-AGENT INTERACTION ------
                     # Check if any 2 agents has been collided and reflect them from each other if so
-                    collision_group_aa = pygame.sprite.groupcollide(
-                        self.agents,
-                        self.agents,
-                        False,
-                        False,
-                        within_group_collision
-                    )
+                    collision_group_aa = self.find_agent_collisions()
                     collided_agents = []
                     # Carry out agent-agent collisions and collecting collided agents for later (according to parameters
                     # such as ghost mode, or teleportation)
                     for agent1, agent2 in collision_group_aa.items():
                         self.agent_agent_collision(agent1, agent2)
+                    if profiler is not None:
+                        phase_time = profiler.stop("collision", phase_time)
 
                 #update robot position from external system
                 if self.robot_loop:
@@ -556,15 +948,21 @@ class Loop_Function:
                     # print(robot_data[0], "\n", robot_data[0]["ID"], robot_data[0]["x0"], robot_data[0]["x1"])
 
                     # Updating robot position for shepherd agents
-                    for shepherd_agent in self.shepherd_agents:
-                        # print(shepherd_agent.id, "ID:",shepherd_agent.id[10:], int(shepherd_agent.id[9:]))
-                        if int(shepherd_agent.id[10:]) == int(robot_data[0]["ID"]):
-                            shepherd_agent.x = float(robot_data[0]["x0"])
-                            shepherd_agent.y = float(robot_data[0]["x1"])
+                    robot_index = int(robot_data[0]["ID"])
+                    if 0 <= robot_index < len(self.shepherd_registry):
+                        shepherd_agent = self.shepherd_registry[robot_index]
+                        shepherd_agent.x = float(robot_data[0]["x0"])
+                        shepherd_agent.y = float(robot_data[0]["x1"])
+                    if profiler is not None:
+                        phase_time = profiler.stop("robot_io", phase_time)
 
                 # Update agents
-                self.sheep_agents.update(self.sheep_agents, self.shepherd_agents)
-                self.shepherd_agents.update(self.n_sheep, self.sheep_agents, self.shepherd_agents, self.tick)
+                self.update_sheep_agents()
+                if profiler is not None:
+                    phase_time = profiler.clock()
+                self.update_shepherd_agents()
+                if profiler is not None:
+                    phase_time = profiler.stop("shepherds", phase_time)
 
                 #update drive_point_x,y, robot state
                 if self.robot_loop:
@@ -575,7 +973,7 @@ class Loop_Function:
                         else:
                             Mode = "collecting"
 
-                        robot_state = {"ID": shepherd_agent.id[10:],
+                        robot_state = {"ID": str(shepherd_agent.index),
                                        "drive_point_x": float("{:.2f}".format(shepherd_agent.drive_point_x)),
                                        "drive_point_y": float("{:.2f}".format(shepherd_agent.drive_point_y)),
                                        "TYPE": "shepherd",
@@ -584,16 +982,24 @@ class Loop_Function:
                         virtual_robot_data.append(robot_state)
                     with open("virtual_robot.json", "w") as outfile:
                         json.dump(virtual_robot_data, outfile)
+                    if profiler is not None:
+                        phase_time = profiler.stop("robot_io", phase_time)
+
+                self.record_shepherd_modes()
 
                 # save data
                 if self.is_saving_data:
                     self.save_shepherd_agents_data()
                     self.save_sheep_agents_data()
+                if profiler is not None:
+                    phase_time = profiler.stop("saving", phase_time)
                 # move to next simulation timestep
                 self.tick += 1
 
             # Draw environment and agents
             if self.with_visualization:
+                if self.herd_engine is not None:
+                    self.herd_engine.sync_sprites(self.sheep_agents, is_drawing=True)
                 self.draw_frame()
                 pygame.display.flip()
 
@@ -601,34 +1007,73 @@ class Loop_Function:
             # if self.tick % 100 == 0 or self.tick == 1:
             #     print(f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S.%f')} t={self.tick}")
             #     print(f"Simulation FPS: {self.clock.get_fps()}")
-            self.clock.tick(self.framerate)
+            # headless runs are not capped by the framerate
+            if self.with_visualization:
+                self.clock.tick(self.framerate)
+                if profiler is not None:
+                    phase_time = profiler.stop("rendering", phase_time)
 
-            all_sheep_states = 0.0
-            for sheep_agent in self.sheep_agents:
-                if sheep_agent.state == "moving":
-                    all_sheep_states =  all_sheep_states + 1
+            all_sheep_states = float(self.count_moving_sheep())
             if all_sheep_states == 0.0:
                 end_time = datetime.now()
                 # print("Final tick:", str(self.tick),
                 #       f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S.%f')} Total simulation time: ",
                 #       (end_time - start_time).total_seconds())
 
-                pygame.quit()
                 break
 
+            if self.stall_detector is not None and self.stall_detector.is_due(self.tick):
+                sheep_x, sheep_y, _, sheep_is_moving = self.get_sheep_arrays()
+                herd_distance = calculate_herd_distance(sheep_x, sheep_y, sheep_is_moving, self.Target_x, self.Target_y)
+                if self.stall_detector.check(self.tick, int(all_sheep_states), herd_distance):
+                    self.is_stalled = True
+                    break
+
+            if self.checkpoint_interval and self.tick % self.checkpoint_interval == 0:
+                if profiler is not None:
+                    checkpoint_time = profiler.clock()
+                self.save_checkpoint(self.elapsed_time + (datetime.now() - start_time).total_seconds())
+                if profiler is not None and profiler.is_tracing:
+                    profiler.trace("checkpoint", checkpoint_time, "io")
+
+            if profiler is not None:
+                profiler.stop("checks", phase_time)
+                profiler.end_tick(self.tick)
+
+        if profiler is not None and profiler.tick_times:
+            # the last tick ended with a break
+            profiler.end_tick(self.tick)
+        if self.tick < self.Time and self.count_moving_sheep() > 0 and not self.is_stalled:
+            # stopped at stop_tick, the run is left unfinished in its checkpoint
+            self.save_checkpoint(self.elapsed_time + (datetime.now() - start_time).total_seconds())
+            self.close_trajectory_writers()
+            return
+
+        # headless engine runs never sync the sheep sprites during the run, leaving them up to date after it
+        if self.herd_engine is not None:
+            self.herd_engine.sync_sprites(self.sheep_agents)
+        self.close_trajectory_writers()
+
         end_time = datetime.now()
+        # a resumed run also counts the wall time before its checkpoint
+        wall_time = self.elapsed_time + (end_time - start_time).total_seconds()
+        if self.is_stalled:
+            print(f"Stalled: no progress of the herd since tick {self.stall_detector.progress_tick}")
         print("Final tick:", str(self.tick), f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S.%f')} Total simulation time: ",
-              (end_time - start_time).total_seconds())
-
-        pygame.quit()
+              wall_time)
+        if self.is_saving_data:
+            write_summary(self.get_output_folder(), self.get_run_summary(wall_time))
+        if profiler is not None:
+            profiler.print_report()
+            profiler.save_report(self.get_output_folder())
+            if profiler.trace_ticks is not None:
+                profiler.save_trace(self.get_output_folder())
+        if self.checkpoint_interval:
+            remove_checkpoint(self.get_checkpoint_path())
 
+        if self.with_visualization:
+            pygame.quit()
 
-def within_group_collision(sprite1, sprite2):
-    """Custom colllision check that omits collisions of sprite with itself. This way we can use group collision
-    detect WITHIN a single group instead of between multiple groups"""
-    if sprite1 != sprite2:
-        return pygame.sprite.collide_circle(sprite1, sprite2)
-    return False
 
 
 def overlap(sprite1, sprite2):
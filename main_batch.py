@@ -0,0 +1,87 @@
+"""
+main_batch.py : phase diagram of the collect/drive thresholds with the batched engine. All the (coll_angle, drive_angle,
+            repetition) runs of run_phase.sh are simulated as a few vectorized batches in one process, and the mean
+            final ticks are written as map_data_Nh_<N_shepherd>_Ns_<N_sheep>_rep_<rep>.json, the same file as
+            generate_map_data.generate_map_json_data.
+
+    python main_batch.py 1 100 50000 3 --batch_size 100
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from batch_engine import Batch_Engine
+
+parser = argparse.ArgumentParser()
+parser.add_argument("n_shepherd", type=int)
+parser.add_argument("n_sheep", type=int)
+parser.add_argument("iterations", type=int)
+parser.add_argument("repetition", type=int)  # number of repetitions of every cell
+parser.add_argument("--coll_angles", type=int, nargs="+", default=list(range(30, 121, 10)))  # degree
+parser.add_argument("--drive_angles", type=int, nargs="+", default=list(range(0, 91, 10)))  # degree
+parser.add_argument("--batch_size", type=int, default=100)  # replicates simulated at once
+parser.add_argument("--seed", type=int, default=None)  # every batch draws from its own stream (seed, first run)
+args = parser.parse_args()
+
+Target_place_x = 800
+Target_place_y = 800
+Target_size = 200
+Boundary_x = Target_place_x + Target_size
+Boundary_y = Target_place_y + Target_size
+
+L3 = 100   # minimum repulsion distance with other shepherds;
+Uncomfortable_distance = 500
+Is_Explicit = False
+Is_Antagonistic = False #True
+Alpha = 0 #np.pi/6 #5 4 3
+
+# every replicate of the phase diagram, in the order of the rows (coll) and columns (drive) of the map
+runs = [(coll_angle, drive_angle) for coll_angle in args.coll_angles for drive_angle in args.drive_angles
+        for _ in range(args.repetition)]
+final_ticks = []
+start_time = datetime.now()
+for start in range(0, len(runs), args.batch_size):
+    batch = np.array(runs[start:start + args.batch_size], dtype=np.float64)
+    batch_engine = Batch_Engine(len(batch),
+                                N_sheep=args.n_sheep,
+                                N_shepherd=args.n_shepherd,
+                                width=Boundary_x,
+                                height=Boundary_y,
+                                target_place_x=Target_place_x,
+                                target_place_y=Target_place_y,
+                                target_size=Target_size,
+                                window_pad=30,
+                                agent_radius=10,
+                                L3=L3,
+                                uncomfortable_distance=Uncomfortable_distance,
+                                is_explicit=Is_Explicit,
+                                is_antagonistic=Is_Antagonistic,
+                                alpha=Alpha,
+                                angle_threshold_collection=np.round(batch[:, 0] / 180 * np.pi, 3),
+                                angle_threshold_drive=np.round(batch[:, 1] / 180 * np.pi, 3),
+                                seed=None if args.seed is None else [args.seed, start])
+    final_ticks.extend(batch_engine.run(args.iterations).tolist())
+    print(f"runs {len(final_ticks)}/{len(runs)} done, total simulation time:",
+          (datetime.now() - start_time).total_seconds())
+
+# the map holds the last saved tick of sheep_data.json, one tick before the final tick
+last_ticks = np.array(final_ticks).reshape(len(args.coll_angles), len(args.drive_angles), args.repetition) - 1
+map = np.mean(last_ticks, axis=-1)
+
+json_file_name = os.path.join(os.environ.get("OUTPUT_DIR", "."), "map_data_" + "Nh_" + str(args.n_shepherd) + "_Ns_" +
+                              str(args.n_sheep) + "_rep_" + str(args.repetition) + ".json")
+with open(json_file_name, 'a') as f:
+    for map_data in map:
+        json.dump(map_data.tolist(), f)
+        f.write("\n")
+    json.dump("Raw:", f)
+    json.dump(args.drive_angles, f)
+    f.write("\n")
+    json.dump("Line:", f)
+    json.dump(args.coll_angles, f)
+    f.write("\n")
+    json.dump("N_sheep=" + str(args.n_sheep), f)
+    f.write("\n")
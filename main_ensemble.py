@@ -0,0 +1,128 @@
+"""
+main_ensemble.py : ensemble of runs forked from a common warm-up. The herd is simulated once with the warm-up
+            thresholds until the fork tick and its complete state is saved as a checkpoint (checkpoint.py), then every
+            member of the ensemble continues it with its own collect/drive thresholds (and alpha of antagonistic
+            sheep) on a pool of worker processes. The members start from the same herd and the same random streams,
+            so the differences between them come from their parameters only (common random numbers).
+
+    OUTPUT_DIR=results_ensemble python main_ensemble.py 1 100 50000 2000 --coll_angles 30 60 90 --drive_angles 0 30
+
+    The warm-up is saved in <OUTPUT_DIR>/warm_up and every member in <OUTPUT_DIR>/coll_<coll>/drive_<drive>, or
+    .../drive_<drive>/alpha_<alpha> with --alphas, holding the whole run from tick 0 like the runs of the main scripts.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from checkpoint import CHECKPOINT_FILE
+from loop_function import Loop_Function
+from result_cache import clear_outputs
+
+Target_place_x = 800
+Target_place_y = 800
+Target_size = 200
+Boundary_x = Target_place_x + Target_size
+Boundary_y = Target_place_y + Target_size
+
+L3 = 100   # minimum repulsion distance with other shepherds;
+Uncomfortable_distance = 500
+Is_Explicit = False
+
+
+def get_parameters(args, coll_angle, drive_angle, alpha):
+    """Parameters of the Loop_Function of one run of the ensemble, angles in degree"""
+    return dict(N_sheep=args.n_sheep,
+                N_shepherd=args.n_shepherd,
+                Time=args.iterations,
+                width=Boundary_x,
+                height=Boundary_y,
+                target_place_x=Target_place_x,
+                target_place_y=Target_place_y,
+                target_size=Target_size,
+                window_pad=30,
+                with_visualization=False,
+                agent_radius=10,
+                L3=L3,
+                uncomfortable_distance=Uncomfortable_distance,
+                is_explicit=Is_Explicit,
+                is_saving_data=True,
+                is_antagonistic=args.alphas is not None,
+                alpha=alpha,
+                angle_threshold_collection=round(coll_angle / 180 * np.pi, 3),
+                angle_threshold_drive=round(drive_angle / 180 * np.pi, 3),
+                engine=args.engine,
+                seed=args.seed,
+                stall_window=args.stall_window or None)
+
+
+def get_members(args, base_output):
+    """(parameters, output folder) of every member of the ensemble"""
+    members = []
+    for coll_angle in args.coll_angles:
+        for drive_angle in args.drive_angles:
+            for alpha in (args.alphas or [args.warm_up_alpha]):
+                output_folder = os.path.join(base_output, f"coll_{coll_angle}", f"drive_{drive_angle}")
+                if args.alphas is not None:
+                    output_folder = os.path.join(output_folder, f"alpha_{alpha}")
+                members.append((get_parameters(args, coll_angle, drive_angle, alpha), output_folder))
+    return members
+
+
+def run_warm_up(parameters, output_folder, fork_tick):
+    """
+    Simulating the common part of the ensemble until fork_tick
+
+    :return: path of the checkpoint at fork_tick, None if the run ended before (herd penned or stalled)
+    """
+    clear_outputs(output_folder)
+    loop_function = Loop_Function(**parameters, output_folder=output_folder)
+    loop_function.start(stop_tick=fork_tick)
+    checkpoint_path = os.path.join(output_folder, CHECKPOINT_FILE)
+    return checkpoint_path if os.path.isfile(checkpoint_path) else None
+
+
+def run_member(checkpoint_path, parameters, output_folder):
+    """Continuing the warm-up with the parameters of one member, returning its final tick"""
+    clear_outputs(output_folder)
+    loop_function = Loop_Function(**parameters, output_folder=output_folder)
+    loop_function.fork_from_checkpoint(checkpoint_path)
+    loop_function.start()
+    return loop_function.tick
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("n_shepherd", type=int)
+    parser.add_argument("n_sheep", type=int)
+    parser.add_argument("iterations", type=int)
+    parser.add_argument("fork_tick", type=int)  # end of the warm-up
+    parser.add_argument("--coll_angles", type=int, nargs="+", default=[90])  # degree
+    parser.add_argument("--drive_angles", type=int, nargs="+", default=[30])  # degree
+    parser.add_argument("--alphas", type=float, nargs="+", default=None)  # antagonistic sheep if given
+    parser.add_argument("--warm_up_coll_angle", type=int, default=90)  # degree
+    parser.add_argument("--warm_up_drive_angle", type=int, default=30)  # degree
+    parser.add_argument("--warm_up_alpha", type=float, default=np.pi / 6)
+    parser.add_argument("--engine", default="sprite")
+    parser.add_argument("--seed", type=int, default=None)  # seed of the random streams of the warm-up
+    parser.add_argument("--stall_window", type=int, default=0)  # ticks without progress before stopping, 0: never
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    base_output = os.environ.get("OUTPUT_DIR", "results/ensemble")
+    start_time = datetime.now()
+    checkpoint_path = run_warm_up(get_parameters(args, args.warm_up_coll_angle, args.warm_up_drive_angle,
+                                                 args.warm_up_alpha),
+                                  os.path.join(base_output, "warm_up"), args.fork_tick)
+    if checkpoint_path is None:
+        raise SystemExit(f"The warm-up ended before the fork tick {args.fork_tick}, nothing to fork")
+    print("Warm-up done, total simulation time:", (datetime.now() - start_time).total_seconds(), flush=True)
+
+    members = get_members(args, base_output)
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(members))) as executor:
+        futures = {executor.submit(run_member, checkpoint_path, *member): member for member in members}
+        for n_done, future in enumerate(as_completed(futures), 1):
+            print(f"[{n_done}/{len(members)}] final tick {future.result()} {futures[future][1]}", flush=True)
+    print(f"Finished {len(members)} members in {(datetime.now() - start_time).total_seconds():.1f} s")
@@ -9,6 +9,12 @@ parser.add_argument("n_shepherd", type=int)
 parser.add_argument("iterations", type=int)
 parser.add_argument("l3", type=int)
 parser.add_argument("repetition", type=int)
+parser.add_argument("--seed", type=int, default=None)  # seed of the random streams of the run
+parser.add_argument("--checkpoint_interval", type=int, default=0)  # ticks between checkpoints, 0: none
+parser.add_argument("--resume", action="store_true")  # continue from the checkpoint in OUTPUT_DIR
+parser.add_argument("--stall_window", type=int, default=0)  # ticks without progress before stopping, 0: never
+parser.add_argument("--profile_interval", type=int, default=0)  # ticks between profile prints, 0: no profiling
+parser.add_argument("--trace_ticks", type=int, nargs=2, default=None)  # first and last tick saved to trace.json
 args = parser.parse_args()
 
 Target_place_x = 800
@@ -57,6 +63,13 @@ loop_function = Loop_Function(N_sheep=args.n_sheep,
                               is_antagonistic = Is_Antagonistic,
                               alpha = Alpha,
                               angle_threshold_collection = Coll_threshold,
-                              angle_threshold_drive = Drive_threshold)
+                              angle_threshold_drive = Drive_threshold,
+                              seed = args.seed,
+                              checkpoint_interval = None if Is_Visualized else args.checkpoint_interval or None,
+                              stall_window = args.stall_window or None,
+                              profile_interval = args.profile_interval or None,
+                              trace_ticks = args.trace_ticks)
 
+if args.resume:
+    loop_function.resume_from_checkpoint()
 loop_function.start()
@@ -1,31 +1,8 @@
 import numpy as np
 import os
 import matplotlib.pyplot as plt
-import json
-# from data_analysis.read_json_file import read_json_file
 
-def read_json_file(file_path):
-    # print(f"Reading: {file_path}")
-    all_data = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Read line by line
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        # Each line should be a JSON array
-                        tick_data = json.loads(line)
-                        all_data.extend(tick_data)
-                        #print(f"Line {line_num}: Added {len(tick_data)} records from tick {tick_data[0]['tick']}")
-                    except json.JSONDecodeError:
-                        print(f"✗ Could not parse line {line_num}: {line[:50]}...")
-        print(f"✓ Data covers ticks: {min(d['tick'] for d in all_data)} to {max(d['tick'] for d in all_data)}")
-        f.close()
-    except Exception as e:
-        print(f"✗ Error: {type(e).__name__}: {e}")
-
-    return all_data
+from results_catalog import load_catalog
 
 combinations = [
     {'marker': 'o', 'color': 'lightcoral', 'markersize': 10},
@@ -40,6 +17,8 @@ combinations = [
 data_folder_path = "/mnt/data3/Yating_Data/results/basic/implicit"
 # data_folder_path = "/mnt/data3/Yating_Data/results/basic/explicit"
 # data_folder_path = '/mnt/DATA/yating/results/basic/implicit'
+# summaries of all the runs, built from the results tree (is_using_saved=True reads the saved catalog if up to date)
+catalog = load_catalog(data_folder_path)
 for L3 in [0, 50, 100, 150]:
     plt.figure(figsize=(12, 8))
     for N_shepherd in range(1, 6):
@@ -50,14 +29,8 @@ for L3 in [0, 50, 100, 150]:
         y_means = []
         y_stds = []
         for N_sheep in [40, 80, 120, 160]:
-            ticks = []
-            for rep in range(1, 10):
-                file_path = f"{data_folder_path}/L3_{L3}/N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/sheep_data.json"
-                if os.path.exists(file_path):
-                    sheep_data = read_json_file(file_path)
-                    if sheep_data:
-                        ticks.append(sheep_data[-1]["tick"])
-            if ticks:
+            ticks = catalog.column("last_tick", L3=L3, N_shepherd=N_shepherd, N_sheep=N_sheep, rep=range(1, 10))
+            if len(ticks):
                 x_values.append(N_sheep)
                 y_means.append(np.mean(ticks))
                 y_stds.append(np.std(ticks))
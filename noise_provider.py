@@ -0,0 +1,43 @@
+"""
+noise_provider.py : standard normal noise of a group of agents in a seeded run, drawn block_ticks values at a time from
+            the own stream of every agent instead of one scalar call per agent and per tick. The block of an agent is
+            the continuation of its stream, so the noise does not depend on block_ticks, on the engine updating the
+            agents nor on the order of their updates: the sprites draw their value with draw(index), the herd engine
+            the values of the whole herd with draw_all().
+"""
+import numpy as np
+
+
+class Noise_Provider:
+    def __init__(self, rngs, block_ticks=256):
+        """
+        :param rngs: random generator of every agent, rngs[i] being the stream of the agent of index i
+        :param block_ticks: values drawn at once from the stream of an agent
+        """
+        self.rngs = rngs
+        self.block_ticks = block_ticks
+        self.block = np.empty((block_ticks, len(rngs)))  # column i holds the next values of the agent of index i
+        self.cursor = [block_ticks] * len(rngs)  # row of the next value of every agent, drawn when at the end
+        self.agent_indices = np.arange(len(rngs))
+
+    def refill(self, index):
+        self.block[:, index] = self.rngs[index].standard_normal(self.block_ticks)
+        self.cursor[index] = 0
+
+    def draw(self, index):
+        """Next value of the agent of index, as a python float like Generator.normal"""
+        row = self.cursor[index]
+        if row == self.block_ticks:
+            self.refill(index)
+            row = 0
+        self.cursor[index] = row + 1
+        return self.block.item(row, index)
+
+    def draw_all(self):
+        """Next value of every agent"""
+        cursor = np.array(self.cursor)
+        for index in np.flatnonzero(cursor == self.block_ticks):
+            self.refill(index)
+            cursor[index] = 0
+        self.cursor = (cursor + 1).tolist()
+        return self.block[cursor, self.agent_indices]
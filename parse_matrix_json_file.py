@@ -3,7 +3,6 @@ import re
 import numpy as np
 import os
 import matplotlib.pyplot as plt
-from  read_json_file import read_json_file
 import json
 import seaborn as sns
 import pandas as pd
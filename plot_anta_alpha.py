@@ -1,30 +1,10 @@
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 import json
 import os
 
-def read_json_file(file_path):
-    # print(f"Reading: {file_path}")
-    all_data = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Read line by line
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        # Each line should be a JSON array
-                        tick_data = json.loads(line)
-                        all_data.extend(tick_data)
-                        #print(f"Line {line_num}: Added {len(tick_data)} records from tick {tick_data[0]['tick']}")
-                    except json.JSONDecodeError:
-                        print(f"✗ Could not parse line {line_num}: {line[:50]}...")
-        print(f"✓ Data covers ticks: {min(d['tick'] for d in all_data)} to {max(d['tick'] for d in all_data)}")
-        f.close()
-    except Exception as e:
-        print(f"✗ Error: {type(e).__name__}: {e}")
-
-    return all_data
+from results_catalog import get_last_ticks
 
 
 def save_data(data, file_name, data_path):
@@ -38,28 +18,34 @@ def save_data(data, file_name, data_path):
     return
 
 
-def transfer_data_to_json(Data_folder_path):
+def get_alpha_folder_name(alpha):
+    Alpha = round(alpha*3.14/180, 3) # transfer to radius degree
+    folder_name = str(Alpha)
+    if alpha == 0: folder_name = "0.000"
+    if alpha == 90: folder_name = "1.570"
+    return folder_name
+
+
+def get_alpha_ticks(Data_folder_path, alphas, N_shepherds, N_sheep, reps, workers=None):
+    """
+    Last ticks of all the runs read by a pool of processes, as an array of shape (alphas, N_shepherds, reps) with nan
+    for the missing runs
+    """
+    run_folders = [f"{Data_folder_path}Alpha_{get_alpha_folder_name(alpha)}/N_shepherd_{N_shepherd}/"
+                   f"N_sheep_{N_sheep}/rep_{rep}"
+                   for alpha in alphas for N_shepherd in N_shepherds for rep in reps]
+    return get_last_ticks(run_folders, workers).reshape(len(alphas), len(N_shepherds), len(reps))
+
+
+def transfer_data_to_json(Data_folder_path, workers=None):
     N_sheep = 100
     alphas = [index for index in range(0, 50, 10)]
+    ticks = get_alpha_ticks(Data_folder_path, alphas, range(1, 6), N_sheep, range(1, 11), workers)
     alpha_ticks = []
-    for alpha in alphas:
-        Alpha = round(alpha*3.14/180, 3) # transfer to radius degree
-        folder_name = str(Alpha)
-        if alpha == 0: folder_name = "0.000"
-        if alpha == 90: folder_name = "1.570"
+    for alpha_index in range(len(alphas)):
         Nh_ticks = []
-        for N_shepherd in range(1, 6):
-            data_folder_path = Data_folder_path + "Alpha_" + folder_name + "/N_shepherd_" + str(N_shepherd) + "/N_sheep_" + str(N_sheep) + "/"
-            ticks = []
-            for rep in [index for index in range(1,11)]:
-                for rep in range(1, 11):
-                    file_path = f"{data_folder_path}rep_{rep}/sheep_data.json"
-                    # print(file_path)
-                    if os.path.exists(file_path):
-                        sheep_data = read_json_file(file_path)
-                        if sheep_data:
-                            ticks.append(sheep_data[-1]["tick"])
-            Nh_ticks.append(np.mean(ticks))
+        for Nh_ticks_reps in ticks[alpha_index]:
+            Nh_ticks.append(float(np.mean(Nh_ticks_reps[~np.isnan(Nh_ticks_reps)])))
         alpha_ticks.append(Nh_ticks)
     json_file_name = "All_Mean_"+"Alpha_" + str(40) + "Ns_" + str(N_sheep) + "Rep_" + str(10) + ".json"
     save_data(alpha_ticks, json_file_name, Data_folder_path)
@@ -67,75 +53,71 @@ def transfer_data_to_json(Data_folder_path):
 
 
 
-# transfer_data_to_json(data_folder_path)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())  # processes reading the runs
+    args = parser.parse_args()
 
-N_sheep = 100
-N_shepherd = 5
-combinations = [
-    {'marker': 'o', 'color': 'lightcoral', 'markersize': 10},
-    {'marker': 's', 'color': 'skyblue', 'markersize': 10},
-    {'marker': '^', 'color': 'lightgreen', 'markersize': 10},
-    {'marker': 'D', 'color': 'gold', 'markersize': 10},
-    {'marker': '*', 'color': 'grey', 'markersize': 10},
-]
-data_folder_path = "/mnt/data3/Yating_Data/results/antagonistic/implicit/" #"/mnt/DATA/yating/results/antagonistic/"
+    # transfer_data_to_json(data_folder_path, args.workers)
 
-plt.figure(figsize=(12, 8))
-marker_index = 0
-for n_shepherd in range(1, N_shepherd+1):
-    # Calculate statistics
-    x_values = []
-    y_means = []
-    y_stds = []
-    y_medias = []
-    marker_style = combinations[marker_index]
+    N_sheep = 100
+    N_shepherd = 5
+    combinations = [
+        {'marker': 'o', 'color': 'lightcoral', 'markersize': 10},
+        {'marker': 's', 'color': 'skyblue', 'markersize': 10},
+        {'marker': '^', 'color': 'lightgreen', 'markersize': 10},
+        {'marker': 'D', 'color': 'gold', 'markersize': 10},
+        {'marker': '*', 'color': 'grey', 'markersize': 10},
+    ]
+    data_folder_path = "/mnt/data3/Yating_Data/results/antagonistic/implicit/" #"/mnt/DATA/yating/results/antagonistic/"
 
     alphas = [index for index in range(0, 50, 10)]
-
-    for alpha in alphas:
-        Alpha = round(alpha*3.14/180, 3) # transfer to radius degree
-        folder_name = str(Alpha)
-        if alpha == 0: folder_name = "0.000"
-        if alpha == 90: folder_name = "1.570"
-        # print("Alpha = ", Alpha)
-        ticks = [] # list of finish time in different repetitions
-        for rep in range(1, 11):
-            file_path = f"{data_folder_path}Alpha_{folder_name}/N_shepherd_{n_shepherd}/N_sheep_{N_sheep}/rep_{rep}/sheep_data.json"
-            # print(file_path)
-            if os.path.exists(file_path):
-                sheep_data = read_json_file(file_path)
-                if sheep_data:
-                    ticks.append(sheep_data[-1]["tick"])
-
-        if ticks:
-            x_values.append(alpha) #or Alpha shown in radius degree
-            y_means.append(np.mean(ticks))
-            y_stds.append(np.std(ticks))
-            y_medias.append(np.median(ticks))
-
-    # Use plt.errorbar which is designed for this
-    plt.errorbar(x_values, y_means, yerr=y_stds,
-                 fmt=marker_style['marker'] + '-',  # Marker with line
-                 color=marker_style['color'],
-                 markersize=10,
-                 capsize=5,
-                 capthick=2,
-                 elinewidth=2,
-                 linewidth=2,
-                 markeredgecolor='grey',
-                 markeredgewidth=0.5,
-                 label=f"N_shepherd = {n_shepherd}",
-                 alpha=0.8)
-    # plt.legend()
-    marker_index = marker_index +1
-
-plt.xlabel('Alpha', fontsize=14)
-plt.ylabel('Mean Final Tick ± Std Dev', fontsize=14)
-plt.title('Implicit strategies'+'Antagonistic Sheep = '+str(N_sheep), fontsize=14)
-plt.xticks(alphas)
-plt.grid(True, alpha=0.3)
-plt.legend(loc='best', ncol=2, fontsize=8)
-
-plt.savefig('Time_and_Alpha_Im_'+'Nh='+str(N_shepherd)+'_Ns='+ str(N_sheep)+'_rep_10.png', dpi=300, bbox_inches='tight')
-# plt.show()
-plt.clf()
\ No newline at end of file
+    # list of finish time in different repetitions of every alpha and n_shepherd
+    all_ticks = get_alpha_ticks(data_folder_path, alphas, range(1, N_shepherd+1), N_sheep, range(1, 11), args.workers)
+
+    plt.figure(figsize=(12, 8))
+    marker_index = 0
+    for n_shepherd in range(1, N_shepherd+1):
+        # Calculate statistics
+        x_values = []
+        y_means = []
+        y_stds = []
+        y_medias = []
+        marker_style = combinations[marker_index]
+
+        for alpha_index, alpha in enumerate(alphas):
+            ticks = all_ticks[alpha_index, n_shepherd - 1]
+            ticks = ticks[~np.isnan(ticks)]
+
+            if ticks.size:
+                x_values.append(alpha) #or Alpha shown in radius degree
+                y_means.append(np.mean(ticks))
+                y_stds.append(np.std(ticks))
+                y_medias.append(np.median(ticks))
+
+        # Use plt.errorbar which is designed for this
+        plt.errorbar(x_values, y_means, yerr=y_stds,
+                     fmt=marker_style['marker'] + '-',  # Marker with line
+                     color=marker_style['color'],
+                     markersize=10,
+                     capsize=5,
+                     capthick=2,
+                     elinewidth=2,
+                     linewidth=2,
+                     markeredgecolor='grey',
+                     markeredgewidth=0.5,
+                     label=f"N_shepherd = {n_shepherd}",
+                     alpha=0.8)
+        # plt.legend()
+        marker_index = marker_index +1
+
+    plt.xlabel('Alpha', fontsize=14)
+    plt.ylabel('Mean Final Tick ± Std Dev', fontsize=14)
+    plt.title('Implicit strategies'+'Antagonistic Sheep = '+str(N_sheep), fontsize=14)
+    plt.xticks(alphas)
+    plt.grid(True, alpha=0.3)
+    plt.legend(loc='best', ncol=2, fontsize=8)
+
+    plt.savefig('Time_and_Alpha_Im_'+'Nh='+str(N_shepherd)+'_Ns='+ str(N_sheep)+'_rep_10.png', dpi=300, bbox_inches='tight')
+    # plt.show()
+    plt.clf()
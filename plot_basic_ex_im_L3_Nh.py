@@ -2,9 +2,10 @@ import numpy as np
 import os
 import matplotlib.pyplot as plt
 
-# import read_json_file
 import json
 
+from results_catalog import get_last_tick
+
 Data_folder_path = "/mnt/data3/Yating_Data/results/basic/"
 #"/home/yateng/Workspace/CAB/data_analysis/Data_is_explicit/"
 
@@ -19,29 +20,6 @@ combinations = [
     {'marker': 'D', 'color': 'grey', "facecolor": "grey", 'markersize': 12}, #L3=150_Ex
 ]
 
-def read_json_file(file_path):
-    print(f"Reading: {file_path}")
-    all_data = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Read line by line
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        # Each line should be a JSON array
-                        tick_data = json.loads(line)
-                        all_data.extend(tick_data)
-                        #print(f"Line {line_num}: Added {len(tick_data)} records from tick {tick_data[0]['tick']}")
-                    except json.JSONDecodeError:
-                        print(f"✗ Could not parse line {line_num}: {line[:50]}...")
-        print(f"✓ Data covers ticks: {min(d['tick'] for d in all_data)} to {max(d['tick'] for d in all_data)}")
-        f.close()
-    except Exception as e:
-        print(f"✗ Error: {type(e).__name__}: {e}")
-
-    return all_data
-
 def save_data(data, file_name, data_path):
     json_file = file_name + ".json"
     json_file_path = os.path.join(data_path, json_file)
@@ -75,12 +53,11 @@ for N_shepherd in [1, 2, 3, 4, 5]:
             for N_sheep in range(40, 200, 40):
                 ticks = []
                 for rep in range(1, 11):
-                    file_path = f"{data_folder_path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/sheep_data.json"
-                    print(file_path)
-                    if os.path.exists(file_path):
-                        sheep_data = read_json_file(file_path)
-                        if sheep_data:
-                            ticks.append(sheep_data[-1]["tick"])
+                    run_folder = f"{data_folder_path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}"
+                    print(run_folder)
+                    last_tick = get_last_tick(run_folder)
+                    if last_tick is not None:
+                        ticks.append(last_tick)
                 final_ticks.append(ticks) #raw: Ns=50, 100, 150, 200
                 if ticks:
                     x_values.append(N_sheep)
@@ -1,51 +1,18 @@
 import math
 import numpy as np
-import json
 import os
 import matplotlib.pyplot as plt
 import math
 
+from results_catalog import get_summary
 
 
-def read_json_file(file_path):
-    print(f"Reading: {file_path}")
-    all_data = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # Read line by line
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        # Each line should be a JSON array
-                        tick_data = json.loads(line)
-                        all_data.extend(tick_data)
-                        #print(f"Line {line_num}: Added {len(tick_data)} records from tick {tick_data[0]['tick']}")
-                    except json.JSONDecodeError:
-                        print(f"✗ Could not parse line {line_num}: {line[:50]}...")
-        print(f"✓ Data covers ticks: {min(d['tick'] for d in all_data)} to {max(d['tick'] for d in all_data)}")
-        f.close()
-    except Exception as e:
-        print(f"✗ Error: {type(e).__name__}: {e}")
-
-    return all_data
-
-
-def Caculte_coordination(shepherd_data):
-    states = []
-    Final_tick = int(shepherd_data[-1]["tick"])
-    N_shepherd = int(shepherd_data[-1]["ID"]) + 1
-    for tick_index in range(0, Final_tick):
-        tick_states = 0
-        for shepherd_index in range(0, N_shepherd):
-            tick_states = tick_states + float(shepherd_data[tick_index * N_shepherd + shepherd_index]["MODE"])
-        if (tick_states == 0) or (tick_states == N_shepherd):   # shepherd state: 1.0 --> drive_mode = true
-            states.append(0)  # non-coorperation
-        else:
-            states.append(1)  # functional-coorperation
-    # print(np.sum(states), Final_tick)
-    coordination_percentage = np.sum(states)/Final_tick
-    return coordination_percentage
+def get_coordination(run_folder):
+    """Coordination percentage of a run, None for runs without sheep or shepherd trajectory (skipped)"""
+    summary = get_summary(run_folder)
+    if summary is None:
+        return None
+    return summary["coordination_percentage"]
 
 
 def plot_shepherd_states_fixed_L3(Is_explicit, L3, Data_Folder_Path):
@@ -64,13 +31,14 @@ def plot_shepherd_states_fixed_L3(Is_explicit, L3, Data_Folder_Path):
         for N_sheep in [40, 80, 120, 160]:
             coordinate_states = []
             for rep in range(1, 11):
-                shepherd_file_path = f"{Data_Folder_Path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/shepherd_data.json"
-                # print(shepherd_file_path)
-                shepherd_data = read_json_file(shepherd_file_path)
-                final_tick = int(shepherd_data[-1]["tick"])
-                coordinate_states.append(Caculte_coordination(shepherd_data))
+                run_folder = f"{Data_Folder_Path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/"
+                # print(run_folder)
+                # fraction of the ticks with the shepherds in both modes
+                coordination = get_coordination(run_folder)
+                if coordination is not None:
+                    coordinate_states.append(coordination)
             # print(N_shepherd, N_sheep, rep, coordination)
-            Coordination.append(np.mean(coordinate_states))
+            Coordination.append(np.mean(coordinate_states) if coordinate_states else np.nan)
 
         X = [40, 80, 120, 160]
         plt.plot(X, Coordination,
@@ -124,13 +92,14 @@ def plot_shepherd_states_fixed_Nh(Is_explicit, N_shepherd, data_folder_path):
         for N_sheep in [40, 80, 120, 160]:
             coordinate_states = []
             for rep in range(1, 11):
-                shepherd_file_path = f"{Data_Folder_Path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/shepherd_data.json"
-                # print(shepherd_file_path)
-                shepherd_data = read_json_file(shepherd_file_path)
-                final_tick = int(shepherd_data[-1]["tick"])
-                coordinate_states.append(Caculte_coordination(shepherd_data))
+                run_folder = f"{Data_Folder_Path}N_shepherd_{N_shepherd}/N_sheep_{N_sheep}/rep_{rep}/"
+                # print(run_folder)
+                # fraction of the ticks with the shepherds in both modes
+                coordination = get_coordination(run_folder)
+                if coordination is not None:
+                    coordinate_states.append(coordination)
             # print(N_shepherd, N_sheep, rep, coordination)
-            Coordination.append(np.mean(coordinate_states))
+            Coordination.append(np.mean(coordinate_states) if coordinate_states else np.nan)
 
         X = [40, 80, 120, 160]
         plt.plot(X, Coordination,
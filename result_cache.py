@@ -0,0 +1,156 @@
+"""
+result_cache.py : content-addressed cache of the seeded runs. A run is keyed by the hash of its main script (name and
+            content), the hashes of the modules of the model it imports, its arguments including --seed and the data
+            format, so the same key always gives the same results. The outputs of a finished run (output.txt,
+            summary.json, trajectories) are stored in <cache folder>/<key[:2]>/<key>/ and hard linked back into the
+            output folder of every later run with the same key, so re-running a sweep or adding grid points never
+            computes a run twice.
+"""
+import ast
+import hashlib
+import json
+import os
+import shutil
+
+from checkpoint import CHECKPOINT_FILE
+from results_catalog import SUMMARY_FILE
+from tick_profiler import PROFILE_FILE, TRACE_FILE
+from trajectory_index import INDEX_SUFFIX
+
+CACHE_VERSION = 2  # increased when the cached runs become invalid for a reason the hashes of the modules miss
+RUN_KEY_FILE = "run_key.json"
+# outputs of a run in its output folder
+OUTPUT_FILES = ("output.txt", SUMMARY_FILE, RUN_KEY_FILE, CHECKPOINT_FILE, PROFILE_FILE, TRACE_FILE,
+                "sheep_data.json", "shepherd_data.json", "sheep_data.json" + INDEX_SUFFIX,
+                "shepherd_data.json" + INDEX_SUFFIX)
+OUTPUT_FOLDERS = ("sheep_data", "shepherd_data")
+
+
+def derive_seed(base_seed, script, arguments):
+    """Seed of one run of a sweep, depending only on the seed of the sweep and on the run itself"""
+    text = json.dumps([base_seed, script, [str(argument) for argument in arguments]])
+    return int(hashlib.sha256(text.encode()).hexdigest()[:15], 16)
+
+
+def hash_file(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_module_hashes(script):
+    """
+    Hashes of the modules next to script that it imports, directly or through other modules, by module name. Imports
+    inside functions are included.
+    """
+    folder = os.path.dirname(os.path.abspath(script))
+    module_hashes = {}
+    paths = [script]
+    while paths:
+        with open(paths.pop()) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module is not None:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = os.path.join(folder, name.split(".")[0] + ".py")
+                if name not in module_hashes and os.path.isfile(module_path):
+                    module_hashes[name] = hash_file(module_path)
+                    paths.append(module_path)
+    return module_hashes
+
+
+def get_run_key(script, arguments, data_format=None):
+    """
+    (key, description) of a run: the sha256 of the description of everything its results depend on
+
+    :param script: path of the main script
+    :param arguments: command line arguments of the script, with the seed
+    :param data_format: format of the saved data, DATA_FORMAT of the environment if None
+    """
+    description = {"version": CACHE_VERSION, "script": os.path.basename(script), "script_hash": hash_file(script),
+                   "module_hashes": get_module_hashes(script),
+                   "arguments": [str(argument) for argument in arguments],
+                   "data_format": data_format or os.environ.get("DATA_FORMAT", "json")}
+    key = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+    return key, description
+
+
+def read_run_key(output_folder):
+    """Key of the run saved in output_folder, None if the folder has no keyed run"""
+    key_path = os.path.join(output_folder, RUN_KEY_FILE)
+    if not os.path.isfile(key_path):
+        return None
+    with open(key_path) as f:
+        return json.load(f)["key"]
+
+
+def write_run_key(output_folder, key, description):
+    with open(os.path.join(output_folder, RUN_KEY_FILE), "w") as f:
+        json.dump({"key": key, **description}, f, indent=1)
+
+
+def clear_outputs(output_folder):
+    """
+    Removing the outputs of a previous run from output_folder. The files are unlinked and never rewritten in place,
+    as they can be hard links into the cache.
+    """
+    for file_name in OUTPUT_FILES:
+        file_path = os.path.join(output_folder, file_name)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+    for folder_name in OUTPUT_FOLDERS:
+        folder_path = os.path.join(output_folder, folder_name)
+        if os.path.isdir(folder_path):
+            shutil.rmtree(folder_path)
+
+
+def link_outputs(source_folder, target_folder):
+    """Hard links of the outputs of a run in target_folder, copies if they are on different file systems"""
+    os.makedirs(target_folder, exist_ok=True)
+    paths = [file_name for file_name in OUTPUT_FILES if os.path.isfile(os.path.join(source_folder, file_name))]
+    for folder_name in OUTPUT_FOLDERS:
+        if os.path.isdir(os.path.join(source_folder, folder_name)):
+            os.makedirs(os.path.join(target_folder, folder_name), exist_ok=True)
+            paths += [os.path.join(folder_name, file_name)
+                      for file_name in sorted(os.listdir(os.path.join(source_folder, folder_name)))]
+    for path in paths:
+        try:
+            os.link(os.path.join(source_folder, path), os.path.join(target_folder, path))
+        except OSError:
+            shutil.copy2(os.path.join(source_folder, path), os.path.join(target_folder, path))
+
+
+class Result_Cache:
+    """Folder of the outputs of the finished runs by run key"""
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+
+    def get_folder(self, key):
+        return os.path.join(self.cache_folder, key[:2], key)
+
+    def contains(self, key):
+        # the folder of a run is moved into place once complete, a run stored partially is not in the cache
+        return read_run_key(self.get_folder(key)) == key
+
+    def store(self, key, output_folder):
+        """Storing the outputs of a finished run with the key file in output_folder"""
+        if self.contains(key):
+            return
+        cache_folder = self.get_folder(key)
+        temp_folder = f"{cache_folder}.{os.getpid()}.tmp"
+        if os.path.isdir(temp_folder):
+            shutil.rmtree(temp_folder)
+        link_outputs(output_folder, temp_folder)
+        if os.path.isdir(cache_folder):
+            shutil.rmtree(cache_folder)
+        os.replace(temp_folder, cache_folder)
+
+    def restore(self, key, output_folder):
+        """Replacing the outputs in output_folder by the cached outputs of the run"""
+        clear_outputs(output_folder)
+        link_outputs(self.get_folder(key), output_folder)
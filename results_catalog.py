@@ -0,0 +1,246 @@
+"""
+results_catalog.py : summaries of the runs and a catalog of a whole results tree. Every run saving data writes a
+            summary.json next to its trajectories (parameters, final tick, wall time, coordination percentage and the
+            fraction of time in each shepherd mode), so the analysis does not need to read the trajectories. The
+            catalog indexes all the summaries below a folder into one table, saved as results_catalog.jsonl.
+
+    python results_catalog.py /mnt/DATA/yating/results_phase_diagram --summarize_missing
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from trajectory_reader import calculate_agent_means, calculate_coordination, find_trajectory, read_last_row, \
+    read_last_tick, read_parameters
+
+SUMMARY_FILE = "summary.json"
+CATALOG_FILE = "results_catalog.jsonl"
+
+
+def write_summary(run_folder, summary):
+    """Writing summary.json of a run, replaced at once so that a summary is never read half written"""
+    os.makedirs(run_folder, exist_ok=True)
+    summary_path = os.path.join(run_folder, SUMMARY_FILE)
+    with open(summary_path + ".tmp", "w") as f:
+        json.dump(summary, f, indent=1)
+    os.replace(summary_path + ".tmp", summary_path)
+
+
+def read_summary(run_folder):
+    """Summary of a run, or None if it has not written one"""
+    summary_path = os.path.join(run_folder, SUMMARY_FILE)
+    if not os.path.isfile(summary_path):
+        return None
+    with open(summary_path) as f:
+        return json.load(f)
+
+
+def read_output(run_folder):
+    """(final tick, wall time) printed in output.txt by the main scripts, None if not found"""
+    output_path = os.path.join(run_folder, "output.txt")
+    if os.path.isfile(output_path):
+        with open(output_path) as f:
+            for line in f:
+                # Final tick: <tick> <date> Total simulation time:  <seconds>
+                if line.startswith("Final tick:"):
+                    words = line.split()
+                    return int(words[2]), float(words[-1])
+    return None, None
+
+
+def summarize_run(run_folder):
+    """
+    Summary of a run without summary.json, calculated by streaming its saved trajectories, None if nothing was saved.
+    A run which has not printed its final tick in output.txt (still running or killed) is "incomplete".
+    """
+    if find_trajectory(run_folder, "sheep") is None:
+        return None
+    last_row = read_last_row(run_folder, "sheep", ["state"])
+    if last_row is None:
+        return None
+    last_tick, last_states = last_row
+    final_tick, wall_time = read_output(run_folder)
+    summary = {"parameters": read_parameters(run_folder, "sheep"),
+               "final_tick": final_tick if final_tick is not None else last_tick + 1,
+               "last_tick": last_tick,
+               "is_herded": not bool(np.any(last_states["state"])),
+               "status": "incomplete" if final_tick is None else "time_limit" if np.any(last_states["state"])
+               else "herded",
+               "stall": None,
+               "wall_time": wall_time,
+               "coordination_percentage": None,
+               "drive_fraction": None,
+               "collect_fraction": None,
+               "fork_tick": None}
+    if find_trajectory(run_folder, "shepherd") is not None:
+        shepherd_modes = calculate_agent_means(run_folder, "shepherd", "MODE")
+        drive_fraction = float(np.mean(shepherd_modes)) if shepherd_modes.size else 0.0
+        summary.update(coordination_percentage=calculate_coordination(run_folder),
+                       drive_fraction=drive_fraction, collect_fraction=1.0 - drive_fraction)
+    return summary
+
+
+def get_summary(run_folder, is_saving=False):
+    """
+    Summary of a run from summary.json, or calculated from the trajectories for runs without it
+
+    :param is_saving: writing the calculated summary to summary.json, except for incomplete runs which would then be
+        taken as completed by sweep_runner
+    """
+    summary = read_summary(run_folder)
+    if summary is None:
+        summary = summarize_run(run_folder)
+        if is_saving and summary is not None and summary["status"] != "incomplete":
+            write_summary(run_folder, summary)
+    return summary
+
+
+def get_last_tick(run_folder):
+    """
+    Tick of the last saved row of a run, sheep_data[-1]["tick"] of the json files, None if nothing was saved. Read from
+    summary.json, or from the end of the sheep trajectory for runs without it.
+    """
+    summary = read_summary(run_folder)
+    if summary is not None:
+        if summary.get("status") == "stalled":
+            # a stalled run stopped early would never have penned the herd, it counts as a run of the whole time
+            return summary["parameters"]["Time"] - 1
+        return summary["last_tick"]
+    if find_trajectory(run_folder, "sheep") is None:
+        return None
+    return read_last_tick(run_folder, "sheep")
+
+
+def map_runs(function, run_folders, workers=None):
+    """
+    function(run_folder) of every run computed by a pool of worker processes, in the order of run_folders
+
+    :param function: function of one run folder defined at module level, so that it can be sent to the workers
+    :param workers: number of worker processes, all the cpus if None; 1 reads the runs in this process
+    """
+    run_folders = list(run_folders)
+    workers = min(workers or os.cpu_count(), len(run_folders))
+    if workers <= 1:
+        return [function(run_folder) for run_folder in run_folders]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # a few chunks per worker keep the pool busy without sending every folder on its own
+        return list(executor.map(function, run_folders, chunksize=max(1, len(run_folders) // (4 * workers))))
+
+
+def get_last_ticks(run_folders, workers=None):
+    """Last ticks of many runs read in parallel as an array of floats, nan for the runs without data"""
+    return np.array(map_runs(get_last_tick, run_folders, workers), dtype=np.float64)
+
+
+def parse_folder_name(folder_name):
+    """("N_sheep", 100) from "N_sheep_100", None if the folder name has no value"""
+    key, _, value = folder_name.rpartition("_")
+    if not key:
+        return None
+    for value_type in (int, float):
+        try:
+            return key, value_type(value)
+        except ValueError:
+            pass
+    return None
+
+
+class Results_Catalog:
+    """Table of the runs of a results tree, one row per run as a dict"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, **conditions):
+        """
+        Rows matching all the conditions, e.g. select(N_shepherd=1, coll=30, rep=range(1, 4))
+
+        :param conditions: value of a column, or a list/range/set of accepted values
+        """
+        def is_match(row, key, value):
+            if isinstance(value, (list, tuple, range, set)):
+                return row.get(key) in value
+            return row.get(key) == value
+        return [row for row in self.rows if all(is_match(row, key, value) for key, value in conditions.items())]
+
+    def column(self, name, **conditions):
+        """Values of one column of the selected rows as an array"""
+        return np.array([row[name] for row in self.select(**conditions)])
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def build_catalog(base_folder, is_summarizing_missing=False):
+    """
+    Catalog of all the runs below base_folder. The keys of the folder names (N_sheep_100, coll_30, rep_1, ...), the
+    parameters and the results of the summary form the columns of a run.
+
+    :param is_summarizing_missing: also include the runs without summary.json, calculating and saving their summaries
+    """
+    rows = []
+    for folder_path, folder_names, file_names in os.walk(base_folder):
+        folder_names.sort()
+        is_run = SUMMARY_FILE in file_names or (
+                is_summarizing_missing and find_trajectory(folder_path, "sheep") is not None)
+        if not is_run:
+            continue
+        summary = get_summary(folder_path, is_saving=True)
+        if summary is None:
+            continue
+        run_folder = os.path.relpath(folder_path, base_folder)
+        row = {"run_folder": run_folder, **summary.pop("parameters")}
+        for folder_name in run_folder.split(os.sep):
+            key_value = parse_folder_name(folder_name)
+            if key_value is not None:
+                row[key_value[0]] = key_value[1]
+        row.update(summary)
+        rows.append(row)
+    return Results_Catalog(rows)
+
+
+def save_catalog(catalog, base_folder):
+    with open(os.path.join(base_folder, CATALOG_FILE), "w") as f:
+        for row in catalog.rows:
+            json.dump(row, f)
+            f.write("\n")
+
+
+def is_catalog_outdated(base_folder):
+    """True if results_catalog.jsonl is missing or older than the summary or the output of any run below base_folder"""
+    catalog_path = os.path.join(base_folder, CATALOG_FILE)
+    if not os.path.isfile(catalog_path):
+        return True
+    catalog_time = os.path.getmtime(catalog_path)
+    for folder_path, _, file_names in os.walk(base_folder):
+        for file_name in (SUMMARY_FILE, "output.txt"):
+            if file_name in file_names and os.path.getmtime(os.path.join(folder_path, file_name)) > catalog_time:
+                return True
+    return False
+
+
+def load_catalog(base_folder, is_using_saved=False):
+    """
+    Catalog of base_folder, built from the results tree and saved to results_catalog.jsonl
+
+    :param is_using_saved: reading the saved results_catalog.jsonl instead, unless a run finished after it was saved
+    """
+    if not is_using_saved or is_catalog_outdated(base_folder):
+        catalog = build_catalog(base_folder, is_summarizing_missing=True)
+        save_catalog(catalog, base_folder)
+        return catalog
+    with open(os.path.join(base_folder, CATALOG_FILE)) as f:
+        return Results_Catalog([json.loads(line) for line in f if line.strip()])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_folder")
+    parser.add_argument("--summarize_missing", action="store_true")  # runs without summary.json, from trajectories
+    args = parser.parse_args()
+    catalog = build_catalog(args.base_folder, args.summarize_missing)
+    save_catalog(catalog, args.base_folder)
+    print(f"{len(catalog)} runs in {os.path.join(args.base_folder, CATALOG_FILE)}")
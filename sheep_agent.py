@@ -4,19 +4,21 @@ agent.py : including the main classes to create an agent. Supplementary calculat
 """
 from math import atan2
 
-import pygame
 import numpy as np
 import support
+from headless import Sprite
 from scipy.spatial import Voronoi
+from interaction_network import get_neighbors
 
 
-class Sheep_Agent(pygame.sprite.Sprite):
+class Sheep_Agent(Sprite):
     """
     Agent class that includes all private parameters of the agents and all methods necessary to move in the environment
     and to make decisions.
     """
 
-    def __init__(self, id, radius, position, orientation, env_size, color, window_pad, target_x, target_y, target_size, is_antagonistic, alpha):
+    def __init__(self, id, radius, position, orientation, env_size, color, window_pad, target_x, target_y, target_size, is_antagonistic, alpha,
+                 network_type="voronoi", with_visualization=True, rng=None, noise=None):
         """
         Initalization method of main agent class of the simulations
 
@@ -27,8 +29,13 @@ class Sheep_Agent(pygame.sprite.Sprite):
         :param env_size: environment size available for agents as (width, height)
         :param color: color of the agent as (R, G, B)
         :param window_pad: padding of the environment in simulation window in pixels
+        :param network_type: interaction network of the herd, "voronoi" or "metric"
+        :param with_visualization: drawing the agent on pygame surfaces, headless agents never touch pygame
+        :param rng: random generator of the agent, its own stream in a seeded run; the global np.random if None
+        :param noise: Noise_Provider of the herd drawing the noise of the agent from rng in blocks, scalar draws from
+            rng if None
         """
-        # Initializing supercalss (Pygame Sprite)
+        # Initializing supercalss (Sprite)
         super().__init__()
 
         # Boundary conditions
@@ -37,6 +44,9 @@ class Sheep_Agent(pygame.sprite.Sprite):
         self.boundary_condition = "bounce_back"
 
         self.id = id
+        self.index = None  # integer index of the agent, given by the registry of the loop function
+        self.rng = np.random if rng is None else rng
+        self.noise = noise
         self.radius = radius
         self.position = np.array(position, dtype=np.float64)
         self.orientation = orientation
@@ -61,20 +71,26 @@ class Sheep_Agent(pygame.sprite.Sprite):
         self.boundaries_y = [self.window_pad + self.radius, self.window_pad + self.HEIGHT - self.radius]
 
         # Initial Visualization of agent
-        self.image = pygame.Surface([radius * 2, radius * 2])
-        self.image.fill(support.BACKGROUND)
-        self.image.set_colorkey(support.BACKGROUND)
-        pygame.draw.circle(
-            self.image, color, (radius, radius), radius
-        )
-
-        # Showing agent orientation with a line towards agent orientation
-        pygame.draw.line(self.image, support.BACKGROUND, (radius, radius),
-                         ((1 + np.cos(self.orientation)) * radius, (1 - np.sin(self.orientation)) * radius), 3)
-        self.rect = self.image.get_rect()
-        self.rect.x = self.position[0]
-        self.rect.y = self.position[1]
-        self.mask = pygame.mask.from_surface(self.image)
+        self.with_visualization = with_visualization
+        self.image = None
+        self.rect = None
+        self.mask = None
+        if self.with_visualization:
+            import pygame  # only visualized runs import pygame
+            self.image = pygame.Surface([radius * 2, radius * 2])
+            self.image.fill(support.BACKGROUND)
+            self.image.set_colorkey(support.BACKGROUND)
+            pygame.draw.circle(
+                self.image, color, (radius, radius), radius
+            )
+
+            # Showing agent orientation with a line towards agent orientation
+            pygame.draw.line(self.image, support.BACKGROUND, (radius, radius),
+                             ((1 + np.cos(self.orientation)) * radius, (1 - np.sin(self.orientation)) * radius), 3)
+            self.rect = self.image.get_rect()
+            self.rect.x = self.position[0]
+            self.rect.y = self.position[1]
+            self.mask = pygame.mask.from_surface(self.image)
 
         #############################################
         self.x = self.position[0] + self.radius
@@ -110,7 +126,7 @@ class Sheep_Agent(pygame.sprite.Sprite):
         self.f_att_y = 0.0
         self.num_rep = 0
         self.num_att = 0
-        self.network_type = "voronoi" #"voronoi" # "metric"
+        self.network_type = network_type #"voronoi" # "metric"
         self.interact_network = []
         self.fov = np.pi *  4/3
         self.acceleration = 1 #0.1 # heading accelerator
@@ -144,12 +160,12 @@ class Sheep_Agent(pygame.sprite.Sprite):
     def Limit_field_of_view(self, agents):
         # remove neighbors who are in different states;
         for neighbor_id in self.interact_network:
-            if self.state != agents.sprites()[neighbor_id].state:
+            if self.state != agents[neighbor_id].state:
                 self.interact_network.remove(neighbor_id)
 
         for neighbor_id in self.interact_network:
-            neighbor_x = agents.sprites()[neighbor_id].x
-            neighbor_y = agents.sprites()[neighbor_id].y
+            neighbor_x = agents[neighbor_id].x
+            neighbor_y = agents[neighbor_id].y
             relative_angle = atan2(neighbor_y - self.y, neighbor_x - self.x)
             delta_angle = abs(self.orientation - relative_angle) % (2 * np.pi)
             # self.delta_angle = abs(self.orientation - relative_angle) % (2 * np.pi)
@@ -159,8 +175,12 @@ class Sheep_Agent(pygame.sprite.Sprite):
         return
 
     #################################################
-    def Get_interaction_network(self, agents):
+    def Get_interaction_network(self, agents, network=None):
         self.interact_network = []
+        if network is not None:
+            # the network of the whole herd is built once per tick by the loop function (CSR indptr/indices)
+            self.interact_network = get_neighbors(network, self.index)
+            return
         if self.network_type == "voronoi":
             #self.voronoi_network = []
             points = [(sheep_agent.x, sheep_agent.y) for sheep_agent in agents]
@@ -168,10 +188,10 @@ class Sheep_Agent(pygame.sprite.Sprite):
             #indices of points between each voronoi ridge lines
             voronoi_ridge_points = voronoi.ridge_points
             for point_index in voronoi_ridge_points:
-                if point_index[0] == int(self.id[7:]):
+                if point_index[0] == self.index:
                     # if self.state == agents.sprites()[point_index[1]].state:
                     self.interact_network.append(point_index[1])
-                if point_index[1] == int(self.id[7:]):
+                if point_index[1] == self.index:
                     # if self.state == agents.sprites()[point_index[0]].state:
                     self.interact_network.append(point_index[0])
             # print(self.id, self.voronoi_network)
@@ -182,7 +202,7 @@ class Sheep_Agent(pygame.sprite.Sprite):
                 x_j = pos[0]
                 y_j = pos[1]
                 distance = np.sqrt((self.x - x_j) ** 2 + (self.y - y_j) ** 2)
-                if distance <= self.att_distance and index != int(self.id[7:]):
+                if distance <= self.att_distance and index != self.index:
                     # if self.state == agents.sprites()[index].state:
                     self.interact_network.append(index)
             # print(self.id, self.metric_network)
@@ -200,9 +220,9 @@ class Sheep_Agent(pygame.sprite.Sprite):
 
         for neighbor_id in self.interact_network:
             # only interact with same type of agents
-            # if self.state == agents.sprites()[neighbor_id].state:
-            neighbor_x = agents.sprites()[neighbor_id].x
-            neighbor_y = agents.sprites()[neighbor_id].y
+            # if self.state == agents[neighbor_id].state:
+            neighbor_x = agents[neighbor_id].x
+            neighbor_y = agents[neighbor_id].y
             distance = np.sqrt((self.x - neighbor_x) ** 2 + (self.y - neighbor_y) ** 2)
             if distance <= self.rep_distance:
                 r_x = r_x + (self.x - neighbor_x) / (distance + 0.000001)
@@ -225,9 +245,9 @@ class Sheep_Agent(pygame.sprite.Sprite):
 
         for neighbor_id in self.interact_network:
             # only include agents in the same state: moving, staying;
-            # if self.state == agents.sprites()[neighbor_id].state:
-            neighbor_x = agents.sprites()[neighbor_id].x
-            neighbor_y = agents.sprites()[neighbor_id].y
+            # if self.state == agents[neighbor_id].state:
+            neighbor_x = agents[neighbor_id].x
+            neighbor_y = agents[neighbor_id].y
             distance = np.sqrt((self.x - neighbor_x) ** 2 + (self.y - neighbor_y) ** 2)
             if distance > self.rep_distance:
                 r_x = r_x + (neighbor_x - self.x) / (distance + 0.000001)
@@ -418,6 +438,8 @@ class Sheep_Agent(pygame.sprite.Sprite):
         """
         updating the outlook of the agent according to position and orientation
         """
+        import pygame  # only visualized runs import pygame
+
         # update position
         self.rect.x = self.x - self.radius
         self.rect.y = self.y - self.radius
@@ -443,12 +465,15 @@ class Sheep_Agent(pygame.sprite.Sprite):
 
         self.mask = pygame.mask.from_surface(self.image)
 
-    def update(self, agents, shepherd_agents):  # this is actually sheep_agents;
+    def update(self, agents, shepherd_agents, network=None, shepherd_network=None):  # this is actually sheep_agents;
         """
         main update method of the agent. This method is called in every timestep to calculate the new state/position
         of the agent and visualize it in the environment
-        :param sheep_agents:
-        :param agents: a list of all other agents in the environment.
+        :param agents: all the sheep agents, agents[i] being the sheep of index i
+        :param shepherd_agents: all the shepherd agents, shepherd_agents[i] being the shepherd of index i
+        :param network: shared interaction network of the herd as (indptr, indices), built per agent if None
+        :param shepherd_network: candidate shepherds around every sheep as (indptr, indices), all the shepherds are
+            scanned if None
         """
         self.update_sheep_state(agents)
 
@@ -456,10 +481,13 @@ class Sheep_Agent(pygame.sprite.Sprite):
 
         self.reflect_from_fence()
 
-        self.Get_interaction_network(agents)
+        self.Get_interaction_network(agents, network)
 
         self.Limit_field_of_view(agents)
 
+        if shepherd_network is not None:
+            shepherd_agents = [shepherd_agents[index] for index in get_neighbors(shepherd_network, self.index)]
+
         # self.update_shepherd_forces(shepherd_agents)
         if self.is_antagonistic:
             self.update_shepherd_forces_antagonistic(shepherd_agents)
@@ -486,7 +514,8 @@ class Sheep_Agent(pygame.sprite.Sprite):
         # if self.w_dot <= -self.max_turning_angle:
         #     self.w_dot = -self.max_turning_angle
 
-        Dr = np.random.normal(0, 1) * np.sqrt(2 * self.K_Dr) / (self.tick_time ** 0.5)
+        Dr = (self.rng.normal(0, 1) if self.noise is None else self.noise.draw(self.index)) * \
+            np.sqrt(2 * self.K_Dr) / (self.tick_time ** 0.5)
 
         self.vt = self.v_dot * self.acceleration * self.tick_time + self.vt
 
@@ -513,7 +542,8 @@ class Sheep_Agent(pygame.sprite.Sprite):
         # self.Get_interaction_network(agents)
 
         # updating agent visualization
-        self.draw_update()
+        if self.with_visualization:
+            self.draw_update()
 
     def change_color(self):
         """Changing color of agent according to the behavioral mode the agent is currently in."""
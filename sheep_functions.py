@@ -0,0 +1,94 @@
+import numba as nb
+import numpy as np
+
+
+###############################--sheep force model--##########################################
+@nb.jit(nopython=True, parallel=True, cache=True)
+def calculate_sheep_forces(x, y, orientation, indptr, indices, shepherd_x, shepherd_y,
+                           rep_distance, safe_distance, K_repulsion, K_attraction, K_shepherd,
+                           is_antagonistic, alpha):
+    # all the force components of every sheep in one call;
+    # neighbors of sheep i (CSR network): indices[indptr[i]:indptr[i + 1]]
+    # every iteration only writes the row of its sheep, the sums are kept in locals until then;
+    num_agents = x.shape[0]
+    num_shepherds = shepherd_x.shape[0]
+    forces = np.zeros(shape=(num_agents, 10))
+    # 0, 1: f_avoid_x, f_avoid_y; 2: num_rep; 3, 4: f_att_x, f_att_y; 5: num_att;
+    # 6, 7: f_shepherd_force_x, f_shepherd_force_y; 8, 9: f_x, f_y;
+    for agent_index in nb.prange(num_agents):
+        agent_x = x[agent_index]
+        agent_y = y[agent_index]
+
+        # repulsion and attraction from the neighbors;
+        r_x = 0.0
+        r_y = 0.0
+        a_x = 0.0
+        a_y = 0.0
+        num_rep = 0
+        num_att = 0
+        for edge_index in range(indptr[agent_index], indptr[agent_index + 1]):
+            neighbor_index = indices[edge_index]
+            d_x = agent_x - x[neighbor_index]
+            d_y = agent_y - y[neighbor_index]
+            distance = np.sqrt(d_x * d_x + d_y * d_y)
+            if distance <= rep_distance:
+                r_x += d_x / (distance + 0.000001)
+                r_y += d_y / (distance + 0.000001)
+                num_rep += 1
+            else:
+                a_x -= d_x / (distance + 0.000001)
+                a_y -= d_y / (distance + 0.000001)
+                num_att += 1
+        if num_rep != 0:
+            r_x /= num_rep
+            r_y /= num_rep
+        if num_att != 0:
+            a_x /= num_att
+            a_y /= num_att
+        forces[agent_index, 0] = r_x
+        forces[agent_index, 1] = r_y
+        forces[agent_index, 3] = a_x
+        forces[agent_index, 4] = a_y
+        forces[agent_index, 2] = num_rep
+        forces[agent_index, 5] = num_att
+
+        # avoidance of the shepherds within the safe distance;
+        s_x = 0.0
+        s_y = 0.0
+        f_s_x = 0.0
+        f_s_y = 0.0
+        num_shepherd = 0
+        for shepherd_index in range(num_shepherds):
+            d_x = agent_x - shepherd_x[shepherd_index]
+            d_y = agent_y - shepherd_y[shepherd_index]
+            distance = np.sqrt(d_x * d_x + d_y * d_y)
+            if distance <= safe_distance:
+                num_shepherd += 1
+                s_x += d_x / (distance + 0.000001)
+                s_y += d_y / (distance + 0.000001)
+        if num_shepherd != 0:
+            if is_antagonistic:
+                f_r = np.sqrt(s_x ** 2 + s_y ** 2)
+                f_avoid_angle = np.arctan2(s_y / num_shepherd, s_x / num_shepherd)
+                if f_avoid_angle < 0:
+                    f_avoid_angle += 2 * np.pi  # [0, 2pi]
+                if f_avoid_angle > orientation[agent_index]:
+                    f_avoid_angle = f_avoid_angle - alpha
+                else:
+                    f_avoid_angle = f_avoid_angle + alpha
+                f_s_x = f_r * np.cos(f_avoid_angle)
+                f_s_y = f_r * np.sin(f_avoid_angle)
+            else:
+                f_s_x = s_x / num_shepherd
+                f_s_y = s_y / num_shepherd
+        forces[agent_index, 6] = f_s_x
+        forces[agent_index, 7] = f_s_y
+
+        # repulsion between sheep overrides all the other forces;
+        if num_rep != 0:
+            forces[agent_index, 8] = r_x * K_repulsion
+            forces[agent_index, 9] = r_y * K_repulsion
+        else:
+            forces[agent_index, 8] = a_x * K_attraction + f_s_x * K_shepherd
+            forces[agent_index, 9] = a_y * K_attraction + f_s_y * K_shepherd
+    return forces
@@ -6,18 +6,17 @@ import math
 import os
 from math import atan2
 
-import pygame
 import numpy as np
 #from statsmodels.sandbox.regression.example_kernridge import scale
 
 import support
-
-import matplotlib.pyplot as plt
+from shepherd_vision import Vision_Field
+from headless import Sprite
 
 #from scipy.stats import norm
 
 
-class Shepherd_Agent(pygame.sprite.Sprite):
+class Shepherd_Agent(Sprite):
     """
     Agent class that includes all private parameters of the agents and all methods necessary to move in the environment
     and to make decisions.
@@ -25,7 +24,8 @@ class Shepherd_Agent(pygame.sprite.Sprite):
 
     def __init__(self, id, radius, position, orientation, env_size, color, window_pad,
                  target_x, target_y, target_size, L3, uncomfortable_distance, is_explicit,
-                 angle_threshold_collection, angle_threshold_drive):
+                 angle_threshold_collection, angle_threshold_drive, with_visualization=True, rng=None, noise=None,
+                 coordination_noise=None):
         """
         Initalization method of main agent class of the simulations
 
@@ -36,8 +36,14 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         :param env_size: environment size available for agents as (width, height)
         :param color: color of the agent as (R, G, B)
         :param window_pad: padding of the environment in simulation window in pixels
+        :param with_visualization: drawing the agent on pygame surfaces, headless agents never touch pygame
+        :param rng: random generator of the agent, its own stream in a seeded run; the global np.random if None
+        :param noise: Noise_Provider of the shepherds drawing the motion noise of the agent from rng in blocks, scalar
+            draws from rng if None
+        :param coordination_noise: Noise_Provider of the explicit coordination, its own streams apart from the motion
+            noise; scalar draws from rng if None
         """
-        # Initializing supercalss (Pygame Sprite)
+        # Initializing supercalss (Sprite)
         super().__init__()
 
         # Boundary conditions
@@ -46,6 +52,10 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         self.boundary = "bounce_back"
 
         self.id = id
+        self.index = None  # integer index of the agent, given by the registry of the loop function
+        self.rng = np.random if rng is None else rng
+        self.noise = noise
+        self.coordination_noise = coordination_noise
         self.radius = radius
         self.position = np.array(position, dtype=np.float64)
         self.orientation = orientation
@@ -63,14 +73,6 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         self.boundaries_x = [self.window_pad, self.window_pad + self.WIDTH]
         self.boundaries_y = [self.window_pad, self.window_pad + self.HEIGHT]
 
-        # Initial Visualization of agent
-        self.image = pygame.Surface([radius * 2, radius * 2])
-        self.image.fill(support.BACKGROUND)
-        self.image.set_colorkey(support.BACKGROUND)
-        pygame.draw.circle(
-            self.image, color, (radius, radius), radius
-        )
-
         #######################################################
         self.v0 = 10
         self.vt = self.v0 # initial value
@@ -120,13 +122,27 @@ class Shepherd_Agent(pygame.sprite.Sprite):
 
         self.K_drive_sheep = 2 #200
         self.K_other_shepherd = 100 #1000
-        # Showing agent orientation with a line towards agent orientation
-        pygame.draw.line(self.image, support.BACKGROUND, (radius, radius),
-                         ((1 + np.cos(self.orientation)) * radius, (1 + np.sin(self.orientation)) * radius), 3)
-        self.rect = self.image.get_rect()
-        self.rect.x = self.x
-        self.rect.y = self.y
-        self.mask = pygame.mask.from_surface(self.image)
+        # Initial Visualization of agent
+        self.with_visualization = with_visualization
+        self.image = None
+        self.rect = None
+        self.mask = None
+        if self.with_visualization:
+            import pygame  # only visualized runs import pygame
+            self.image = pygame.Surface([radius * 2, radius * 2])
+            self.image.fill(support.BACKGROUND)
+            self.image.set_colorkey(support.BACKGROUND)
+            pygame.draw.circle(
+                self.image, color, (radius, radius), radius
+            )
+
+            # Showing agent orientation with a line towards agent orientation
+            pygame.draw.line(self.image, support.BACKGROUND, (radius, radius),
+                             ((1 + np.cos(self.orientation)) * radius, (1 + np.sin(self.orientation)) * radius), 3)
+            self.rect = self.image.get_rect()
+            self.rect.x = self.x
+            self.rect.y = self.y
+            self.mask = pygame.mask.from_surface(self.image)
 
     def move_with_mouse(self, mouse, left_state, right_state):
         """Moving the agent with the mouse cursor, and rotating"""
@@ -150,7 +166,7 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         neighbor_num = 0
         self.is_switch = False
         for shepherd in shepherd_agents:
-            if shepherd.id != self.id:
+            if shepherd is not self:
                 Is_Fov_Neighbor = self.Is_fov_neighbor(shepherd.x, shepherd.y)
                 if Is_Fov_Neighbor:
                     distance = np.sqrt((shepherd.x - self.x) ** 2 + (shepherd.y - self.y) ** 2)
@@ -160,7 +176,10 @@ class Shepherd_Agent(pygame.sprite.Sprite):
             #genrate Guassion possibility
             mu = 0.5
             sigma = 0.1
-            pdf_value= np.random.normal(mu, sigma, 1)
+            if self.coordination_noise is None:
+                pdf_value= self.rng.normal(mu, sigma, 1)
+            else:
+                pdf_value = mu + sigma * self.coordination_noise.draw(self.index)
             if abs(pdf_value - mu) < sigma * neighbor_num and self.is_switch == False:
                 self.state = abs(self.state - 1)
                 self.is_switch = True
@@ -198,7 +217,7 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         self.f_y_other_shepherd = 0.0
         self.num_rep = 0
         for shepherd in shepherd_agents:
-            if shepherd.id != self.id:
+            if shepherd is not self:
                 Is_Fov_Neighbor = self.Is_fov_neighbor(shepherd.x, shepherd.y)
                 distance = np.sqrt((shepherd.x - self.x) ** 2 + (shepherd.y - self.y) ** 2)
                 if (distance <= self.l3) and Is_Fov_Neighbor:
@@ -229,38 +248,11 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         r_angle = math.atan2(r_y, r_x)  # range[-pi, pi]
         return r_length, r_angle
 
-    def calculate_projection(self, sheep_agents, n_sheep):
-        projection = np.zeros(shape=(n_sheep, 2))  # 0: projection_pos, 1: projection_half_wid;
-        # find the projection angle of all the agents;
-        agent_index = 0
-        for agent in sheep_agents:
-            # calculate angle_Shepherd_Sheep;
-            agent_x = agent.x
-            agent_y = agent.y
-            radius = agent.radius  # could be extended to heterogeneous;
-            # get the distance between the shepherd and the agent;
-            distance_ss, agent_angle = self.calculate_relative_distance_angle(agent_x, agent_y, self.x, self.y) #projection_pos
-            #??? projection_pos??? maybe not true!
-            projection_pos = support.transform_angle(self.orientation - agent_angle) # should belong to [-pi, pi]
-
-            # calculate the *HALF* projection angle of sheep_i from the view of shepherd
-            projection_half_wid = np.arctan2(radius, distance_ss)  # radius >0, distance_ss>0, projection_wid:[0, pi/2)
-            projection[agent_index][0] = projection_pos
-            projection[agent_index][1] = projection_half_wid
-            # print("agent_index:", agent_index, "radius", radius, "distance_ss", distance_ss, "projection_pos:",
-            #       projection_pos * 180 / np.pi, "projection_half_wid:", projection_half_wid * 180 / np.pi)
-            agent_index = agent_index + 1
-        return projection
-
-    def get_sheep_agent(self, sheep_agents):
+    def get_sheep_agent(self, vision_field):
 
         # get (x,y) of drive agent
-        agent_x = 0.0
-        agent_y = 0.0
-        for agent in sheep_agents:
-            if int(agent.id[7:]) == self.approach_agent_id:
-                agent_x = agent.x
-                agent_y = agent.y
+        agent_x = vision_field.sheep_x[int(self.approach_agent_id)]
+        agent_y = vision_field.sheep_y[int(self.approach_agent_id)]
         # calculate the distance, angle between the center of the mass and the shepherd;
         distance_agent_target, angle_agent_target = self.calculate_relative_distance_angle(agent_x,
                                                                                            agent_y,
@@ -281,82 +273,70 @@ class Shepherd_Agent(pygame.sprite.Sprite):
 
         return
 
-    def drive_the_herd_using_vision(self, sheep_agents, n_sheep):
+    def drive_the_herd_using_vision(self, vision_field, vision_index):
 
         # drive_mode: attract by the closest agent, repulsion from other shepherd;
-        # calculate the projection angle of all the agents;
+        # projection angle of all the agents from the shared vision field;
         # 0: projection_pos, 1: projection_half_wid;
-        agents_projection = self.calculate_projection(sheep_agents, n_sheep)
+        projection_pos = vision_field.projection_pos[vision_index]
+        projection_half_wid = vision_field.projection_half_wid[vision_index]
 
         # find the drive point and calculate the force attraction from the drive point;
         # a. find the closest agent---> maximum agent_project;
-        drive_agent_id = np.argmax(agents_projection[:, 1], axis=0)
+        drive_agent_id = np.argmax(projection_half_wid, axis=0)
         self.drive_agent_id = drive_agent_id
 
         # update the driven sheep projection to the shepherd
-        self.main_projection[1][0] = agents_projection[drive_agent_id][0]
-        self.main_projection[1][1] = agents_projection[drive_agent_id][1]
+        self.main_projection[1][0] = projection_pos[drive_agent_id]
+        self.main_projection[1][1] = projection_half_wid[drive_agent_id]
         return
 
 
-    def Get_furthest_agent(self, sheep_agents, n_sheep):
-        angle_herd_agents = np.zeros(n_sheep)
-        distance_herd_agents = np.zeros(n_sheep)
-        dirt_angles_of_target_to_agent = np.zeros(n_sheep)
-
-        r_target, angle_target_herd = self.calculate_relative_distance_angle(self.target_x, self.target_y, self.x, self.y)
+    def Get_furthest_agent(self, vision_field, vision_index):
         # update the target projection to the shepherd
-        self.main_projection[0][0] = angle_target_herd
-
-        agent_index = 0
-        for agent in sheep_agents:
-            # the furthest agent should only in the moving state;
-            if agent.state == "moving":
-                agent_x = agent.x
-                agent_y = agent.y
-                r_agent_herd, angle_agent_herd = self.calculate_relative_distance_angle(agent_x, agent_y, self.x, self.y)
-                angle_herd_agents[agent_index] = angle_agent_herd  # [-pi, pi]
-                dirt_angle_from_target_to_herd = support.transform_angle(angle_target_herd - angle_agent_herd)  # [-pi, pi]
-                # angle between two vector: [-np.pi, np.pi] negative: the agent its on the left side of the target
-                dirt_angles_of_target_to_agent[agent_index] = dirt_angle_from_target_to_herd
-                distance_herd_agents[agent_index] = r_agent_herd
-            agent_index = agent_index + 1
+        self.main_projection[0][0] = vision_field.target_angle[vision_index]
+
+        # the furthest agent should only in the moving state;
+        # angle between two vector: [-np.pi, np.pi] negative: the agent its on the left side of the target
+        dirt_angles_of_target_to_agent = vision_field.target_agent_angle[vision_index]
 
         # max_agent_index = int(np.argmax(np.absolute(angle_herd_agents)))  # +: clockwise, -: anti-clockwise
         max_agent_index = int(np.argmax(np.absolute(dirt_angles_of_target_to_agent)))  # +: clockwise, -: anti-clockwise
         max_angle_target_to_agent = dirt_angles_of_target_to_agent[max_agent_index]
-        return max_agent_index, distance_herd_agents[max_agent_index], max_angle_target_to_agent
+        r_agent = vision_field.distance[vision_index][max_agent_index] if vision_field.sheep_is_moving[max_agent_index] else 0.0
+        return max_agent_index, r_agent, max_angle_target_to_agent
 
-    def collect_the_herd_using_vision(self, sheep_agents, n_sheep):
+    def collect_the_herd_using_vision(self, vision_field, vision_index):
         # collect mode: collect the agent until the agent is moving toward the group;
-        # calculate the projection angle of all the agents;
-        agents_projection = self.calculate_projection(sheep_agents, n_sheep)
-        center_of_mass_projection = np.mean(agents_projection[:, 0])
+        # projection angle of all the agents from the shared vision field;
+        projection_pos = vision_field.projection_pos[vision_index]
+        center_of_mass_projection = np.mean(projection_pos)
         # careful: collect_agent_id is a float type
-        angle_difference_agent_mass = np.abs(agents_projection[int(self.collect_agent_id), 0] - center_of_mass_projection)
+        angle_difference_agent_mass = np.abs(projection_pos[int(self.collect_agent_id)] - center_of_mass_projection)
 
         # update the center of the mass projection to the shepherd
         self.main_projection[2][0] = center_of_mass_projection
 
         return angle_difference_agent_mass
 
-    def update_collect_agent_id(self, sheep_agents, n_sheep):
+    def update_collect_agent_id(self, vision_field, vision_index):
         # max_angle_target_to_agent +: clockwise, -: anti-clockwise;
         # angle between two vector: [-np.pi, np.pi] negative: the agent its on the left side of the target
-        next_max_agent_index, r_agent, max_angle_target_to_agent = self.Get_furthest_agent(sheep_agents, n_sheep)
-        # calculate the projection angle of all the agents;
-        agents_projection = self.calculate_projection(sheep_agents, n_sheep)
-        center_of_mass_projection = np.mean(agents_projection[:, 0])
+        next_max_agent_index, r_agent, max_angle_target_to_agent = self.Get_furthest_agent(vision_field, vision_index)
+        # projection angle of all the agents from the shared vision field;
+        projection_pos = vision_field.projection_pos[vision_index]
+        projection_half_wid = vision_field.projection_half_wid[vision_index]
+        center_of_mass_projection = np.mean(projection_pos)
         # careful: collect_agent_id is a float type
-        current_angle_difference_agent_mass = agents_projection[int(self.collect_agent_id), 0] - center_of_mass_projection
-        next_angle_difference_agent_mass = agents_projection[int(next_max_agent_index), 0] - center_of_mass_projection
+        current_angle_difference_agent_mass = projection_pos[int(self.collect_agent_id)] - center_of_mass_projection
+        next_angle_difference_agent_mass = projection_pos[int(next_max_agent_index)] - center_of_mass_projection
         if current_angle_difference_agent_mass * next_angle_difference_agent_mass >= 0:
             self.collect_agent_id = next_max_agent_index
             # print(current_angle_difference_agent_mass, next_angle_difference_agent_mass)
 
         # update the collect sheep projection to the shepherd
-        self.main_projection[1][0] = agents_projection[self.collect_agent_id][0]
-        self.main_projection[1][1] = agents_projection[self.collect_agent_id][1]
+        self.main_projection[1][0] = projection_pos[self.collect_agent_id]
+        self.main_projection[1][1] = projection_half_wid[self.collect_agent_id]
 
         # update the center of the mass projection to the shepherd
         self.main_projection[2][0] = center_of_mass_projection
@@ -364,51 +344,48 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         return
 
 
-    def herd_sheep_agents(self, sheep_agents, n_sheep):
+    def herd_sheep_agents(self, vision_field, vision_index):
         # drive_mode: attract by the closest sheep agent and the target, repulsion from other shepherd;
         if self.state == 1.0:  #
             self.color = support.RED
             # drive the closet agent, update the drive agent id;
-            self.drive_the_herd_using_vision(sheep_agents, n_sheep)
+            self.drive_the_herd_using_vision(vision_field, vision_index)
 
             # check if it is necessary to switch to collect mode and return the furthest agent id;
-            max_agent_index, r_agent, max_angle_target_to_agent = self.Get_furthest_agent(sheep_agents, n_sheep)
-
-            for agent in sheep_agents:
-                # switch to collect mode if the drive agent is staying:
-                if int(agent.id[7:]) == self.drive_agent_id and agent.state == "staying":
-                    self.state = 0.0
-                    # lock the ID of the furthest agent for the collect mode;
-                    self.collect_agent_id = int(max_agent_index)
-
-                # switch to collect mode if the furthest agent is far from the group enough
-                # and remained in moving state
-                if int(agent.id[7:]) == max_agent_index:
-                    # max_angle_target_to_agent +: clockwise, -: anti-clockwise;
-                    # angle between two vector: [-np.pi, np.pi] negative: the agent its on the left side of the target
-                    delta_angle = np.absolute(max_angle_target_to_agent) - self.Angle_Threshold_Collection
-                    if (delta_angle >= 0.001) and (agent.state == "moving"):
-                        # collect_mode = true
-                        self.state = 0.0
-                        # lock the ID of the furthest agent for the collect mode;
-                        self.collect_agent_id = int(max_agent_index)
-                        # print("drive:", "max_angle", int(max_angle_target_to_agent/np.pi*180), "delta_angle:", int(delta_angle/np.pi*180), delta_angle)
+            max_agent_index, r_agent, max_angle_target_to_agent = self.Get_furthest_agent(vision_field, vision_index)
+
+            # switch to collect mode if the drive agent is staying:
+            if not vision_field.sheep_is_moving[self.drive_agent_id]:
+                self.state = 0.0
+                # lock the ID of the furthest agent for the collect mode;
+                self.collect_agent_id = int(max_agent_index)
+
+            # switch to collect mode if the furthest agent is far from the group enough
+            # and remained in moving state
+            # max_angle_target_to_agent +: clockwise, -: anti-clockwise;
+            # angle between two vector: [-np.pi, np.pi] negative: the agent its on the left side of the target
+            delta_angle = np.absolute(max_angle_target_to_agent) - self.Angle_Threshold_Collection
+            if (delta_angle >= 0.001) and vision_field.sheep_is_moving[max_agent_index]:
+                # collect_mode = true
+                self.state = 0.0
+                # lock the ID of the furthest agent for the collect mode;
+                self.collect_agent_id = int(max_agent_index)
+                # print("drive:", "max_angle", int(max_angle_target_to_agent/np.pi*180), "delta_angle:", int(delta_angle/np.pi*180), delta_angle)
         else:
             # collect mode
             self.color = support.BLUE
             # update the furthest agent id;
-            self.update_collect_agent_id(sheep_agents, n_sheep)
+            self.update_collect_agent_id(vision_field, vision_index)
 
             # Switch to drive mode:
             # get the center of projection of the GROUP
-            angle_difference_agent_mass = self.collect_the_herd_using_vision(sheep_agents, n_sheep)
+            angle_difference_agent_mass = self.collect_the_herd_using_vision(vision_field, vision_index)
             # print("collect:", int(angle_difference_agent_mass/np.pi*180), angle_difference_agent_mass)
-            for agent in sheep_agents:
-                if int(agent.id[7:]) == self.collect_agent_id:
-                    # IF the collecting agent is closer enough to ANY AGENT in the GROUP
-                    # Or IF the collecting agent are staying inside the circe;
-                    if (angle_difference_agent_mass <= self.Angle_Threshold_Drive) or (agent.state == "staying"):
-                        self.state = 1.0  # drive_mode_true
+            # IF the collecting agent is closer enough to ANY AGENT in the GROUP
+            # Or IF the collecting agent are staying inside the circe;
+            if (angle_difference_agent_mass <= self.Angle_Threshold_Drive) or (
+                    not vision_field.sheep_is_moving[self.collect_agent_id]):
+                self.state = 1.0  # drive_mode_true
 
         if self.state == 1.0:
             # drive mode
@@ -419,20 +396,46 @@ class Shepherd_Agent(pygame.sprite.Sprite):
 
         return
 
+    def reflect_from_boundaries(self):
+        """reflecting the shepherd from the walls and the fence, before it looks at the herd"""
+        self.reflect_from_walls(self.boundary)
+        self.reflect_from_fence()
+
+    def get_reflected_pose(self):
+        """(x, y, orientation) the shepherd will have after reflect_from_boundaries, without moving it yet"""
+        x, y, orientation = self.x, self.y, self.orientation
+        self.reflect_from_boundaries()
+        reflected_pose = (self.x, self.y, self.orientation)
+        self.x, self.y, self.orientation = x, y, orientation
+        return reflected_pose
+
+    def look_at_herd(self, sheep_agents):
+        """Vision field of this shepherd alone, calculated from the sheep sprites"""
+        return Vision_Field([self.x], [self.y], [self.orientation], self.target_x, self.target_y,
+                            [agent.x for agent in sheep_agents], [agent.y for agent in sheep_agents],
+                            [agent.radius for agent in sheep_agents],
+                            [agent.state == "moving" for agent in sheep_agents])
+
 
-    def update(self, n_sheep, sheep_agents, shepherd_agents, tick):
+    def update(self, n_sheep, sheep_agents, shepherd_agents, tick, vision_field=None):
         """
         main update method of the agent. This method is called in every timestep to calculate the new state/position
         of the agent and visualize it in the environment
         :param shepherd_agents:
         :param sheep_agents:
+        :param vision_field: Vision_Field of all the shepherds, calculated by the loop function from their reflected
+            poses. If None, the shepherd looks at the herd alone.
         """
-        self.reflect_from_walls(self.boundary)
-        self.reflect_from_fence()
+        self.reflect_from_boundaries()
+        if vision_field is None:
+            vision_field = self.look_at_herd(sheep_agents)
+            vision_index = 0
+        else:
+            vision_index = self.index
 
         self.update_shepherd_forces(shepherd_agents)
 
-        self.herd_sheep_agents(sheep_agents, n_sheep)
+        self.herd_sheep_agents(vision_field, vision_index)
 
         if self.is_explicit:
             self.explicit_coordinate(shepherd_agents)
@@ -440,7 +443,7 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         # drive/collect the cloest/furtherest agent toward the target;
         # update drive agent force:self.f_drive_agent_x; self.f_drive_agent_y;
         # Note: there is ONLY drive_agent_force now!!!
-        self.get_sheep_agent(sheep_agents)
+        self.get_sheep_agent(vision_field)
 
         if self.num_rep !=0:
             F_x = self.f_x_other_shepherd * self.K_other_shepherd
@@ -467,7 +470,8 @@ class Shepherd_Agent(pygame.sprite.Sprite):
             self.vt = -self.v_max
 
         # print(self.vt)
-        noise = np.sqrt(2 * self.Dr) / (self.tick_time ** 0.5) * np.random.normal(0, 1)
+        noise = np.sqrt(2 * self.Dr) / (self.tick_time ** 0.5) * \
+            (self.rng.normal(0, 1) if self.noise is None else self.noise.draw(self.index))
 
         self.orientation += (w_dot * self.beta + noise) * self.tick_time
         # self.orientation += (w_dot * self.beta / (self.vt + 0.0001) + noise) * self.tick_time
@@ -484,7 +488,8 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         self.y += self.vt * np.sin(self.orientation) * self.tick_time
 
         # updating agent visualization
-        self.draw_update()
+        if self.with_visualization:
+            self.draw_update()
 
         #self.plot_vision_projection(tick)
 
@@ -492,6 +497,8 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         """
         updating the outlook of the agent according to position and orientation
         """
+        import pygame  # only visualized runs import pygame
+
         # update position
         self.rect.x = self.x - self.radius
         self.rect.y = self.y - self.radius
@@ -624,6 +631,8 @@ class Shepherd_Agent(pygame.sprite.Sprite):
         return np.where(np.logical_and((pos + wid) >= x, x >= (pos - wid)), 1, 0)
 
     def plot_vision_projection(self, tick):
+        import matplotlib.pyplot as plt  # only needed for the projection figures
+
         folder_path = os.getcwd() + "/projections/"
         # plt.cla()
         plt.figure(figsize=(5, 4)) #(3, 2)
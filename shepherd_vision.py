@@ -0,0 +1,52 @@
+"""
+shepherd_vision.py : vision stage of the shepherds. The visual projections of all the sheep are calculated once per
+            tick for all the shepherds as (N_shepherd, N_sheep) arrays, and the drive/collect decisions of every
+            shepherd read its own row. Leading axes are broadcast, e.g. (R, N_shepherd, N_sheep) for R replicates.
+"""
+import numpy as np
+
+import support
+
+
+class Vision_Field:
+    """
+    Vision field of all the shepherds in one tick; rows: shepherds, columns: sheep.
+    """
+
+    def __init__(self, shepherd_x, shepherd_y, shepherd_orientation, target_x, target_y,
+                 sheep_x, sheep_y, sheep_radius, sheep_is_moving):
+        """
+        Calculating the projections of all shepherd/sheep pairs
+
+        :param shepherd_x, shepherd_y, shepherd_orientation: arrays of shape (..., N_shepherd)
+        :param target_x, target_y: target place as seen by each shepherd, scalars or arrays of shape (..., N_shepherd)
+        :param sheep_x, sheep_y, sheep_radius: arrays of shape (..., N_sheep)
+        :param sheep_is_moving: sheep in the moving state, boolean array of shape (..., N_sheep)
+        """
+        shepherd_x = np.asarray(shepherd_x, dtype=np.float64)[..., :, None]
+        shepherd_y = np.asarray(shepherd_y, dtype=np.float64)[..., :, None]
+        shepherd_orientation = np.asarray(shepherd_orientation, dtype=np.float64)[..., :, None]
+        self.sheep_x = np.asarray(sheep_x, dtype=np.float64)
+        self.sheep_y = np.asarray(sheep_y, dtype=np.float64)
+        self.sheep_is_moving = np.asarray(sheep_is_moving, dtype=bool)
+
+        # distance and direction from every shepherd to every sheep
+        r_x = self.sheep_x[..., None, :] - shepherd_x
+        r_y = self.sheep_y[..., None, :] - shepherd_y
+        self.distance = np.sqrt(r_x ** 2 + r_y ** 2)
+        agent_angle = np.arctan2(r_y, r_x)  # range[-pi, pi]
+
+        # 0: projection_pos, relative to the heading of the shepherd [-pi, pi]
+        self.projection_pos = support.transform_angle_array(shepherd_orientation - agent_angle)
+        # 1: the *HALF* projection angle of the sheep from the view of the shepherd [0, pi/2)
+        self.projection_half_wid = np.arctan2(np.asarray(sheep_radius, dtype=np.float64)[..., None, :], self.distance)
+
+        # direction of the target place from every shepherd
+        r_target_x = np.asarray(target_x, dtype=np.float64) - shepherd_x[..., 0]
+        r_target_y = np.asarray(target_y, dtype=np.float64) - shepherd_y[..., 0]
+        self.target_angle = np.arctan2(r_target_y, r_target_x)  # range[-pi, pi]
+
+        # angle from the target to every moving sheep [-pi, pi]; negative: the agent is on the left side of the target
+        self.target_agent_angle = np.where(self.sheep_is_moving[..., None, :],
+                                           support.transform_angle_array(self.target_angle[..., :, None] - agent_angle),
+                                           0.0)
@@ -0,0 +1,142 @@
+"""
+spatial_grid.py : uniform grid index over the positions of the agents, rebuilt once per tick. The points are sorted by
+            grid cell, so all the points within a distance of a position are found by scanning the few cells around it
+            instead of all the agents. Results are CSR adjacencies (indptr, indices) like interaction_network.
+            Below MIN_GRID_POINTS points, comparing all the pairs at once is faster than building the grid.
+"""
+import numpy as np
+
+MIN_GRID_POINTS = 300
+
+
+def expand_ranges(begin, end):
+    """(owner, position) of every position in the ranges [begin[i], end[i]), owner being the index i of the range"""
+    lengths = end - begin
+    owners = np.repeat(np.arange(begin.shape[0]), lengths)
+    range_starts = np.cumsum(lengths) - lengths
+    positions = begin[owners] + np.arange(owners.shape[0]) - range_starts[owners]
+    return owners, positions
+
+
+class Spatial_Grid:
+    """
+    Grid of square cells of size cell_size over a set of points. A query scans ceil(distance / cell_size) cells in
+    every direction, so cell_size should be about the query distance.
+    """
+
+    def __init__(self, points, cell_size):
+        """
+        :param points: positions of the agents as an array of shape (N, 2)
+        :param cell_size: side of the grid cells in pixels
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+        n_points = self.points.shape[0]
+
+        cells = np.floor(self.points / self.cell_size).astype(np.int64)
+        self.origin = cells.min(axis=0) if n_points else np.zeros(2, dtype=np.int64)
+        cells -= self.origin
+        self.shape = cells.max(axis=0) + 1 if n_points else np.ones(2, dtype=np.int64)
+
+        # points sorted by cell, the cells of one grid column are contiguous
+        cell_index = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.order = np.argsort(cell_index, kind="stable")
+        self.cell_start = np.zeros(self.shape[0] * self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_index, minlength=self.shape[0] * self.shape[1]), out=self.cell_start[1:])
+
+    def query_points(self, query_points, distance):
+        """
+        Points of the grid within distance of every query point
+
+        :param query_points: positions as an array of shape (M, 2)
+        :param distance: query radius in pixels (inclusive)
+        :return indptr, indices: CSR adjacency from the M query points to the grid points, indices in increasing order
+        """
+        query_points = np.asarray(query_points, dtype=np.float64).reshape(-1, 2)
+        n_queries = query_points.shape[0]
+        reach = int(np.ceil(distance / self.cell_size))
+        cells = np.floor(query_points / self.cell_size).astype(np.int64) - self.origin
+        n_columns, n_rows = self.shape
+        row_low = np.clip(cells[:, 1] - reach, 0, n_rows - 1)
+        row_high = np.clip(cells[:, 1] + reach, 0, n_rows - 1)
+        has_rows = (cells[:, 1] + reach >= 0) & (cells[:, 1] - reach <= n_rows - 1)
+
+        sources = []
+        targets = []
+        for column_offset in range(-reach, reach + 1):
+            # one contiguous run of sorted points per grid column
+            column = cells[:, 0] + column_offset
+            is_valid = has_rows & (column >= 0) & (column < n_columns)
+            column = np.clip(column, 0, n_columns - 1)
+            begin = np.where(is_valid, self.cell_start[column * n_rows + row_low], 0)
+            end = np.where(is_valid, self.cell_start[column * n_rows + row_high + 1], 0)
+            owners, positions = expand_ranges(begin, end)
+            sources.append(owners)
+            targets.append(self.order[positions])
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+
+        d_x = query_points[sources, 0] - self.points[targets, 0]
+        d_y = query_points[sources, 1] - self.points[targets, 1]
+        is_close = np.sqrt(d_x ** 2 + d_y ** 2) <= distance
+        sources = sources[is_close]
+        targets = targets[is_close]
+        order = np.lexsort((targets, sources))
+        indptr = np.zeros(n_queries + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n_queries), out=indptr[1:])
+        return indptr, targets[order]
+
+    def query_pairs(self, distance):
+        """
+        Other points of the grid within distance of every grid point
+
+        :return indptr, indices: CSR adjacency of the grid points, without self links, indices in increasing order
+        """
+        indptr, indices = self.query_points(self.points, distance)
+        sources = np.repeat(np.arange(indptr.shape[0] - 1), np.diff(indptr))
+        is_other = indices != sources
+        other_indptr = np.zeros_like(indptr)
+        np.cumsum(np.bincount(sources[is_other], minlength=indptr.shape[0] - 1), out=other_indptr[1:])
+        return other_indptr, indices[is_other]
+
+    def query(self, x, y, distance):
+        """Indices of the grid points within distance of (x, y), in increasing order"""
+        return self.query_points([(x, y)], distance)[1]
+
+
+def find_close_points(query_points, points, distance):
+    """
+    Points within distance of every query point, from a spatial grid or from all the pairs for few points
+
+    :param query_points: positions as an array of shape (M, 2)
+    :param points: positions as an array of shape (N, 2)
+    :param distance: query radius in pixels (inclusive)
+    :return indptr, indices: CSR adjacency from the M query points to the N points, indices in increasing order
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if points.shape[0] >= MIN_GRID_POINTS:
+        return Spatial_Grid(points, distance).query_points(query_points, distance)
+    query_points = np.asarray(query_points, dtype=np.float64).reshape(-1, 2)
+    d_x = query_points[:, 0][:, None] - points[:, 0][None, :]
+    d_y = query_points[:, 1][:, None] - points[:, 1][None, :]
+    sources, targets = np.nonzero(np.sqrt(d_x ** 2 + d_y ** 2) <= distance)
+    indptr = np.zeros(query_points.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=query_points.shape[0]), out=indptr[1:])
+    return indptr, targets
+
+
+def find_close_pairs(points, distance):
+    """
+    Other points within distance of every point
+
+    :return indptr, indices: CSR adjacency of the points, without self links, indices in increasing order
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if points.shape[0] >= MIN_GRID_POINTS:
+        return Spatial_Grid(points, distance).query_pairs(distance)
+    indptr, indices = find_close_points(points, points, distance)
+    sources = np.repeat(np.arange(points.shape[0]), np.diff(indptr))
+    is_other = indices != sources
+    other_indptr = np.zeros_like(indptr)
+    np.cumsum(np.bincount(sources[is_other], minlength=points.shape[0]), out=other_indptr[1:])
+    return other_indptr, indices[is_other]
@@ -0,0 +1,66 @@
+"""
+stall_detector.py : online detection of the runs which make no progress towards penning the herd. Loop_Function checks
+            the herd every check_interval ticks: the run progresses when fewer sheep are moving than at the last
+            progress, or when the centroid of the moving sheep came closer to the target by distance_tolerance. A run
+            without progress for a whole window is stopped and saved as "stalled" in its summary, with the state of the
+            herd at its last progress and the shepherd mode switches since then.
+"""
+import numpy as np
+
+
+class Stall_Detector:
+    def __init__(self, window, check_interval=100, distance_tolerance=10.0):
+        """
+        :param window: ticks without progress after which the run is stalled
+        :param check_interval: ticks between two checks of the herd
+        :param distance_tolerance: distance in pixels the herd has to come closer to the target to progress
+        """
+        self.window = window
+        self.check_interval = check_interval
+        self.distance_tolerance = distance_tolerance
+        # herd at the last progress
+        self.progress_tick = 0
+        self.n_moving = None
+        self.distance = None
+        # oscillation of the shepherd modes since the last progress
+        self.n_mode_switches = 0
+        self.shepherd_modes = None
+
+    def record_modes(self, shepherd_modes):
+        """Counting the shepherds which switched between collect and drive mode at this tick"""
+        if self.shepherd_modes is not None:
+            self.n_mode_switches += sum(mode != last_mode for mode, last_mode in zip(shepherd_modes,
+                                                                                     self.shepherd_modes))
+        self.shepherd_modes = shepherd_modes
+
+    def is_due(self, tick):
+        return tick % self.check_interval == 0
+
+    def check(self, tick, n_moving, distance):
+        """
+        Updating the progress of the herd with its state at tick
+
+        :param n_moving: number of moving sheep
+        :param distance: distance of the centroid of the moving sheep to the target
+        :return: True if the run has stalled
+        """
+        if self.n_moving is None or n_moving < self.n_moving or distance < self.distance - self.distance_tolerance:
+            self.progress_tick = tick
+            self.n_moving = n_moving
+            self.distance = distance
+            self.n_mode_switches = 0
+        return tick - self.progress_tick >= self.window
+
+    def get_summary(self):
+        """State of the herd at its last progress, saved in the summary of a stalled run"""
+        return {"progress_tick": self.progress_tick,
+                "moving_sheep": self.n_moving,
+                "distance": float(self.distance) if self.distance is not None else None,
+                "mode_switches": self.n_mode_switches}
+
+
+def calculate_herd_distance(x, y, is_moving, target_x, target_y):
+    """Distance of the centroid of the moving sheep to the target, 0 when no sheep is moving"""
+    if not np.any(is_moving):
+        return 0.0
+    return float(np.hypot(np.mean(x[is_moving]) - target_x, np.mean(y[is_moving]) - target_y))
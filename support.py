@@ -2,9 +2,7 @@
 calc.py : Supplementary methods and calculations necessary for agents
 """
 import numpy as np
-import matplotlib.cm
 import math
-from scipy import integrate
 # from share.doc.pycurl.examples.retriever import filename
 import os, json
 
@@ -99,6 +97,7 @@ def distance_infinite(p1, p2, L=500, dim=2):
 def calculate_color(orientation, velocity, max_velocity=1):
     """Calculates an RGB color from the colormap according to orientation and velocity. Color will be calculated from
     orientation while transparency from the absolute velocity compared to the max velocity."""
+    import matplotlib.cm  # only needed for coloring agents in visualized runs
     cmap = matplotlib.cm.get_cmap('Spectral')
     rgba = np.array(cmap(orientation / (2 * np.pi)))
     # setting transparency according to vel
@@ -188,6 +187,19 @@ def reflect_angle(angle):  # [0, 2pi]
     return angle
 
 
+def transform_angle_array(theta):  # [-pi, pi]
+    """vectorized transform_angle for an array of angles"""
+    theta = np.asarray(theta, dtype=np.float64)
+    return theta - 2 * np.pi * np.floor((theta + np.pi) / (2 * np.pi))
+
+
+def reflect_angle_array(angle):  # [0, 2pi]
+    """vectorized reflect_angle for an array of angles"""
+    angle = np.asarray(angle, dtype=np.float64)
+    angle = angle - 2 * np.pi * np.floor(angle / (2 * np.pi))
+    return np.where(angle >= 2 * np.pi, angle - 2 * np.pi, angle)
+
+
 def Get_relative_distance_angle(vector_head_x, vector_head_y, vector_end_x, vector_end_y):
     r_x = vector_head_x - vector_end_x
     r_y = vector_head_y - vector_end_y
@@ -0,0 +1,236 @@
+"""
+sweep_runner.py : runs the parameter sweeps of run_phase.sh, run_basic.sh, run_anta.sh and run_explicit.sh on a bounded
+            pool of worker processes instead of launching every job at once with nohup. Every run keeps the layout of
+            the shell scripts (OUTPUT_DIR=<output folder>, output.txt with the output of the main script), runs
+            already completed are skipped, and the progress, throughput and failed runs are reported.
+
+    python sweep_runner.py phase --base_output /mnt/DATA/yating/results_phase_diagram --workers 16
+
+    The environment is passed to the runs, DATA_FORMAT=columnar saves the columnar data instead of the json files.
+
+    The runs are checkpointed every --checkpoint_interval ticks (1000 by default, 0: never), and an interrupted run is
+    resumed from its checkpoint the next time the sweep runs.
+
+    With --seed every run gets its own seed derived from the seed of the sweep and is keyed by the hash of its script,
+    arguments and seed (result_cache). A run already finished under the same key is taken from the output folder or
+    from the cache folder instead of being run again:
+
+    python sweep_runner.py phase --base_output /mnt/DATA/yating/results_phase_diagram --seed 1 --cache_folder run_cache
+"""
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from checkpoint import CHECKPOINT_FILE
+from result_cache import Result_Cache, clear_outputs, derive_seed, get_run_key, read_run_key, write_run_key
+from results_catalog import read_summary
+
+# numpy/scipy must not start their own thread pools inside the workers
+SINGLE_THREAD_ENV = {"OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1",
+                     "NUMEXPR_NUM_THREADS": "1", "NUMBA_NUM_THREADS": "1"}
+CHECKPOINT_INTERVAL = 1000  # ticks between the checkpoints of the runs, so that interrupted sweeps are resumed
+
+
+def phase_job(base_output, n_shepherd, n_sheep, iterations, coll_angle, drive_angle, repetition):
+    """Job of one run of the phase diagram: (script, arguments, output folder)"""
+    output_folder = os.path.join(base_output, f"N_shepherd_{n_shepherd}", f"N_sheep_{n_sheep}",
+                                 f"coll_{coll_angle}", f"drive_{drive_angle}", f"rep_{repetition}")
+    arguments = [n_shepherd, n_sheep, iterations, repetition, coll_angle, drive_angle]
+    return "main_phase.py", arguments, output_folder
+
+
+def phase_jobs(base_output, iterations):
+    """Jobs of run_phase.sh: (script, arguments, output folder)"""
+    n_shepherd = 1
+    n_sheep = 100
+    jobs = []
+    for coll_angle in range(30, 121, 10):
+        for drive_angle in range(0, 91, 10):
+            for repetition in range(1, 4):
+                jobs.append(phase_job(base_output, n_shepherd, n_sheep, iterations, coll_angle, drive_angle,
+                                      repetition))
+    return jobs
+
+
+def basic_jobs(base_output, iterations):
+    """Jobs of run_basic.sh: (script, arguments, output folder)"""
+    jobs = []
+    for L3 in range(50, 152, 100):
+        for n_shepherd in range(1, 6):
+            for n_sheep in range(50, 201, 50):
+                for repetition in range(1, 6):
+                    output_folder = os.path.join(base_output, f"L3_{L3}", f"N_shepherd_{n_shepherd}",
+                                                 f"N_sheep_{n_sheep}", f"rep_{repetition}")
+                    arguments = [n_sheep, n_shepherd, iterations, L3, repetition]
+                    jobs.append(("main_basic.py", arguments, output_folder))
+    return jobs
+
+
+def anta_jobs(base_output, iterations):
+    """Jobs of run_anta.sh: (script, arguments, output folder)"""
+    jobs = []
+    for index in range(0, 41, 10):
+        alpha = f"{index * 3.14 / 180:.3f}"
+        for n_shepherd in range(1, 6):
+            for n_sheep in range(120, 162, 40):
+                for repetition in range(1, 11):
+                    output_folder = os.path.join(base_output, f"Alpha_{alpha}", f"N_shepherd_{n_shepherd}",
+                                                 f"N_sheep_{n_sheep}", f"rep_{repetition}")
+                    arguments = [n_sheep, n_shepherd, iterations, alpha, repetition]
+                    jobs.append(("main_anta.py", arguments, output_folder))
+    return jobs
+
+
+def explicit_jobs(base_output, iterations):
+    """Jobs of run_explicit.sh: (script, arguments, output folder)"""
+    jobs = []
+    for L3 in range(0, 102, 100):
+        for n_shepherd in range(1, 2):
+            for n_sheep in range(50, 201, 50):
+                for repetition in range(6, 11):
+                    output_folder = os.path.join(base_output, f"L3_{L3}", f"N_shepherd_{n_shepherd}",
+                                                 f"N_sheep_{n_sheep}", f"rep_{repetition}")
+                    arguments = [n_sheep, n_shepherd, iterations, L3, repetition]
+                    jobs.append(("main_explicit.py", arguments, output_folder))
+    return jobs
+
+
+SWEEPS = {"phase": phase_jobs, "basic": basic_jobs, "anta": anta_jobs, "explicit": explicit_jobs}
+
+
+def is_completed(output_folder, run_key=None):
+    """
+    A keyed run is completed when its output folder holds the same key. An unkeyed run is completed when it wrote its
+    summary, or for runs saved without summary when it printed the final tick. A summary calculated from the
+    trajectories of a run which never printed its final tick (no wall time) does not complete it.
+    """
+    if run_key is not None:
+        return read_run_key(output_folder) == run_key[0]
+    summary = read_summary(output_folder)
+    if summary is not None and summary.get("status") != "incomplete" and summary.get("wall_time") is not None:
+        return True
+    output_file = os.path.join(output_folder, "output.txt")
+    if not os.path.isfile(output_file):
+        return False
+    with open(output_file) as f:
+        return any(line.startswith("Final tick:") for line in f)
+
+
+def get_script_path(script):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+
+
+def seed_job(job, base_seed):
+    """Job with the --seed argument of its run"""
+    script, arguments, output_folder = job
+    return script, list(arguments) + ["--seed", derive_seed(base_seed, script, arguments)], output_folder
+
+
+def run_job(script, arguments, output_folder, run_key=None, cache=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Running one job like the shell scripts: python <script> <arguments> > <output folder>/output.txt, or resuming it
+    with --resume when it was interrupted after a checkpoint
+
+    :param run_key: (key, description) of a seeded run, saved in the output folder once the run is finished
+    :param cache: Result_Cache storing the finished keyed runs
+    :param checkpoint_interval: ticks between the checkpoints of the run, no checkpoints if 0 or None
+    :return: return code of the main script
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    # an interrupted run with a checkpoint is resumed from it, the outputs of any other run are removed
+    is_resuming = os.path.isfile(os.path.join(output_folder, CHECKPOINT_FILE))
+    if not is_resuming:
+        clear_outputs(output_folder)
+
+    # machine specific settings of the shell scripts (e.g. LD_LIBRARY_PATH) are inherited from the environment
+    env = dict(os.environ, OUTPUT_DIR=output_folder, **SINGLE_THREAD_ENV)
+    command = [sys.executable, get_script_path(script)] + [str(argument) for argument in arguments]
+    if checkpoint_interval:
+        command += ["--checkpoint_interval", str(checkpoint_interval)]
+    if is_resuming:
+        command.append("--resume")
+    with open(os.path.join(output_folder, "output.txt"), "a" if is_resuming else "w") as output_file:
+        completed = subprocess.run(command, stdout=output_file, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                   env=env)
+    if completed.returncode == 0 and run_key is not None:
+        write_run_key(output_folder, *run_key)
+        if cache is not None:
+            cache.store(run_key[0], output_folder)
+    return completed.returncode
+
+
+def run_sweep(jobs, workers, is_dry_run=False, seed=None, cache=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Running the jobs which are not completed yet on a pool of workers
+
+    :param seed: seed of the sweep, every run is then seeded and keyed (see result_cache); unseeded runs if None
+    :param cache: Result_Cache of the keyed runs, the runs found in it are linked into their output folders
+    :param checkpoint_interval: ticks between the checkpoints of every run, no checkpoints if 0 or None
+    :return: output folders of the failed jobs
+    """
+    if seed is not None:
+        jobs = [seed_job(job, seed) for job in jobs]
+    run_keys = {job[2]: get_run_key(get_script_path(job[0]), job[1]) if seed is not None else None for job in jobs}
+    pending_jobs = [job for job in jobs if not is_completed(job[2], run_keys[job[2]])]
+    cached_jobs = [job for job in pending_jobs
+                   if cache is not None and run_keys[job[2]] is not None and cache.contains(run_keys[job[2]][0])]
+    cached_folders = {output_folder for _, _, output_folder in cached_jobs}
+    pending_jobs = [job for job in pending_jobs if job[2] not in cached_folders]
+    print(f"Total jobs: {len(jobs)}, completed: {len(jobs) - len(pending_jobs) - len(cached_jobs)}, "
+          f"cached: {len(cached_jobs)}, to run: {len(pending_jobs)}, workers: {workers}")
+    if is_dry_run:
+        for script, arguments, output_folder in pending_jobs:
+            print("python", script, *arguments, "->", output_folder)
+        return []
+
+    for script, arguments, output_folder in cached_jobs:
+        cache.restore(run_keys[output_folder][0], output_folder)
+
+    failed_folders = []
+    start_time = datetime.now()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, *job, run_keys[job[2]], cache, checkpoint_interval): job for job in pending_jobs}
+        for n_done, future in enumerate(as_completed(futures), 1):
+            script, arguments, output_folder = futures[future]
+            try:
+                return_code = future.result()
+            except OSError as error:
+                return_code = error
+            if return_code != 0:
+                failed_folders.append(output_folder)
+            elapsed = (datetime.now() - start_time).total_seconds()
+            runs_per_hour = n_done / elapsed * 3600
+            remaining = (len(pending_jobs) - n_done) / runs_per_hour if runs_per_hour > 0 else 0.0
+            status = "ok" if return_code == 0 else f"FAILED ({return_code})"
+            print(f"[{n_done}/{len(pending_jobs)}] {status} {script} {' '.join(map(str, arguments))} | "
+                  f"{runs_per_hour:.1f} runs/h, remaining {remaining:.2f} h", flush=True)
+
+    print(f"Finished {len(pending_jobs) - len(failed_folders)}/{len(pending_jobs)} runs in "
+          f"{(datetime.now() - start_time).total_seconds():.1f} s")
+    for output_folder in failed_folders:
+        print("Failed:", output_folder)
+    return failed_folders
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sweep", choices=sorted(SWEEPS))
+    parser.add_argument("--base_output", default="results")
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--dry_run", action="store_true")  # only list the jobs to run
+    parser.add_argument("--seed", type=int, default=None)  # seed of the sweep, keys the runs for the cache
+    parser.add_argument("--cache_folder", default="run_cache")  # result cache of the seeded runs
+    parser.add_argument("--stall_window", type=int, default=0)  # stopping runs without progress, see stall_detector
+    parser.add_argument("--checkpoint_interval", type=int, default=CHECKPOINT_INTERVAL)  # ticks, 0: no checkpoints
+    args = parser.parse_args()
+    cache = Result_Cache(args.cache_folder) if args.seed is not None else None
+    jobs = SWEEPS[args.sweep](args.base_output, args.iterations)
+    if args.stall_window:
+        jobs = [(script, arguments + ["--stall_window", args.stall_window], output_folder)
+                for script, arguments, output_folder in jobs]
+    failed = run_sweep(jobs, args.workers, args.dry_run, args.seed, cache, args.checkpoint_interval)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,138 @@
+"""
+tick_profiler.py : time of the phases of every tick of Loop_Function.start (event handling, collisions, robot I/O, the
+            sheep update split into network, field of view, forces and integration, shepherd update, data saving and
+            rendering). The rolling means of the phases are printed every report_interval ticks and the report of the
+            whole run (total, share of the tick, mean and percentiles per phase) at the end, also saved as profile.json
+            in the output folder. Without a profiler the loop only checks that it has none.
+
+            The ticks of a trace window are also recorded span by span in the Trace Event Format and saved as
+            trace.json, opened with chrome://tracing or https://ui.perfetto.dev: one span per tick, per phase, per
+            agent updated by a sprite and per write of the trajectory files, with the state of every agent before and
+            after its update.
+"""
+import json
+import os
+import threading
+from timeit import default_timer as timer
+
+import numpy as np
+
+PROFILE_FILE = "profile.json"
+TRACE_FILE = "trace.json"
+PERCENTILES = (50, 95, 99)
+
+
+class Tick_Profiler:
+    def __init__(self, report_interval=1000, window=1000, trace_ticks=None):
+        """
+        :param report_interval: ticks between two prints of the rolling means, never printed if None
+        :param window: ticks of the rolling means
+        :param trace_ticks: (first, last) tick of the trace window, no trace if None
+        """
+        self.report_interval = report_interval
+        self.window = window
+        self.phase_times = {}  # seconds of every tick by phase, in the order the phases first appear
+        self.tick_times = {}  # seconds of the phases in the current tick
+        self.n_ticks = 0
+        self.tick = None
+        self.tick_start_time = None
+        # spans of the trace window
+        self.trace_ticks = trace_ticks
+        self.is_tracing = False
+        self.trace_events = []
+        self.thread_names = {}
+
+    def clock(self):
+        return timer()
+
+    def start_tick(self, tick):
+        self.tick = tick
+        self.is_tracing = self.trace_ticks is not None and self.trace_ticks[0] <= tick <= self.trace_ticks[1]
+        self.tick_start_time = timer()
+        return self.tick_start_time
+
+    def stop(self, phase, start_time):
+        """
+        Adding the time since start_time to phase in the current tick
+
+        :return: the current time, the start of the next phase
+        """
+        now = timer()
+        self.tick_times[phase] = self.tick_times.get(phase, 0.0) + now - start_time
+        if self.is_tracing:
+            self.add_span(phase, "phase", start_time, now)
+        return now
+
+    def trace(self, name, start_time, category="agent", args=None):
+        """
+        Adding a span from start_time to now to the trace, called only while is_tracing
+
+        :return: the current time, the start of the next span
+        """
+        now = timer()
+        self.add_span(name, category, start_time, now, args)
+        return now
+
+    def add_span(self, name, category, start_time, end_time, args=None):
+        # spans can be added by the writing threads of the trajectory files, appending to a list is thread safe
+        thread = threading.current_thread()
+        self.thread_names.setdefault(thread.ident, thread.name)
+        self.trace_events.append({"name": name, "cat": category, "ph": "X", "ts": start_time * 1e6,
+                                  "dur": (end_time - start_time) * 1e6, "pid": os.getpid(), "tid": thread.ident,
+                                  "args": args or {}})
+
+    def end_tick(self, tick):
+        now = timer()
+        self.tick_times["tick"] = now - self.tick_start_time
+        if self.is_tracing:
+            self.add_span(f"tick {self.tick}", "tick", self.tick_start_time, now)
+        for phase, seconds in self.tick_times.items():
+            if phase not in self.phase_times:
+                self.phase_times[phase] = [0.0] * self.n_ticks
+            self.phase_times[phase].append(seconds)
+        for phase, times in self.phase_times.items():
+            if phase not in self.tick_times:
+                times.append(0.0)
+        self.tick_times = {}
+        self.n_ticks += 1
+        if self.report_interval and tick % self.report_interval == 0:
+            tick_p95 = np.percentile(self.phase_times["tick"][-self.window:], 95) * 1000
+            print(f"t={tick} " + " ".join(f"{phase}={np.mean(times[-self.window:]) * 1000:.3f}ms"
+                                          for phase, times in self.phase_times.items()) +
+                  f" tick_p95={tick_p95:.3f}ms", flush=True)
+
+    def get_report(self):
+        """Statistics of every phase over the whole run: total in seconds, mean and percentiles in milliseconds"""
+        total_time = sum(self.phase_times.get("tick", [])) or 1.0
+        report = {}
+        for phase, times in self.phase_times.items():
+            times = np.array(times)
+            report[phase] = {"total": float(np.sum(times)),
+                             "share": float(np.sum(times)) / total_time,
+                             "mean": float(np.mean(times)) * 1000,
+                             **{f"p{percentile}": float(np.percentile(times, percentile)) * 1000
+                                for percentile in PERCENTILES}}
+        return report
+
+    def print_report(self):
+        report = self.get_report()
+        print(f"Profile of {self.n_ticks} ticks (ms per tick)")
+        print(f"{'phase':<12}{'total s':>10}{'share':>8}{'mean':>10}" +
+              "".join(f"{'p' + str(percentile):>10}" for percentile in PERCENTILES))
+        for phase, statistics in report.items():
+            print(f"{phase:<12}{statistics['total']:>10.3f}{statistics['share']:>8.1%}{statistics['mean']:>10.4f}" +
+                  "".join(f"{statistics[f'p{percentile}']:>10.4f}" for percentile in PERCENTILES))
+
+    def save_report(self, output_folder):
+        os.makedirs(output_folder, exist_ok=True)
+        with open(os.path.join(output_folder, PROFILE_FILE), "w") as f:
+            json.dump({"n_ticks": self.n_ticks, "phases": self.get_report()}, f, indent=1)
+
+    def save_trace(self, output_folder):
+        """Writing the spans of the trace window to trace.json in the Trace Event Format"""
+        os.makedirs(output_folder, exist_ok=True)
+        metadata = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "Loop_Function"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": name}}
+                     for thread_id, name in self.thread_names.items()]
+        with open(os.path.join(output_folder, TRACE_FILE), "w") as f:
+            json.dump({"traceEvents": metadata + self.trace_events, "displayTimeUnit": "ms"}, f)
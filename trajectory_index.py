@@ -0,0 +1,98 @@
+"""
+trajectory_index.py : sidecar index of the json trajectory files, mapping every tick to the byte offset of its line so
+            that a range of ticks can be read by seeking directly to it. The index of sheep_data.json is
+            sheep_data.json.idx, a raw little-endian int64 array of shape (lines, 2) with the tick and the offset of
+            every complete line. It is written by the trajectory writer along with the json file, and built or brought
+            up to date for existing files by update_index:
+
+    python trajectory_index.py /mnt/DATA/yating/results_phase_diagram
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+
+INDEX_SUFFIX = ".idx"
+INDEX_DTYPE = np.dtype("<i8")
+TICK_PATTERN = re.compile(rb'"tick": (-?\d+)')
+
+
+def get_index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+def read_index(file_path):
+    """(tick, offset) rows of the index of a json trajectory file as it is saved, None if there is no index"""
+    index_path = get_index_path(file_path)
+    if not os.path.isfile(index_path):
+        return None
+    index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+    # a row can be half written when the run was killed
+    return index[:index.shape[0] // 2 * 2].reshape(-1, 2)
+
+
+def scan_lines(f, offset):
+    """(tick, offset) of the complete lines of a json trajectory file from offset on, a cut last line is left out"""
+    f.seek(offset)
+    rows = []
+    for line in f:
+        if line.endswith(b"]\n"):
+            tick = TICK_PATTERN.search(line, 0, 64)
+            if tick is not None:
+                rows.append((int(tick.group(1)), offset))
+        offset += len(line)
+    return np.array(rows, dtype=INDEX_DTYPE).reshape(-1, 2)
+
+
+def is_line_of_tick(f, offset, tick):
+    f.seek(offset)
+    return f.read(64).startswith(b'[{"tick": %d,' % int(tick))
+
+
+def update_index(file_path):
+    """
+    Index of a json trajectory file, built if there is none and extended with the lines appended since it was written.
+    An index not matching the file (the file was rewritten) is built again.
+
+    :return: (tick, offset) rows of all the complete lines as an array of shape (lines, 2)
+    """
+    index = read_index(file_path)
+    with open(file_path, "rb") as f:
+        file_size = f.seek(0, os.SEEK_END)
+        is_valid = index is not None and (not index.shape[0] or (
+                index[-1, 1] < file_size and is_line_of_tick(f, index[-1, 1], index[-1, 0])))
+        if is_valid and index.shape[0]:
+            # the new lines start after the last indexed line
+            f.seek(index[-1, 1])
+            f.readline()
+            new_rows = scan_lines(f, f.tell())
+        else:
+            index = np.zeros((0, 2), dtype=INDEX_DTYPE)
+            new_rows = scan_lines(f, 0)
+    if new_rows.shape[0] or not is_valid:
+        index = np.concatenate([index, new_rows])
+        # replaced at once, the index of a finished run can be a hard link into the result cache
+        index_path = get_index_path(file_path)
+        index.tofile(index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+    return index
+
+
+def index_results(base_folder):
+    """Indexing all the json trajectory files below base_folder"""
+    n_files = 0
+    for folder_path, _, file_names in os.walk(base_folder):
+        for file_name in ("sheep_data.json", "shepherd_data.json"):
+            if file_name in file_names:
+                update_index(os.path.join(folder_path, file_name))
+                n_files += 1
+    return n_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_folders", nargs="+")
+    args = parser.parse_args()
+    for base_folder in args.base_folders:
+        print(f"{index_results(base_folder)} trajectory files indexed in {base_folder}")
@@ -0,0 +1,329 @@
+"""
+trajectory_reader.py : reads the trajectories saved by the loop function, the only reader of sheep_data / shepherd_data
+            for the analysis scripts. The columnar format (sheep_data/, shepherd_data/ folders) is memory-mapped, the
+            json files (sheep_data.json, shepherd_data.json) are read one line at a time, extracting only the columns
+            asked for. Both are streamed as numpy arrays per tick or per block of ticks, so the reductions (last tick,
+            coordination, means of the agents) run in constant memory.
+
+    for tick, columns in iterate_ticks("results/rep_1", "shepherd", ["MODE"]):
+        ...
+    trajectory = load_trajectory("results/rep_1", "shepherd")
+    trajectory.final_tick, trajectory["MODE"][:, 0]
+    snapshots = load_ticks("results/rep_1", "sheep", start=37000, stop=38000, step=10)
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+from trajectory_index import update_index
+from trajectory_writer import SHEEP_COLUMNS, SHEPHERD_COLUMNS
+
+COLUMNS = {"sheep": SHEEP_COLUMNS, "shepherd": SHEPHERD_COLUMNS}
+# keys of the columns in the json format, when different from the column name
+JSON_KEYS = {"state": "state:"}
+# values of the columns from the strings of the json format, numbers otherwise
+JSON_VALUES = {"state": lambda values: [value == "moving" for value in values]}
+TICK_PATTERN = re.compile(r'"tick": (-?\d+)')
+
+
+class Trajectory:
+    """Saved states of one type of agents: ticks of shape (ticks,) and columns of shape (ticks, agents)"""
+
+    def __init__(self, ticks, columns, parameters=None):
+        """
+        :param ticks: tick of every saved row
+        :param columns: arrays of shape (ticks, agents) by column name
+        :param parameters: parameters of the run, only saved by the columnar format
+        """
+        self.ticks = ticks
+        self.columns = columns
+        self.parameters = parameters or {}
+
+    @property
+    def n_ticks(self):
+        return self.ticks.shape[0]
+
+    @property
+    def n_agents(self):
+        return next(iter(self.columns.values())).shape[1]
+
+    @property
+    def final_tick(self):
+        """last saved tick, the same as data[-1]["tick"] of the json files"""
+        return int(self.ticks[-1])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+
+def find_trajectory(run_folder, agent_type="sheep"):
+    """Path of the columnar folder or of the json file of agent_type ("sheep" or "shepherd") in run_folder, or None"""
+    folder_path = os.path.join(run_folder, agent_type + "_data")
+    if os.path.isfile(os.path.join(folder_path, "header.json")):
+        return folder_path
+    if os.path.isfile(folder_path + ".json"):
+        return folder_path + ".json"
+    return None
+
+
+def get_trajectory_path(run_folder, agent_type):
+    path = find_trajectory(run_folder, agent_type)
+    if path is None:
+        raise FileNotFoundError(f"No {agent_type} trajectory in {run_folder}")
+    return path
+
+
+def memory_map(file_path, dtype, shape):
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode="r", shape=shape)
+
+
+def load_columnar_trajectory(folder_path):
+    """Memory-mapped columns of a columnar trajectory folder; a killed run is read up to its last written block"""
+    with open(os.path.join(folder_path, "header.json")) as f:
+        header = json.load(f)
+    n_agents = header["n_agents"]
+    columns = {name: np.dtype(dtype) for name, dtype in header["columns"].items()}
+    ticks_path = os.path.join(folder_path, "ticks.bin")
+    # the ticks written completely in every file
+    n_ticks = os.path.getsize(ticks_path) // np.dtype("<i8").itemsize
+    for name, dtype in columns.items():
+        n_ticks = min(n_ticks, os.path.getsize(os.path.join(folder_path, name + ".bin")) // (dtype.itemsize * n_agents))
+    return Trajectory(memory_map(ticks_path, "<i8", (n_ticks,)),
+                      {name: memory_map(os.path.join(folder_path, name + ".bin"), dtype, (n_ticks, n_agents))
+                       for name, dtype in columns.items()},
+                      header["parameters"])
+
+
+def read_parameters(run_folder, agent_type="sheep"):
+    """Parameters of a run saved in the header of the columnar format, empty for the json files"""
+    path = get_trajectory_path(run_folder, agent_type)
+    if not os.path.isdir(path):
+        return {}
+    with open(os.path.join(path, "header.json")) as f:
+        return json.load(f)["parameters"]
+
+
+def compile_json_patterns(columns):
+    """Regular expression of the values of every column in a json line"""
+    return {name: re.compile('"' + re.escape(JSON_KEYS.get(name, name)) + '": "?([^,"}]+)') for name in columns}
+
+
+def parse_json_line(line, patterns, dtypes):
+    """(tick, {column: array of shape (agents,)}) of one json line, None if the line is cut"""
+    if not line.endswith("]"):
+        return None
+    tick = TICK_PATTERN.search(line)
+    if tick is None:
+        return None
+    values = {}
+    for name, pattern in patterns.items():
+        column_values = pattern.findall(line)
+        if name in JSON_VALUES:
+            values[name] = np.array(JSON_VALUES[name](column_values), dtype=dtypes[name])
+        else:
+            values[name] = np.array(column_values, dtype=np.float64).astype(dtypes[name])
+    return int(tick.group(1)), values
+
+
+def iterate_json_ticks(file_path, agent_type="sheep", columns=None):
+    """(tick, {column: array of shape (agents,)}) of every tick of a json trajectory file, one line at a time"""
+    dtypes = dict(COLUMNS[agent_type])
+    patterns = compile_json_patterns(list(dtypes) if columns is None else columns)
+    with open(file_path, encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            row = parse_json_line(line, patterns, dtypes)
+            if row is None:
+                # the last line of a killed run can be cut
+                print(f"✗ Could not parse line {line_num}: {line[:50]}...")
+                continue
+            yield row
+
+
+def iterate_ticks(run_folder, agent_type="sheep", columns=None):
+    """
+    (tick, {column: array of shape (agents,)}) of every saved tick of a run, in constant memory
+
+    :param columns: names of the columns to read (see trajectory_writer.SHEEP_COLUMNS/SHEPHERD_COLUMNS), all if None
+    """
+    path = get_trajectory_path(run_folder, agent_type)
+    if not os.path.isdir(path):
+        yield from iterate_json_ticks(path, agent_type, columns)
+        return
+    trajectory = load_columnar_trajectory(path)
+    columns = list(trajectory.columns) if columns is None else columns
+    for index, tick in enumerate(trajectory.ticks.tolist()):
+        yield tick, {name: np.asarray(trajectory[name][index]) for name in columns}
+
+
+def iterate_blocks(run_folder, agent_type="sheep", columns=None, block_ticks=4096):
+    """(ticks, {column: array of shape (ticks, agents)}) of the saved ticks of a run, at most block_ticks at once"""
+    path = get_trajectory_path(run_folder, agent_type)
+    if os.path.isdir(path):
+        trajectory = load_columnar_trajectory(path)
+        columns = list(trajectory.columns) if columns is None else columns
+        for start in range(0, trajectory.n_ticks, block_ticks):
+            yield (np.asarray(trajectory.ticks[start:start + block_ticks]),
+                   {name: np.asarray(trajectory[name][start:start + block_ticks]) for name in columns})
+        return
+    ticks = []
+    rows = []
+
+    def stack_rows():
+        return np.array(ticks, dtype="<i8"), {name: np.stack([row[name] for row in rows]) for name in rows[0]}
+
+    for tick, values in iterate_json_ticks(path, agent_type, columns):
+        ticks.append(tick)
+        rows.append(values)
+        if len(rows) == block_ticks:
+            yield stack_rows()
+            ticks = []
+            rows = []
+    if rows:
+        yield stack_rows()
+
+
+def read_json_last_row(file_path, agent_type="sheep", columns=None):
+    """Last complete row of a json trajectory file, reading only the end of the file; None if there is none"""
+    dtypes = dict(COLUMNS[agent_type])
+    patterns = compile_json_patterns(list(dtypes) if columns is None else columns)
+    with open(file_path, "rb") as f:
+        file_size = f.seek(0, os.SEEK_END)
+        chunk_size = 1 << 16
+        while True:
+            start = max(0, file_size - chunk_size)
+            f.seek(start)
+            lines = f.read(file_size - start).decode("utf-8", errors="replace").splitlines()
+            # the first line of the chunk can start in the middle of a line
+            for line in reversed(lines if start == 0 else lines[1:]):
+                row = parse_json_line(line.strip(), patterns, dtypes)
+                if row is not None:
+                    return row
+            if start == 0:
+                return None
+            chunk_size *= 4
+
+
+def read_last_row(run_folder, agent_type="sheep", columns=None):
+    """(tick, {column: array of shape (agents,)}) of the last saved tick of a run, None if nothing was saved"""
+    path = get_trajectory_path(run_folder, agent_type)
+    if not os.path.isdir(path):
+        return read_json_last_row(path, agent_type, columns)
+    trajectory = load_columnar_trajectory(path)
+    if not trajectory.n_ticks:
+        return None
+    columns = list(trajectory.columns) if columns is None else columns
+    return trajectory.final_tick, {name: np.asarray(trajectory[name][-1]) for name in columns}
+
+
+def read_last_tick(run_folder, agent_type="sheep"):
+    """Last saved tick of a run, data[-1]["tick"] of the json files; None if nothing was saved"""
+    row = read_last_row(run_folder, agent_type, columns=[])
+    return None if row is None else row[0]
+
+
+def calculate_coordination(run_folder):
+    """
+    Fraction of the ticks before the last saved tick with the shepherds in both modes (functional cooperation), the
+    division rate of plot_shepherd_states
+    """
+    last_tick = read_last_tick(run_folder, "shepherd")
+    if not last_tick or last_tick <= 0:
+        return 0.0
+    n_mixed_mode_ticks = 0
+    for ticks, columns in iterate_blocks(run_folder, "shepherd", ["MODE"]):
+        # shepherd state: 1 --> drive mode
+        n_drive = np.sum(columns["MODE"], axis=1)
+        is_mixed_mode = (n_drive != 0) & (n_drive != columns["MODE"].shape[1])
+        n_mixed_mode_ticks += int(np.count_nonzero(is_mixed_mode[ticks < last_tick]))
+    return n_mixed_mode_ticks / last_tick
+
+
+def calculate_agent_means(run_folder, agent_type, column):
+    """Mean of one column of every agent over all the saved ticks, as an array of shape (agents,)"""
+    total = None
+    n_ticks = 0
+    for ticks, columns in iterate_blocks(run_folder, agent_type, [column]):
+        block_sum = np.sum(columns[column], axis=0, dtype=np.float64)
+        total = block_sum if total is None else total + block_sum
+        n_ticks += ticks.shape[0]
+    return np.zeros(0) if total is None else total / n_ticks
+
+
+def stack_rows(ticks, rows, agent_type, columns=None):
+    """Trajectory of the (tick, values) rows parsed from a json file"""
+    dtypes = dict(COLUMNS[agent_type])
+    columns = list(dtypes) if columns is None else columns
+    return Trajectory(np.array(ticks, dtype="<i8"),
+                      {name: np.stack([row[name] for row in rows]) if rows else np.zeros((0, 0), dtype=dtypes[name])
+                       for name in columns})
+
+
+def load_json_trajectory(file_path, agent_type="sheep"):
+    """Columns of a json trajectory file, with the dtypes of the columnar format"""
+    ticks = []
+    rows = []
+    for tick, values in iterate_json_ticks(file_path, agent_type):
+        ticks.append(tick)
+        rows.append(values)
+    return stack_rows(ticks, rows, agent_type)
+
+
+def select_rows(ticks, start=None, stop=None, step=1):
+    """Rows of the saved ticks in range(start, stop, step)"""
+    is_selected = np.ones(ticks.shape[0], dtype=bool)
+    if start is not None:
+        is_selected &= ticks >= start
+    if stop is not None:
+        is_selected &= ticks < stop
+    if step != 1:
+        is_selected &= (ticks - (start or 0)) % step == 0
+    return np.flatnonzero(is_selected)
+
+
+def load_ticks(run_folder, agent_type="sheep", start=None, stop=None, step=1, columns=None):
+    """
+    Trajectory of the saved ticks in range(start, stop, step) only, reading nothing else: the json files are read by
+    seeking to the lines through their tick index (trajectory_index, built first for files without one), the columnar
+    format reads the rows from its memory maps.
+
+    :param columns: names of the columns to read, all if None
+    """
+    path = get_trajectory_path(run_folder, agent_type)
+    if os.path.isdir(path):
+        trajectory = load_columnar_trajectory(path)
+        rows = select_rows(np.asarray(trajectory.ticks), start, stop, step)
+        return Trajectory(np.asarray(trajectory.ticks[rows]),
+                          {name: np.asarray(trajectory[name][rows])
+                           for name in (trajectory.columns if columns is None else columns)},
+                          trajectory.parameters)
+    index = update_index(path)
+    dtypes = dict(COLUMNS[agent_type])
+    patterns = compile_json_patterns(list(dtypes) if columns is None else columns)
+    ticks = []
+    rows = []
+    with open(path, "rb") as f:
+        for offset in index[select_rows(index[:, 0], start, stop, step), 1].tolist():
+            f.seek(offset)
+            row = parse_json_line(f.readline().decode("utf-8").strip(), patterns, dtypes)
+            if row is not None:
+                ticks.append(row[0])
+                rows.append(row[1])
+    return stack_rows(ticks, rows, agent_type, columns)
+
+
+def load_trajectory(run_folder, agent_type="sheep"):
+    """
+    Trajectory of agent_type ("sheep" or "shepherd") saved in run_folder as whole arrays, from the columnar format if it
+    exists and from the json file otherwise
+    """
+    path = get_trajectory_path(run_folder, agent_type)
+    if os.path.isdir(path):
+        return load_columnar_trajectory(path)
+    return load_json_trajectory(path, agent_type)
@@ -0,0 +1,257 @@
+"""
+trajectory_writer.py : writes the trajectories of the agents in blocks of ticks. The state of every tick is copied into
+            preallocated arrays, and full blocks are written by a background thread to files kept open during the whole
+            run. Two formats are written:
+            - "json": sheep_data.json / shepherd_data.json, the same as written tick by tick with json.dump: one line
+              per tick with the list of the agents as dicts, and the tick -> byte offset index of every line in
+              sheep_data.json.idx / shepherd_data.json.idx (see trajectory_index).
+            - "columnar": sheep_data/ / shepherd_data/ folders with one raw little-endian file of shape (ticks, agents)
+              per column, the ticks and a header.json with the dtypes and the run parameters, read back with
+              trajectory_reader.load_trajectory.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from trajectory_index import INDEX_DTYPE, get_index_path, update_index
+
+# json.dump writes the non-finite floats differently from repr
+JSON_FLOATS = {"nan": "NaN", "inf": "Infinity", "-inf": "-Infinity"}
+
+
+def format_float(decimals):
+    """Formatter writing a value like json.dump(float("{:.<decimals>f}".format(value)))"""
+    def format_value(value):
+        text = repr(float(f"{value:.{decimals}f}"))
+        return JSON_FLOATS.get(text, text)
+    return format_value
+
+
+def format_int(value):
+    return str(int(value))
+
+
+def format_sheep_state(is_moving):
+    return '"moving"' if is_moving else '"staying"'
+
+
+# columns written after "tick" and "ID": (key, dtype of the buffer, formatter)
+SHEEP_FIELDS = (("x", np.float64, format_float(2)),
+                ("y", np.float64, format_float(2)),
+                ("heading_direction", np.float64, format_float(2)),
+                ("state:", np.bool_, format_sheep_state))
+SHEPHERD_FIELDS = (("x", np.float64, format_float(2)),
+                   ("y", np.float64, format_float(2)),
+                   ("heading_direction", np.float64, format_float(2)),
+                   ("approach_sheep_id", np.int64, format_int),
+                   ("MODE", np.float64, format_float(2)),
+                   ("Coll_threshold", np.float64, format_float(4)),
+                   ("Drive_threshold", np.float64, format_float(4)))
+
+# columns of the columnar format: (name, stored dtype), given to add_tick in the same order as the json fields
+SHEEP_COLUMNS = (("x", "<f4"), ("y", "<f4"), ("heading_direction", "<f4"),
+                 ("state", "i1"))  # state code: 1 moving, 0 staying
+SHEPHERD_COLUMNS = (("x", "<f4"), ("y", "<f4"), ("heading_direction", "<f4"), ("approach_sheep_id", "<i4"),
+                    ("MODE", "i1"),  # 1 drive, 0 collect
+                    ("Coll_threshold", "<f4"), ("Drive_threshold", "<f4"))
+
+
+class Trajectory_Writer:
+    """
+    Appends one line per tick to a json trajectory file. Full blocks of block_ticks ticks are formatted and written by
+    a background thread, and the simulation waits for the write of a block to end before it fills the next one, so a
+    killed run loses at most the ticks of the block being filled. An error of the writing thread is raised by the
+    next add_tick, sync or close.
+    """
+
+    def __init__(self, file_path, n_agents, fields, block_ticks=100):
+        """
+        :param file_path: trajectory file, opened in append mode
+        :param n_agents: number of agents written every tick, agent i is written with the ID "i"
+        :param fields: (key, dtype, formatter) of the columns of every agent after "tick" and "ID"
+        :param block_ticks: number of ticks buffered before they are written
+        """
+        self.fields = fields
+        self.block_ticks = block_ticks
+        self.is_closed = False
+        self.name = os.path.basename(file_path)
+        self.profiler = None  # Tick_Profiler tracing the writes of the blocks
+        self.open_files(file_path, n_agents)
+        self.error = None
+
+        self.free_blocks = queue.Queue()
+        for _ in range(2):
+            self.free_blocks.put({"tick": np.zeros(block_ticks, dtype="<i8"),
+                                  **{key: np.zeros((block_ticks, n_agents), dtype=dtype) for key, dtype, _ in fields}})
+        self.full_blocks = queue.Queue()
+        self.block = self.free_blocks.get()
+        self.n_ticks = 0
+
+        self.thread = threading.Thread(target=self.write_blocks, daemon=True)
+        self.thread.start()
+        # the buffered ticks are still written if the run stops with an exception
+        atexit.register(self.close)
+
+    def add_tick(self, tick, *columns):
+        """
+        Buffering the state of all the agents at one tick
+
+        :param columns: one array of shape (n_agents,) per field, in the order of fields
+        """
+        if self.error is not None:
+            raise self.error
+        self.block["tick"][self.n_ticks] = tick
+        for (key, _, _), column in zip(self.fields, columns):
+            self.block[key][self.n_ticks] = column
+        self.n_ticks += 1
+        if self.n_ticks == self.block_ticks:
+            self.flush_block()
+
+    def flush_block(self):
+        """Handing the buffered ticks to the writing thread and waiting until they are in the files"""
+        self.full_blocks.put((self.block, self.n_ticks))
+        # the next block is only filled once this one is written, so a kill never loses more than one block
+        self.full_blocks.join()
+        self.block = self.free_blocks.get()
+        self.n_ticks = 0
+
+    def sync(self):
+        """Writing the buffered ticks and waiting for the writing thread, so that the files hold every added tick"""
+        if self.n_ticks:
+            self.flush_block()
+        self.full_blocks.join()
+        if self.error is not None:
+            raise self.error
+
+    def get_file_sizes(self):
+        """Sizes of the written files by path, the files hold every added tick after sync"""
+        return {self.file.name: self.offset, self.index_file.name: self.index_file.tell()}
+
+    def open_files(self, file_path, n_agents):
+        if os.path.isfile(file_path):
+            # the lines already in the file are indexed first, the new ones as they are written
+            update_index(file_path)
+            self.index_file = open(get_index_path(file_path), "ab")
+        else:
+            self.index_file = open(get_index_path(file_path), "wb")
+        self.file = open(file_path, "a")
+        self.offset = os.path.getsize(file_path)
+
+    def close_files(self):
+        self.file.close()
+        self.index_file.close()
+
+    def write_block(self, block, n_ticks):
+        lines = self.format_block(block, n_ticks)
+        # the lines are ascii, so their lengths are their sizes in bytes
+        line_sizes = np.array([len(line) for line in lines], dtype=INDEX_DTYPE)
+        offsets = self.offset + np.cumsum(line_sizes) - line_sizes
+        self.file.write("".join(lines))
+        self.file.flush()
+        # the index is written after the lines, so it never points past the end of the file
+        self.index_file.write(np.column_stack([block["tick"][:n_ticks], offsets]).astype(INDEX_DTYPE).tobytes())
+        self.index_file.flush()
+        self.offset += int(np.sum(line_sizes))
+
+    def format_block(self, block, n_ticks):
+        """Lines of the json file of the first n_ticks ticks of a block"""
+        lines = []
+        columns = [(block[key][:n_ticks].tolist(), formatter) for key, _, formatter in self.fields]
+        keys = [key for key, _, _ in self.fields]
+        for tick_index, tick in enumerate(block["tick"][:n_ticks].tolist()):
+            values = [[formatter(value) for value in column[tick_index]] for column, formatter in columns]
+            agents = []
+            for agent_index, agent_values in enumerate(zip(*values)):
+                items = "".join(f', "{key}": {value}' for key, value in zip(keys, agent_values))
+                agents.append(f'{{"tick": {tick}, "ID": "{agent_index}"{items}}}')
+            lines.append("[" + ", ".join(agents) + "]\n")
+        return lines
+
+    def write_blocks(self):
+        """Loop of the writing thread, a None block stops it"""
+        while True:
+            item = self.full_blocks.get()
+            if item is None:
+                self.full_blocks.task_done()
+                return
+            block, n_ticks = item
+            try:
+                if self.error is None:
+                    profiler = self.profiler
+                    is_tracing = profiler is not None and profiler.is_tracing
+                    start_time = profiler.clock() if is_tracing else None
+                    self.write_block(block, n_ticks)
+                    if is_tracing:
+                        profiler.trace("write " + self.name, start_time, "io", {"ticks": n_ticks})
+            except Exception as error:
+                self.error = error
+            finally:
+                # the simulation waiting for a free block or for the writes never hangs, even after an error
+                self.free_blocks.put(block)
+                self.full_blocks.task_done()
+
+    def close(self):
+        """Writing the remaining ticks and closing the file"""
+        if self.is_closed:
+            return
+        self.is_closed = True
+        atexit.unregister(self.close)
+        if self.n_ticks:
+            self.flush_block()
+        self.full_blocks.put(None)
+        self.thread.join()
+        self.close_files()
+        if self.error is not None:
+            raise self.error
+
+
+class Columnar_Writer(Trajectory_Writer):
+    """
+    Writes a trajectory as a folder of columns: ticks.bin (int64, shape (ticks,)), one <column>.bin of shape
+    (ticks, agents) per column and header.json. Every block is appended to the column files, so the columns of a killed
+    run can still be read up to the last written block.
+    """
+
+    def __init__(self, folder_path, n_agents, columns, parameters=None, block_ticks=100, is_appending=False):
+        """
+        :param folder_path: folder of the trajectory, the files of a previous run in it are overwritten
+        :param columns: (name, dtype) of the columns
+        :param parameters: parameters of the run saved in the header
+        :param is_appending: appending to the files in the folder instead, for a resumed run
+        """
+        self.is_appending = is_appending
+        self.header = {"n_agents": n_agents, "n_ticks": None,
+                       "columns": {name: np.dtype(dtype).str for name, dtype in columns},
+                       "parameters": parameters or {}}
+        super().__init__(folder_path, n_agents, [(name, dtype, None) for name, dtype in columns], block_ticks)
+
+    def open_files(self, folder_path, n_agents):
+        self.folder_path = folder_path
+        os.makedirs(folder_path, exist_ok=True)
+        self.write_header()
+        self.files = {name: open(os.path.join(folder_path, name + ".bin"), "ab" if self.is_appending else "wb")
+                      for name in ["ticks"] + list(self.header["columns"])}
+
+    def get_file_sizes(self):
+        return {file.name: file.tell() for file in self.files.values()}
+
+    def write_header(self):
+        with open(os.path.join(self.folder_path, "header.json"), "w") as f:
+            json.dump(self.header, f, indent=1)
+
+    def write_block(self, block, n_ticks):
+        self.files["ticks"].write(block["tick"][:n_ticks].tobytes())
+        for name, _, _ in self.fields:
+            self.files[name].write(block[name][:n_ticks].tobytes())
+        for file in self.files.values():
+            file.flush()
+
+    def close_files(self):
+        self.header["n_ticks"] = self.files["ticks"].tell() // np.dtype(np.int64).itemsize
+        for file in self.files.values():
+            file.close()
+        self.write_header()